@@ -23,12 +23,30 @@ parser = argparse.ArgumentParser(
 
 parser.add_argument(
 	'-g', '--graph_file',
-	help = 'JSON file storing NLG for graph to which links will be added'
+	help = 'JSON (or binary .nlgb) file storing NLG for graph to which links will be added'
 	)
 
 parser.add_argument(
 	'-a', '--atlas_file',
-	help = 'JSON file storing NLG for atlas on which links will be computed'
+	help = 'JSON (or binary .nlgb) file storing NLG for atlas on which links will be computed'
+	)
+
+parser.add_argument(
+	'-c', '--hierarchy_file',
+	help = (
+		'NPZ file storing a contraction hierarchy of the atlas ' +
+		'(see build_hierarchy.py). If provided routes are computed on the hierarchy'
+		),
+	default = None,
+	)
+
+parser.add_argument(
+	'-k', '--cache_file',
+	help = (
+		'Binary file storing routing results by atlas node. If provided only ' +
+		'nodes not in the cache are routed and the cache file is updated'
+		),
+	default = None,
 	)
 
 parser.add_argument(
@@ -39,7 +57,16 @@ parser.add_argument(
 
 parser.add_argument(
 	'-o', '--output_file',
-	help = 'Output file for nlg .json, default is same as graph file',
+	help = 'Output file for nlg .json or .nlgb, default is same as graph file',
+	default = None
+	)
+
+parser.add_argument(
+	'-t', '--tensor_file',
+	help = (
+		'If provided adjacency for all nodes is written to this file as a dense ' +
+		'tensor (see src.tensor) and the graph file is not modified'
+		),
 	default = None
 	)
 
@@ -61,6 +88,13 @@ parser.add_argument(
 	default = "{}",
 	)
 
+parser.add_argument(
+	'-n', '--workers',
+	help = 'Number of processes used for routing, values < 1 use all cores',
+	default = 1,
+	type = int,
+	)
+
 parser.add_argument(
 	'-v', '--verbose',
 	help = 'Optional status printing',
@@ -95,23 +129,60 @@ if __name__ == "__main__":
 
 	# #Loading in node .csv files as DataFrame
 	CondPrint('Loading graph', args['verbose'])
-	graph = src.graph.graph_from_json(args['graph_file'])
+	graph = src.graph.graph_from_file(args['graph_file'])
 
 	CondPrint('Loading atlas', args['verbose'])
-	atlas = src.graph.graph_from_json(args['atlas_file'])
+	atlas = src.graph.open_graph(args['atlas_file'])
+
+	if args['hierarchy_file'] is not None:
+
+		CondPrint('Loading hierarchy', args['verbose'])
+		hierarchy = src.contraction.load_hierarchy(args['hierarchy_file'])
+
+	else:
+
+		hierarchy = None
+
+	if args['cache_file'] is not None:
+
+		CondPrint('Loading cache', args['verbose'])
+		cache = src.adjacency_cache.load_cache(args['cache_file'])
+
+	else:
+
+		cache = None
 
 	CondPrint('Computing adjacency\n', args['verbose'])
-	graph = src.adjacency.adjacency(
-		atlas, graph, args['weights'], end_color = '', depots = args['depots']
-		)
 
-	#Writing to file
-	if args['output_file'] is None:
+	if args['tensor_file'] is not None:
+
+		tensor = src.adjacency.adjacency_tensor(
+			atlas, graph, args['weights'], end_color = '', depots = args['depots'],
+			workers = args['workers'], hierarchy = hierarchy, cache = cache,
+			)
+
+		CondPrint('\nWriting to file\n', args['verbose'])
+		src.tensor.tensor_to_file(tensor, args['tensor_file'])
+
+	else:
+
+		graph = src.adjacency.adjacency(
+			atlas, graph, args['weights'], end_color = '', depots = args['depots'],
+			workers = args['workers'], hierarchy = hierarchy, cache = cache,
+			)
+
+		#Writing to file
+		if args['output_file'] is None:
+
+			args['output_file'] = args['graph_file']
+
+		CondPrint('\nWriting to file\n', args['verbose'])
+		src.graph.graph_to_file(graph, args['output_file'])
 
-		args['output_file'] = args['graph_file']
+	if cache is not None:
 
-	CondPrint('\nWriting to file\n', args['verbose'])
-	src.graph.graph_to_json(graph, args['output_file'])
+		CondPrint('Writing cache\n', args['verbose'])
+		src.adjacency_cache.cache_to_file(cache, args['cache_file'])
 
 	CondPrint(
 		f'\nDone: {time.time()-t0:.3f} seconds' +
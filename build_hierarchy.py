@@ -0,0 +1,114 @@
+import warnings
+warnings.filterwarnings("ignore")
+
+import sys
+import time
+import json
+import argparse
+
+
+import src
+from src.utilities import CondPrint
+
+str_color = '\033[1m\033[38;5;34m\033[48;5;0m'
+
+#ArgumentParser objecct configuration
+parser = argparse.ArgumentParser(
+	prog = 'module: build_hierarchy',
+	description = (
+		'Builds a contraction hierarchy for atlas for use by add_adjacency'
+		),
+	)
+
+parser.add_argument(
+	'-a', '--atlas_file',
+	help = 'JSON (or binary .nlgb) file storing NLG for atlas on which links will be computed'
+	)
+
+parser.add_argument(
+	'-o', '--output_file',
+	help = (
+		'Output file for hierarchy .npz, default is atlas file with .ch.npz extension'
+		),
+	default = None
+	)
+
+parser.add_argument(
+	'-w', '--weights',
+	help = (
+		'Dictionary off routing weights -> {edge_field: limit}.\n' +
+		'The first field is the field for which the hierarchy is built, ' +
+		'limits are ignored. Example:\n' +
+		'"{\'length\':\'300e3\', \'time\': 0}".'
+		),
+	default = "{}",
+	)
+
+parser.add_argument(
+	'-s', '--settle_limit',
+	help = 'Maximum number of nodes settled in each witness search',
+	default = 500,
+	type = int,
+	)
+
+parser.add_argument(
+	'-v', '--verbose',
+	help = 'Optional status printing',
+	action='store_true',
+	)
+
+parser.add_argument(
+	'-p', '--parameters_file',
+	help = 'JSON containing inputs which will overwrite command-line inputs',
+	)
+
+if __name__ == "__main__":
+
+	t0 = time.time()
+
+	args = vars(parser.parse_args(sys.argv[1:]))
+	CondPrint(str_color + '\n' + 'Module build_hierarchy' + '\n', args['verbose'])
+
+	args['weights']=eval(args['weights'])
+
+	if args['parameters_file'] is not None:
+
+		CondPrint('Loading parameters file', args['verbose'])
+
+		with open(args['parameters_file'], 'r') as file:
+
+			parameters = json.load(file)
+
+		for key in parameters.keys():
+
+			args[key] = parameters[key]
+
+	CondPrint('Loading atlas', args['verbose'])
+	atlas = src.graph.open_graph(args['atlas_file'])
+
+	CondPrint('Compiling atlas', args['verbose'])
+	if isinstance(atlas, src.binary.BinaryGraph):
+
+		compiled = atlas.compile(args['weights'].keys())
+
+	else:
+
+		compiled = src.csr.compile_graph(atlas, args['weights'].keys())
+
+	CondPrint('Contracting atlas\n', args['verbose'])
+	hierarchy = src.contraction.build_hierarchy(
+		compiled, args['weights'].keys(), settle_limit = args['settle_limit'],
+		pb_kwargs = {'disp': args['verbose'], 'end_color': ''},
+		)
+
+	#Writing to file
+	if args['output_file'] is None:
+
+		args['output_file'] = src.contraction.hierarchy_filename(args['atlas_file'])
+
+	CondPrint('\nWriting to file\n', args['verbose'])
+	src.contraction.save_hierarchy(hierarchy, args['output_file'])
+
+	CondPrint(
+		f'\nDone: {time.time()-t0:.3f} seconds' +
+		'\033[0m\n', args['verbose'])
@@ -25,7 +25,16 @@ parser = argparse.ArgumentParser(
 
 parser.add_argument(
     '-g', '--graph_file',
-    help = 'JSON file storing NLG for graph with links',
+    help = 'JSON (or binary .nlgb) file storing NLG for graph with links',
+    )
+
+parser.add_argument(
+    '-t', '--tensor_file',
+    help = (
+        'Adjacency tensor file written by add_adjacency.py. ' +
+        'If provided links are read from the tensor instead of the graph'
+        ),
+    default = None,
     )
 
 parser.add_argument(
@@ -34,6 +43,22 @@ parser.add_argument(
     default = 'routes.json',
     )
 
+parser.add_argument(
+    '-n', '--workers',
+    help = (
+        'Number of processes used for (vehicle, depot) work units, ' +
+        'values < 1 use all cores'
+        ),
+    default = 1,
+    type = int,
+    )
+
+parser.add_argument(
+    '-l', '--local_search',
+    help = 'Improve savings routes by local search',
+    action = 'store_true',
+    )
+
 parser.add_argument(
     '-v', '--verbose',
     help = 'Optional status printing',
@@ -63,14 +88,26 @@ if __name__ == "__main__":
         args[key] = parameters[key]
 
     CondPrint('Loading graph', args['verbose'])
-    graph = src.graph.graph_from_json(args['graph_file'])
+    graph = src.graph.graph_from_file(args['graph_file'])
 
     CondPrint('Creating routing inputs', args['verbose'])
 
     graph = src.router.assign_rng(graph, seed = parameters['rng_seed'])
     graph = src.router.assign_vehicle(graph, parameters['vehicles'])
 
-    graph = src.rng.assign_link_parameters(graph, parameters)
+    if args['tensor_file'] is None:
+
+        tensor = None
+
+        graph = src.rng.assign_link_parameters(graph, parameters)
+
+    else:
+
+        CondPrint('Loading adjacency tensor', args['verbose'])
+        tensor = src.tensor.tensor_from_file(args['tensor_file'])
+
+        tensor = src.rng.assign_tensor_parameters(tensor, parameters)
+
     graph = src.rng.assign_node_parameters(graph, parameters)
 
     objective_fields = set()
@@ -84,7 +121,7 @@ if __name__ == "__main__":
     objectives = {key: np.inf for key in list(objective_fields)}
 
     graph = src.savings_stochastic.add_depot_legs(
-        graph, parameters['depot_nodes'], objectives,
+        graph, parameters['depot_nodes'], objectives, tensor = tensor,
     )
 
     CondPrint('Computing raw routes\n', args['verbose'])
@@ -93,69 +130,13 @@ if __name__ == "__main__":
         'pb_kwargs': {
             'freq': 1000,
         },
+        'tensor': tensor,
+        'local_search': {} if args['local_search'] else None,
     }
 
-    final_routes = []
-
-    for vehicle_name, vehicle in parameters['vehicles'].items():
-
-        keep_nodes = [k for k, v in graph._node.items() if vehicle_name in v['vehicle']]
-
-        sg = src.graph.subgraph(
-            graph, np.concatenate((keep_nodes, parameters['depot_nodes']))
-        )
-
-        for idx, case in enumerate(vehicle['cases']):
-
-            print(f'\n{vehicle_name}, {case["name"]}\n')
-            
-            objectives = case['objectives']
-
-            routes, route_values, success = src.savings_stochastic.savings(
-                sg, objectives, **kwargs,
-            )
-
-            routes = src.router.route_information(sg, routes, parameters['route_fields'])
-
-            full_routes = []
-            
-            for idx, route in enumerate(routes):
-
-                condition_1 = len(route['nodes']) > 3
-                condition_2 = idx == len(vehicle['cases'])
-        
-                if condition_1 or condition_2:
-            
-                    route['vehicle'] = vehicle_name
-
-                    for objective in objectives.keys():
-
-                        route[objective] = route_values[idx][objective]
-                        route[f'{objective}_expected'] = np.mean(route_values[idx][objective])
-
-                    full_routes.append(route)
-
-            final_routes.extend(full_routes)
-        
-            all_nodes = np.array(list(sg.nodes))
-            
-            if full_routes:
-                
-                nodes_visited = np.unique(
-                    np.concatenate([r['nodes'] for r in full_routes])
-                )
-                
-            else:
-                
-                nodes_visited = []
-            
-            nodes_not_visited = np.unique(
-                np.concatenate((
-                    parameters['depot_nodes'],
-                    np.setdiff1d(all_nodes, nodes_visited)
-                )))
-
-            sg = src.graph.subgraph(sg, nodes_not_visited)
+    final_routes = src.scheduler.solve_work_units(
+        graph, parameters, workers = args['workers'], **kwargs,
+    )
 
     #Writing to file
     CondPrint('\n\nWriting to file\n', args['verbose'])
@@ -33,7 +33,7 @@ parser.add_argument(
 
 parser.add_argument(
     '-o', '--output_file',
-    help = 'Output file for nlg .json, default is \'graph.json\'',
+    help = 'Output file for nlg .json or .nlgb, default is \'graph.json\'',
     default = 'graph.json'
     )
 
@@ -170,7 +170,7 @@ if __name__ == "__main__":
 
     if args['graph_file'] is not None:
 
-        graph = src.graph.graph_from_json(args['graph_file'])
+        graph = src.graph.graph_from_file(args['graph_file'])
 
     else:
 
@@ -184,7 +184,7 @@ if __name__ == "__main__":
 
     #Writing to file
     CondPrint(str_color + 'Writing to file', args['verbose'])
-    src.graph.nlg_to_json(nlg, args['output_file'])
+    src.graph.nlg_to_file(nlg, args['output_file'])
 
     CondPrint(
         str_color + '\n' + f'Done: {time.time()-t0:.3f} seconds' +
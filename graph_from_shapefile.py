@@ -32,7 +32,7 @@ parser.add_argument(
 
 parser.add_argument(
 	'-o', '--output_file',
-	help = 'Output file for nlg .json, default is \'graph.json\'',
+	help = 'Output file for nlg .json or .nlgb, default is \'graph.json\'',
 	default = 'graph.json'
 	)
 
@@ -98,7 +98,7 @@ if __name__ == "__main__":
 
 	#Writing to file
 	CondPrint('Writing to file', args['verbose'])
-	src.graph.graph_to_json(graph, args['output_file'])
+	src.graph.graph_to_file(graph, args['output_file'])
 
 	CondPrint(
 		'\n' + f'Done: {time.time()-t0:.3f} seconds' +
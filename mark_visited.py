@@ -23,7 +23,7 @@ parser = argparse.ArgumentParser(
 
 parser.add_argument(
 	'-g', '--graph_file',
-	help = 'JSON file storing NLG',
+	help = 'JSON (or binary .nlgb) file storing NLG',
 	)
 
 parser.add_argument(
@@ -81,7 +81,7 @@ if __name__ == "__main__":
 
 	# Loading in graph
 	CondPrint('Loading graph', args['verbose'])
-	graph = src.graph.graph_from_json(args['graph_file'])
+	graph = src.graph.graph_from_file(args['graph_file'])
 
 	CondPrint('Marking nodes\n', args['verbose'])
 	graph = src.graph.mark_nodes(graph, nodes, args['field'], args['field_value'])
@@ -92,7 +92,7 @@ if __name__ == "__main__":
 		args['output_file'] = args['graph_file']
 
 	CondPrint('Writing to file\n', args['verbose'])
-	src.graph.graph_to_json(graph, args['output_file'])
+	src.graph.graph_to_file(graph, args['output_file'])
 
 	CondPrint(
 		f'\nDone: {time.time()-t0:.3f} seconds' +
@@ -2,10 +2,19 @@
 
 from . import utilities
 from . import progress_bar # Progress bar for status tracking
+from . import pool # Process pools
 from . import figures # Graph and route plotting
+from . import tensor # Dense adjacency tensors
 from . import rng
 from . import graph # Graph handling
+from . import csr # Compiled (CSR) graphs for fast routing
+from . import binary # Binary graph storage
+from . import contraction # Contraction hierarchies for atlas routing
+from . import adjacency_cache # Cached routing results for incremental adjacency
 from . import adjacency # Computation of adjacency for graphs
+from . import route_store # Route bookkeeping for savings algorithms
 from . import savings
 from . import savings_stochastic
-from . import router # Solving VRP
\ No newline at end of file
+from . import router # Solving VRP
+from . import local_search # Route improvement
+from . import scheduler # Work units for VRP
\ No newline at end of file
@@ -15,7 +15,13 @@ import numpy as np
 from scipy.spatial import KDTree
 
 from .progress_bar import ProgressBar
-from .dijkstra import dijkstra
+from .pool import worker_state, worker_count, process_pool
+from .dijkstra import dijkstra, compiled_dijkstra
+from .csr import CompiledGraph, compile_graph
+from .binary import BinaryGraph
+from .contraction import iterate_many_to_many
+from .tensor import AdjacencyTensor
+from .adjacency_cache import routing_config
 
 # Routing functions and related objects
 
@@ -54,82 +60,162 @@ def closest_nodes_from_coordinates(graph, x, y):
 def single_source_dijkstra(atlas, source, targets, weights, return_paths = False):
 	'''
 	Compute lowest cost route(s) from source to target(s) on atlas.
-	See .dijkstra.dijkstra for details on inputs
+	See .dijkstra.dijkstra for details on inputs. If atlas is a CompiledGraph
+	the search is run by .dijkstra.compiled_dijkstra.
 	'''
 
 	if not hasattr(targets, '__iter__'):
 		targets=[targets]
 
-	route_weights, routes = dijkstra(
+	if isinstance(atlas, CompiledGraph):
+
+		search = compiled_dijkstra
+
+	else:
+
+		search = dijkstra
+
+	# Search terminates once all targets are settled or the cutoffs are reached
+	if not isinstance(targets, set):
+
+		targets = set(targets)
+
+	route_weights, routes = search(
 		atlas,
 		[source],
-		[],
+		targets,
 		weights,
 		return_paths,
 		)
 
-	keys = np.array(list(route_weights.keys()))
-	route_information = np.array(list(route_weights.values()))
+	result = []
 
-	select = np.isin(keys, targets)
+	for key, route_information in route_weights.items():
 
-	keys_select = keys[select]
-	route_information_select = route_information[select]
+		if key in targets:
 
-	result = []
+			result.append({
+				'source': source,
+				'target': key,
+				**{weight: float(route_information[idx_weight]) \
+				for idx_weight, weight in enumerate(weights)},
+				})
 
-	for idx, key in enumerate(keys_select):
+	return result
 
-		result.append({
-			'source': source,
-			'target': key,
-			**{weight: route_information_select[idx][idx_weight] \
-			for idx_weight, weight in enumerate(weights)},
-			})
+def source_weights(source, weights, depots):
+	'''
+	Routing weights for a source - searches from depots are unbounded
+	'''
 
-	return result
+	if source in depots:
 
-def multiple_source_dijkstra(atlas, sources, targets, weights, **kwargs):
+		return {key: np.inf for key in weights.keys()}
+
+	else:
+
+		return weights
+
+def _worker_single_source_dijkstra(source):
+
+	return single_source_dijkstra(
+		worker_state['atlas'],
+		source,
+		worker_state['targets'],
+		source_weights(source, worker_state['weights'], worker_state['depots']),
+		**worker_state['dijkstra_kwargs'],
+		)
+
+def iterate_multiple_source_dijkstra(atlas, sources, targets, weights, **kwargs):
 	'''
-	Compute lowest cost route(s) from source to target(s) on atlas.
-	See .dijkstra.dijkstra for details on inputs
+	Generator yielding the results of each source in source order.
+	See multiple_source_dijkstra for details on inputs.
 	'''
 
 	kwargs.setdefault('pb_kwargs', {'disp': True})
 	kwargs.setdefault('dijkstra_kwargs', {'return_paths': False})
 	kwargs.setdefault('depots', [])
+	kwargs.setdefault('workers', 1)
+	kwargs.setdefault('chunksize', 16)
 
 	if not hasattr(targets, '__iter__'):
 		targets=[targets]
 
-	results = []
+	targets = set(targets)
+
+	workers = worker_count(kwargs['workers'])
 
-	for source in ProgressBar(sources, **kwargs['pb_kwargs']):
+	if (workers == 1) or (len(sources) <= 1):
 
-		if source in kwargs['depots']:
+		for source in ProgressBar(sources, **kwargs['pb_kwargs']):
 
-			_weights = {key: np.inf for key in weights.keys()}
-			# print(source, _weights)
+			_weights = source_weights(source, weights, kwargs['depots'])
 
-		else:
+			yield single_source_dijkstra(
+				atlas, source, targets, _weights, **kwargs['dijkstra_kwargs'])
 
-			_weights = weights
+		return
 
-		result = single_source_dijkstra(
-			atlas, source, targets, _weights, **kwargs['dijkstra_kwargs'])
+	state = {
+		'atlas': atlas,
+		'targets': targets,
+		'weights': weights,
+		'depots': kwargs['depots'],
+		'dijkstra_kwargs': kwargs['dijkstra_kwargs'],
+		}
+
+	with process_pool(workers, initargs = (state, )) as pool:
+
+		iterator = pool.imap(
+			_worker_single_source_dijkstra, sources, chunksize = kwargs['chunksize'],
+			)
+
+		for _ in ProgressBar(range(len(sources)), **kwargs['pb_kwargs']):
+
+			yield next(iterator)
+
+def multiple_source_dijkstra(atlas, sources, targets, weights, **kwargs):
+	'''
+	Compute lowest cost route(s) from source to target(s) on atlas.
+	See .dijkstra.dijkstra for details on inputs
+
+	If workers > 1 sources are routed on a process pool. The atlas is passed to
+	each worker once at start-up (inherited without pickling where the fork start
+	method is available), sources are sent in chunks of chunksize, and results are
+	collected in source order so that the output matches the serial path.
+	workers < 1 uses all available cores.
+	'''
+
+	results = []
+
+	for result in iterate_multiple_source_dijkstra(
+		atlas, sources, targets, weights, **kwargs):
 
 		results.extend(result)
 
 	return results
 
+def node_coordinates(graph):
+	'''
+	Returns node ids and (n, 2) array of node coordinates for a NetworkX graph or
+	a .binary.BinaryGraph
+	'''
+
+	if isinstance(graph, BinaryGraph):
+
+		return graph.node_ids(), graph.coordinates()
+
+	xy_graph = np.array([(n['x'], n['y']) for n in graph._node.values()])
+
+	return list(graph.nodes), xy_graph.reshape((-1,2))
+
 def node_assignment(atlas, graph):
 	'''
 	Maps closest nodes from atlas to graph and graph to atlas - assumes 2D graph
 	'''
 
 	# Pulling coordinates from atlas
-	xy_atlas = np.array([(n['x'], n['y']) for n in atlas._node.values()])
-	xy_atlas = xy_atlas.reshape((-1,2))
+	atlas_nodes, xy_atlas = node_coordinates(atlas)
 
 	# Creating spatial KDTree for assignment
 	kd_tree = KDTree(xy_atlas)
@@ -144,7 +230,7 @@ def node_assignment(atlas, graph):
 	result = kd_tree.query(xy_graph)
 
 	graph_to_atlas = {}
-	atlas_to_graph = {n: [] for n in atlas.nodes}
+	atlas_to_graph = {n: [] for n in atlas_nodes}
 
 	for idx in range(len(xy_graph)):
 
@@ -155,9 +241,9 @@ def node_assignment(atlas, graph):
 
 	return graph_to_atlas, atlas_to_graph
 
-def adjacency(atlas, graph, weights, **kwargs):
+def _prepare_routing(atlas, graph, weights, kwargs):
 	'''
-	Computing adjacency for graph by routing along atlas
+	Assigns graph nodes to atlas nodes, compiles the atlas, and selects sources
 	'''
 
 	kwargs.setdefault('pb_kwargs', {'disp': True})
@@ -165,16 +251,27 @@ def adjacency(atlas, graph, weights, **kwargs):
 	kwargs.setdefault('compute_all', False)
 	kwargs.setdefault('node_assignment_function', node_assignment)
 	kwargs.setdefault('depots', [])
+	kwargs.setdefault('compile_atlas', True)
+	kwargs.setdefault('hierarchy', None)
+	kwargs.setdefault('cache', None)
 
 	# Maps closest nodes from atlas to graph and graph to atlas
 	graph_to_atlas, atlas_to_graph = kwargs['node_assignment_function'](atlas, graph)
 
+	# Freezing the atlas into CSR arrays once for all searches. Binary atlases have
+	# no graph._adj for dijkstra so are compiled whatever compile_atlas is.
+	compile_atlas = kwargs['compile_atlas'] and (kwargs['hierarchy'] is None)
+
+	if isinstance(atlas, BinaryGraph) and (kwargs['hierarchy'] is None):
+
+		atlas = atlas.compile(weights.keys())
+
+	elif compile_atlas and not isinstance(atlas, CompiledGraph):
+
+		atlas = compile_graph(atlas, weights.keys())
+
 	# All nodes of graph are assumed to be targets
 	targets = [graph_to_atlas[n] for n in list(graph.nodes)]
-	# print(len(targets))
-
-	# Collecting status of all nodes in graph
-	statuses = np.array([n['status'] for n in graph._node.values()])
 
 	# Creating sources based on statuses and compute_all
 	if kwargs['compute_all']:
@@ -185,19 +282,214 @@ def adjacency(atlas, graph, weights, **kwargs):
 
 		sources = [graph_to_atlas[k] for k, v in graph._adj.items() if not v]
 
-		# sources = [targets[idx] for idx, status in enumerate(statuses) if status == 0]
+	kwargs['depots'] = [graph_to_atlas[n] for n in list(kwargs['depots'])]
 
-	# print(sources)
+	return atlas, sources, targets, atlas_to_graph
 
-	kwargs['depots'] = [graph_to_atlas[n] for n in list(kwargs['depots'])]
+def _iterate_routes(atlas, sources, targets, weights, kwargs):
+	'''
+	Yields the routing results of each source from the atlas or the hierarchy
+	'''
+
+	if kwargs['hierarchy'] is None:
+
+		return iterate_multiple_source_dijkstra(
+			atlas, sources, targets, weights, **kwargs)
+
+	else:
+
+		return iterate_many_to_many(
+			kwargs['hierarchy'], sources, targets, weights,
+			pb_kwargs = kwargs['pb_kwargs'], depots = kwargs['depots'],
+			)
+
+def _within_limits(result, weights):
+	'''
+	Checks result against the cutoffs of weights - limits <= 0 are unbounded
+	'''
+
+	return all(
+		(limit <= 0) or (result[field] <= limit) for field, limit in weights.items()
+		)
+
+def _reverse_atlas(atlas):
+
+	if isinstance(atlas, CompiledGraph):
+
+		return atlas.reverse()
+
+	return atlas.reverse(copy = False)
+
+def _is_directed(atlas):
+
+	if isinstance(atlas, CompiledGraph):
+
+		return atlas.directed
+
+	return atlas.is_directed()
+
+def update_cache(atlas, nodes, weights, kwargs):
+	'''
+	Routes the atlas nodes of nodes which are not in kwargs['cache'] and adds
+	their results to the cache. Rows are routed from new nodes to all cached and
+	new nodes. Columns from cached nodes to new nodes are routed from cached
+	depots (unbounded), by reverse searches from the new nodes on directed
+	atlases, by many-to-many queries if a hierarchy is used, and are read from
+	the new rows on undirected atlases. Returns the new nodes.
+	'''
+
+	cache = kwargs['cache']
+
+	new = [node for node in dict.fromkeys(nodes) if node not in cache]
+
+	if not new:
+
+		return new
+
+	cached = list(cache.rows.keys())
+
+	# Rows of new nodes
+	for source, result in zip(
+		new, _iterate_routes(atlas, new, cached + new, weights, kwargs)):
+
+		cache.add_row(source, result)
+
+	if not cached:
+
+		return new
+
+	# Columns from cached nodes to new nodes
+	columns = {source: [] for source in cached}
+
+	depots = set(kwargs['depots'])
+
+	cached_depots = [node for node in cached if node in depots]
+	cached_others = [node for node in cached if node not in depots]
+
+	if kwargs['hierarchy'] is None:
+
+		sources = cached_depots
+
+	else:
+
+		sources = cached_depots + cached_others
+
+	if sources:
+
+		for result in _iterate_routes(atlas, sources, new, weights, kwargs):
+
+			for link in result:
+
+				columns[link['source']].append(link)
+
+	if (kwargs['hierarchy'] is not None) or (not cached_others):
+
+		pass
+
+	elif _is_directed(atlas):
+
+		# Searches from new nodes on the reversed atlas are bounded as searches
+		# from the (non-depot) cached nodes would be
+		reverse_kwargs = {**kwargs, 'depots': []}
+
+		for result in _iterate_routes(
+			_reverse_atlas(atlas), new, cached_others, weights, reverse_kwargs):
+
+			for link in result:
+
+				columns[link['target']].append(
+					{**link, 'source': link['target'], 'target': link['source']}
+					)
+
+	else:
+
+		for node in new:
+
+			for link in cache.results(node, cached_others):
+
+				if _within_limits(link, weights):
+
+					columns[link['target']].append(
+						{**link, 'source': link['target'], 'target': node}
+						)
+
+	cache.extend_rows(columns)
+
+	return new
+
+def _iterate_cached_routes(atlas, sources, targets, weights, kwargs):
+	'''
+	Yields routing results per atlas node of targets from kwargs['cache'] after
+	routing nodes which are not cached. Full rows are yielded for sources and for
+	new nodes, other rows only contain results for sources and new nodes. New
+	graph nodes may snap to cached atlas nodes so columns are taken from sources
+	rather than from uncached atlas nodes only.
+	'''
+
+	cache = kwargs['cache']
+
+	config = routing_config(weights, kwargs['depots'])
+
+	if not cache.matches(config):
+
+		cache.reset(config)
+
+	new = update_cache(atlas, targets, weights, kwargs)
+
+	full = list(dict.fromkeys(list(sources) + new))
+	full_set = set(full)
+
+	all_targets = np.array(list(dict.fromkeys(targets)))
+	full_targets = np.array(full)
+
+	for source in dict.fromkeys(targets):
+
+		yield cache.results(
+			source, all_targets if source in full_set else full_targets)
+
+def _routes(atlas, sources, targets, weights, kwargs):
+	'''
+	Yields routing results per source, from the cache if one is provided
+	'''
+
+	if kwargs['cache'] is None:
+
+		return _iterate_routes(atlas, sources, targets, weights, kwargs)
+
+	else:
+
+		return _iterate_cached_routes(atlas, sources, targets, weights, kwargs)
+
+def adjacency(atlas, graph, weights, **kwargs):
+	'''
+	Computing adjacency for graph by routing along atlas. atlas may be a NetworkX
+	graph or a .binary.BinaryGraph which is compiled without building NetworkX
+	dictionaries, whatever compile_atlas is, unless a hierarchy is provided.
+
+	If a .contraction.ContractionHierarchy of the atlas is provided as hierarchy
+	routes are computed by bucket many-to-many queries on the hierarchy instead of
+	by Dijkstra searches on the atlas.
+
+	If a .adjacency_cache.AdjacencyCache is provided as cache only atlas nodes
+	which are not in the cache are routed (see update_cache). Sources selected as
+	above receive all links, other nodes receive links to those sources only. The
+	cache is updated in place and is reset if it was computed with different
+	weights or depots.
+	'''
+
+	atlas, sources, targets, atlas_to_graph = _prepare_routing(
+		atlas, graph, weights, kwargs)
 
 	for n in list(graph.nodes):
 
 		graph._node[n]['status'] = 1
 
 	# Computing routes between selected sources and all targets
-	# print(len(sources))
-	results = multiple_source_dijkstra(atlas, sources, targets, weights, **kwargs)
+	results = []
+
+	for result in _routes(atlas, sources, targets, weights, kwargs):
+
+		results.extend(result)
 
 	# Compiling edge information from results into 3-tuple for adding to graph
 	edges = []
@@ -216,4 +508,63 @@ def adjacency(atlas, graph, weights, **kwargs):
 	# Adding edges to graph
 	graph.add_edges_from(edges)
 
-	return graph
\ No newline at end of file
+	return graph
+
+def adjacency_tensor(atlas, graph, weights, **kwargs):
+	'''
+	Computing adjacency for graph by routing along atlas and writing it directly
+	into a .tensor.AdjacencyTensor. All nodes of graph are routed. The graph is
+	not modified. As for adjacency, routes for undirected graphs are written in
+	both directions. See adjacency for inputs.
+	'''
+
+	kwargs['compute_all'] = True
+	kwargs.setdefault('dtype', np.float32)
+
+	atlas, sources, targets, atlas_to_graph = _prepare_routing(
+		atlas, graph, weights, kwargs)
+
+	nodes = list(graph.nodes)
+	node_to_idx = {node: idx for idx, node in enumerate(nodes)}
+	fields = list(weights.keys())
+
+	# Graph node indices of each atlas node
+	atlas_to_index = {
+		key: [node_to_idx[node] for node in value] \
+		for key, value in atlas_to_graph.items() if value
+		}
+
+	values = np.full((len(fields), len(nodes), len(nodes)), np.inf, dtype = kwargs['dtype'])
+
+	# Colocated graph nodes share an atlas node and so are routed only once
+	for result in _routes(
+		atlas, list(dict.fromkeys(sources)), targets, weights, kwargs):
+
+		if not result:
+
+			continue
+
+		rows = atlas_to_index[result[0]['source']]
+
+		columns = []
+		row_values = []
+
+		for link in result:
+
+			link_columns = atlas_to_index[link['target']]
+
+			columns.extend(link_columns)
+			row_values.extend([[link[field] for field in fields]] * len(link_columns))
+
+		row_values = np.array(row_values, dtype = kwargs['dtype']).T
+
+		for row in rows:
+
+			values[:, row, columns] = row_values
+
+			# Links of undirected graphs are traversable in both directions
+			if not graph.is_directed():
+
+				values[:, columns, row] = row_values
+
+	return AdjacencyTensor(nodes, fields, values)
@@ -0,0 +1,193 @@
+'''
+Module for caching adjacency routing results
+
+Routing results are stored by snapped atlas node. For a set of cached atlas nodes
+the cache holds every result between cached nodes, so adding nodes only requires
+routing the rows of the new nodes and the columns from cached nodes to new nodes.
+A cache is only valid for the routing configuration (weights, cutoffs, and depots)
+it was computed with.
+
+Caches are stored in the binary container format of .binary as CSR arrays:
+
+nodes - cached atlas nodes
+indptr - row offsets into targets and values
+targets - target atlas nodes
+values - (n_fields, n_results) array of route values in the field order of weights
+'''
+
+import os
+import json
+import numpy as np
+
+from .binary import write_arrays, read_arrays, _default
+
+def routing_config(weights, depots):
+	'''
+	JSON serializable routing configuration used to validate caches
+	'''
+
+	return json.loads(json.dumps(
+		{'weights': weights, 'depots': sorted(depots)}, default = _default,
+		))
+
+class AdjacencyCache():
+	'''
+	Routing results by source atlas node
+
+	config - routing configuration (see routing_config)
+	fields - fields of weights in order
+	rows - {source atlas node: (target atlas nodes, (n_fields, n) values)}
+	'''
+
+	def __init__(self, config, rows = {}):
+
+		self.config = config
+		self.fields = list(config['weights'].keys())
+		self.rows = dict(rows)
+
+	def __contains__(self, node):
+
+		return node in self.rows
+
+	def __len__(self):
+
+		return len(self.rows)
+
+	def matches(self, config):
+
+		return self.config == config
+
+	def reset(self, config):
+		'''
+		Clears all results and sets the routing configuration
+		'''
+
+		self.__init__(config)
+
+	def add_row(self, source, results):
+		'''
+		Adds the row of source from a list of result dictionaries as returned by
+		.adjacency.single_source_dijkstra
+		'''
+
+		self.rows[source] = (
+			np.array([result['target'] for result in results], dtype = np.int64),
+			np.array(
+				[[result[field] for result in results] for field in self.fields],
+				dtype = np.float64,
+				).reshape((len(self.fields), -1)),
+			)
+
+	def extend_rows(self, columns):
+		'''
+		Appends {source: [result dictionaries]} to existing rows
+		'''
+
+		for source, results in columns.items():
+
+			if not results:
+
+				continue
+
+			targets, values = self.rows[source]
+
+			self.rows[source] = (
+				np.concatenate((
+					targets,
+					np.array([result['target'] for result in results], dtype = np.int64),
+					)),
+				np.hstack((
+					values,
+					np.array(
+						[[result[field] for result in results] for field in self.fields],
+						dtype = np.float64,
+						),
+					)),
+				)
+
+	def results(self, source, targets = None):
+		'''
+		Returns the results of source as a list of result dictionaries. If targets
+		is given (as an array of atlas nodes) only results for targets are returned.
+		'''
+
+		row_targets, values = self.rows[source]
+
+		if targets is not None:
+
+			keep = np.isin(row_targets, targets)
+
+			row_targets = row_targets[keep]
+			values = values[:, keep]
+
+		values = values.tolist()
+
+		return [
+			{
+				'source': source,
+				'target': target,
+				**{field: values[k][idx] for k, field in enumerate(self.fields)},
+				} for idx, target in enumerate(row_targets.tolist())
+			]
+
+def cache_to_file(cache, filename):
+	'''
+	Writes AdjacencyCache to binary file
+	'''
+
+	nodes = list(cache.rows.keys())
+	rows = list(cache.rows.values())
+
+	indptr = np.zeros(len(nodes) + 1, dtype = np.int64)
+	np.cumsum([len(row[0]) for row in rows], out = indptr[1:])
+
+	if rows:
+
+		targets = np.concatenate([row[0] for row in rows])
+		values = np.hstack([row[1] for row in rows])
+
+	else:
+
+		targets = np.zeros(0, dtype = np.int64)
+		values = np.zeros((len(cache.fields), 0))
+
+	arrays = {
+		'nodes': np.array(nodes, dtype = np.int64),
+		'indptr': indptr,
+		'targets': targets,
+		'values': values,
+		}
+
+	write_arrays(filename, arrays, {'config': cache.config})
+
+def cache_from_file(filename):
+	'''
+	Loads AdjacencyCache from binary file
+	'''
+
+	arrays, metadata = read_arrays(filename, mmap = False)
+
+	indptr = arrays['indptr'].tolist()
+
+	rows = {}
+
+	for idx, node in enumerate(arrays['nodes'].tolist()):
+
+		rows[node] = (
+			arrays['targets'][indptr[idx]:indptr[idx + 1]],
+			arrays['values'][:, indptr[idx]:indptr[idx + 1]],
+			)
+
+	return AdjacencyCache(metadata['config'], rows)
+
+def load_cache(filename):
+	'''
+	Loads AdjacencyCache from filename if the file exists. Otherwise returns an
+	empty cache whose configuration is set on first use.
+	'''
+
+	if os.path.isfile(filename):
+
+		return cache_from_file(filename)
+
+	return AdjacencyCache({'weights': {}, 'depots': []})
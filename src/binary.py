@@ -0,0 +1,470 @@
+'''
+Module for binary graph storage
+
+Binary files consist of a fixed preamble, a JSON header, and a sequence of flat
+arrays each aligned to ALIGNMENT bytes:
+
+MAGIC (8 bytes) | header length (uint64) | JSON header | padding | arrays
+
+The header contains user metadata and, for each array, its dtype, shape, and byte
+offset from the start of the file. Arrays are opened as read-only memory maps so
+nothing is read from disk until it is used.
+
+Graphs are stored as node ids, link endpoints (as node indices), and one array per
+numeric node/link attribute. Attributes which are missing for some nodes/links
+are stored with a boolean presence mask. Non-numeric attributes (strings, lists,
+etc.) are stored as a JSON blob which is only decoded when a NetworkX graph is
+built.
+'''
+
+import json
+import numpy as np
+import networkx as nx
+
+from .csr import CompiledGraph
+
+MAGIC = b'NLGBIN01'
+ALIGNMENT = 64
+BINARY_EXTENSION = '.nlgb'
+
+# Functions for array files
+
+def _padding(position):
+
+    return (-position) % ALIGNMENT
+
+def write_arrays(filename, arrays, metadata = {}):
+    '''
+    Writes {name: array} and JSON serializable metadata to binary file
+    '''
+
+    table = {}
+    offset = 0
+
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    for name, array in arrays.items():
+
+        table[name] = {
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'offset': offset,
+            }
+
+        offset += array.nbytes + _padding(array.nbytes)
+
+    header = json.dumps({'metadata': metadata, 'arrays': table}).encode('utf-8')
+
+    start = len(MAGIC) + 8 + len(header)
+    start += _padding(start)
+
+    with open(filename, 'wb') as file:
+
+        file.write(MAGIC)
+        file.write(np.uint64(len(header)).tobytes())
+        file.write(header)
+        file.write(b'\0' * _padding(file.tell()))
+
+        for array in arrays.values():
+
+            file.write(array.tobytes())
+            file.write(b'\0' * _padding(array.nbytes))
+
+def read_arrays(filename, mmap = True):
+    '''
+    Reads binary file into ({name: array}, metadata). If mmap arrays are read-only
+    memory maps, otherwise arrays are read into memory.
+    '''
+
+    with open(filename, 'rb') as file:
+
+        magic = file.read(len(MAGIC))
+
+        if magic != MAGIC:
+
+            raise ValueError(f"{filename} is not a binary graph file")
+
+        header_length = int(np.frombuffer(file.read(8), dtype = np.uint64)[0])
+        header = json.loads(file.read(header_length).decode('utf-8'))
+
+    start = len(MAGIC) + 8 + header_length
+    start += _padding(start)
+
+    arrays = {}
+
+    for name, info in header['arrays'].items():
+
+        dtype = np.dtype(info['dtype'])
+        shape = tuple(info['shape'])
+
+        if int(np.prod(shape)) == 0:
+
+            arrays[name] = np.zeros(shape, dtype = dtype)
+
+        elif mmap:
+
+            arrays[name] = np.memmap(
+                filename, dtype = dtype, mode = 'r',
+                offset = start + info['offset'], shape = shape,
+                )
+
+        else:
+
+            with open(filename, 'rb') as file:
+
+                file.seek(start + info['offset'])
+
+                arrays[name] = np.fromfile(
+                    file, dtype = dtype, count = int(np.prod(shape)),
+                    ).reshape(shape)
+
+    return arrays, header['metadata']
+
+# Functions for graphs
+
+def _is_numeric(value):
+
+    return (
+        isinstance(value, (int, float, np.integer, np.floating)) and
+        not isinstance(value, (bool, np.bool_))
+        )
+
+def _default(obj):
+    '''
+    Converts NumPy types for JSON serialization
+    '''
+
+    if isinstance(obj, (np.integer, np.floating, np.ndarray)):
+
+        return obj.tolist()
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _encode_attributes(items, prefix):
+    '''
+    Splits attribute dictionaries into numeric arrays and a JSON blob
+    '''
+
+    n = len(items)
+
+    numeric = {}
+    objects = {}
+
+    keys = list(dict.fromkeys(key for item in items for key in item.keys()))
+
+    for key in keys:
+
+        values = [item.get(key, None) for item in items]
+        present = np.array([key in item for item in items], dtype = bool)
+
+        if all(_is_numeric(v) for v, p in zip(values, present) if p):
+
+            integer = all(
+                isinstance(v, (int, np.integer)) for v, p in zip(values, present) if p
+                )
+
+            array = np.zeros(n, dtype = np.int64 if integer else np.float64)
+            array[present] = [v for v, p in zip(values, present) if p]
+
+            numeric[key] = {'array': array, 'present': present}
+
+        else:
+
+            objects[key] = {
+                str(idx): value for idx, (value, p) in \
+                enumerate(zip(values, present)) if p
+                }
+
+    arrays = {}
+    table = {}
+
+    for key, info in numeric.items():
+
+        name = f'{prefix}_{len(table)}'
+
+        arrays[name] = info['array']
+        table[key] = {'array': name, 'mask': None}
+
+        if not info['present'].all():
+
+            arrays[name + '_mask'] = info['present']
+            table[key]['mask'] = name + '_mask'
+
+    blob = json.dumps(objects, default = _default).encode('utf-8')
+    arrays[prefix + '_objects'] = np.frombuffer(blob, dtype = np.uint8)
+
+    return arrays, table
+
+def graph_to_binary(graph, filename):
+    '''
+    Writes NetworkX graph to binary file
+    '''
+
+    nodes = list(graph.nodes)
+    node_to_idx = {node: idx for idx, node in enumerate(nodes)}
+
+    integer_ids = all(isinstance(node, (int, np.integer)) for node in nodes)
+
+    arrays = {}
+
+    if integer_ids:
+
+        arrays['node_ids'] = np.array(nodes, dtype = np.int64)
+        node_ids = None
+
+    else:
+
+        node_ids = nodes
+
+    node_arrays, node_table = _encode_attributes(
+        [graph._node[node] for node in nodes], 'node',
+        )
+
+    links = list(graph.edges(data = True))
+
+    arrays['link_source'] = np.array(
+        [node_to_idx[link[0]] for link in links], dtype = np.int64,
+        )
+    arrays['link_target'] = np.array(
+        [node_to_idx[link[1]] for link in links], dtype = np.int64,
+        )
+
+    link_arrays, link_table = _encode_attributes([link[2] for link in links], 'link')
+
+    arrays.update(node_arrays)
+    arrays.update(link_arrays)
+
+    metadata = {
+        'directed': graph.is_directed(),
+        'graph': graph.graph,
+        'node_ids': node_ids,
+        'node_attributes': node_table,
+        'link_attributes': link_table,
+        }
+
+    write_arrays(filename, arrays, json.loads(json.dumps(metadata, default = _default)))
+
+class BinaryGraph():
+    '''
+    Lazily opened binary graph. Arrays are memory maps until used.
+    '''
+
+    def __init__(self, filename, mmap = True):
+
+        self.filename = filename
+        self.arrays, self.metadata = read_arrays(filename, mmap = mmap)
+        self.directed = self.metadata['directed']
+
+    def is_directed(self):
+
+        return self.directed
+
+    def number_of_nodes(self):
+
+        if self.metadata['node_ids'] is None:
+
+            return len(self.arrays['node_ids'])
+
+        return len(self.metadata['node_ids'])
+
+    def number_of_links(self):
+
+        return len(self.arrays['link_source'])
+
+    def node_ids(self):
+
+        if self.metadata['node_ids'] is None:
+
+            return self.arrays['node_ids'].tolist()
+
+        return list(self.metadata['node_ids'])
+
+    def _attribute(self, table, key):
+
+        info = self.metadata[table][key]
+
+        values = self.arrays[info['array']]
+
+        if info['mask'] is None:
+
+            return values, None
+
+        return values, self.arrays[info['mask']]
+
+    def node_attribute(self, key):
+        '''
+        Returns (values, presence mask or None) for a numeric node attribute
+        '''
+
+        return self._attribute('node_attributes', key)
+
+    def link_attribute(self, key):
+        '''
+        Returns (values, presence mask or None) for a numeric link attribute
+        '''
+
+        return self._attribute('link_attributes', key)
+
+    def coordinates(self):
+        '''
+        Returns (n, 2) array of node 'x' and 'y' attributes
+        '''
+
+        x, _ = self.node_attribute('x')
+        y, _ = self.node_attribute('y')
+
+        return np.vstack((x, y)).T
+
+    def _objects(self, prefix):
+
+        return json.loads(bytes(self.arrays[prefix + '_objects']).decode('utf-8'))
+
+    def _attribute_dicts(self, table, prefix, n):
+
+        dicts = [{} for _ in range(n)]
+
+        for key, info in self.metadata[table].items():
+
+            values = self.arrays[info['array']].tolist()
+
+            if info['mask'] is None:
+
+                for idx in range(n):
+
+                    dicts[idx][key] = values[idx]
+
+            else:
+
+                mask = self.arrays[info['mask']].tolist()
+
+                for idx in range(n):
+
+                    if mask[idx]:
+
+                        dicts[idx][key] = values[idx]
+
+        for key, values in self._objects(prefix).items():
+
+            for idx, value in values.items():
+
+                dicts[int(idx)][key] = value
+
+        return dicts
+
+    def to_graph(self):
+        '''
+        Builds the NetworkX graph
+        '''
+
+        nodes = self.node_ids()
+
+        graph = nx.DiGraph() if self.directed else nx.Graph()
+        graph.graph.update(self.metadata['graph'])
+
+        node_dicts = self._attribute_dicts('node_attributes', 'node', len(nodes))
+        graph.add_nodes_from(zip(nodes, node_dicts))
+
+        sources = self.arrays['link_source'].tolist()
+        targets = self.arrays['link_target'].tolist()
+
+        link_dicts = self._attribute_dicts('link_attributes', 'link', len(sources))
+
+        graph.add_edges_from(
+            (nodes[s], nodes[t], d) for s, t, d in zip(sources, targets, link_dicts)
+            )
+
+        return graph
+
+    def compile(self, fields):
+        '''
+        Builds a .csr.CompiledGraph directly from the stored arrays. Link values
+        which are None or missing are NaN as None values in .csr.compile_graph and
+        fields which no link has default to 1. Raises TypeError for fields with
+        values which are neither numeric nor None.
+        '''
+
+        nodes = self.node_ids()
+        n = len(nodes)
+
+        sources = np.asarray(self.arrays['link_source'])
+        targets = np.asarray(self.arrays['link_target'])
+
+        objects = None
+        columns = {}
+
+        for field in fields:
+
+            if field in self.metadata['link_attributes']:
+
+                values, mask = self.link_attribute(field)
+                values = np.asarray(values, dtype = np.float64).copy()
+
+                if mask is not None:
+
+                    values[~np.asarray(mask)] = np.nan
+
+            else:
+
+                if objects is None:
+
+                    objects = self._objects('link')
+
+                if field in objects:
+
+                    values = np.full(len(sources), np.nan)
+
+                    for idx, value in objects[field].items():
+
+                        if value is None:
+
+                            continue
+
+                        if not _is_numeric(value):
+
+                            raise TypeError(
+                                f"Link attribute {field} has non-numeric value " +
+                                f"of type {type(value).__name__}"
+                                )
+
+                        values[int(idx)] = value
+
+                else:
+
+                    values = np.ones(len(sources))
+
+            columns[field] = values
+
+        if not self.directed:
+
+            # Undirected links are stored once and traversable in both directions
+            loops = sources == targets
+
+            sources, targets = (
+                np.concatenate((sources, targets[~loops])),
+                np.concatenate((targets, sources[~loops])),
+                )
+
+            columns = {
+                field: np.concatenate((values, values[~loops])) \
+                for field, values in columns.items()
+                }
+
+        order = np.argsort(sources, kind = 'stable')
+
+        indptr = np.zeros(n + 1, dtype = np.int64)
+        np.cumsum(np.bincount(sources, minlength = n), out = indptr[1:])
+
+        return CompiledGraph(
+            nodes,
+            indptr,
+            targets[order],
+            {field: values[order] for field, values in columns.items()},
+            directed = self.directed,
+            )
+
+def graph_from_binary(filename):
+    '''
+    Loads NetworkX graph from binary file
+    '''
+
+    return BinaryGraph(filename).to_graph()
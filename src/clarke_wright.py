@@ -1,11 +1,11 @@
 import time
 import numpy as np
 
-from operator import itemgetter
 from heapq import heappop, heappush
 from itertools import count
 
 from .progress_bar import ProgressBar
+from .route_store import RouteStore
 
 def array_expectation(x, s = .5, axis = 0):
 
@@ -16,40 +16,6 @@ def array_expectation(x, s = .5, axis = 0):
 
 	return expectation
 
-def find_routes(routes, node_0, node_1):
-
-	first_route_index = []
-	second_route_index = []
-
-	# print(len(routes))
-
-	itemget = itemgetter(1)
-
-	result = filter(
-		lambda idx: itemget(routes[idx]) == (node_0),
-		list(range(len(routes)))
-		)
-
-	for res in result:
-		# print(res)
-
-		first_route_index = res
-
-	itemget = itemgetter(-2)
-
-	result = filter(
-		lambda idx: itemget(routes[idx]) == (node_1),
-		list(range(len(routes)))
-		)
-
-	for res in result:
-
-		# print(res)
-
-		second_route_index = res
-
-	return first_route_index, second_route_index
-
 def requisites(graph, objectives, **kwargs):
 	'''
 	Computing the savings matrix from an adjacency matrix.
@@ -158,6 +124,9 @@ def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
 
 	# savings, routes, route_values = requisites(graph, objectives)
 
+	# Start and end node indices of the routes
+	route_store = RouteStore(routes, route_values)
+
 	# Implementing savings
 	success = False
 
@@ -180,22 +149,22 @@ def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
 		# Finding routes to merge - the routes can only be merged if there are
 		# routes which start with and end with the to and from index respectively.
 
-		first_route_index = []
-		second_route_index = []
+		first_route_index, second_route_index = route_store.find(source, target)
 
-		first_route_index, second_route_index = find_routes(
-			routes,
-			source,
-			target,
+		# Routes must exist and be distinct - route ids may be 0
+		valid = (
+			(first_route_index is not None) and
+			(second_route_index is not None) and
+			(first_route_index != second_route_index)
 			)
 
 		# If a valid merge combination is found create a tentative route and evaluate
-		if first_route_index and second_route_index:
+		if valid:
 
 			# Creating tentative route
 			combined_route = (
-				routes[first_route_index][:-1] +
-				routes[second_route_index][1:]
+				route_store.routes[first_route_index][:-1] +
+				route_store.routes[second_route_index][1:]
 				)
 
 			# Finding the best of the tentative routes
@@ -205,8 +174,8 @@ def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
 			for objective, limits in objectives.items():
 
 				combined_values[objective] = (
-					route_values[first_route_index][objective] +
-					route_values[second_route_index][objective] +
+					route_store.values[first_route_index][objective] +
+					route_store.values[second_route_index][objective] +
 					delta[objective]
 					)
 
@@ -217,11 +186,11 @@ def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
 			if feasible:
 
 				# Adding the merged route
-				routes[first_route_index] = combined_route
-				route_values[first_route_index] = combined_values
+				route_store.merge(
+					first_route_index, second_route_index,
+					combined_route, combined_values,
+					)
 
-				# Removing the individual routes
-				routes.remove(routes[second_route_index])
-				route_values.remove(route_values[second_route_index])
+	routes, route_values = route_store.lists()
 
 	return routes, route_values, success
\ No newline at end of file
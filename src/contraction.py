@@ -0,0 +1,544 @@
+'''
+Module for Contraction Hierarchy (CH) preprocessing and many-to-many queries
+
+A contraction hierarchy is built over an atlas for a primary field (ex: 'length').
+Nodes are contracted one at a time in order of importance and shortcut links are
+added between the remaining neighbors of a contracted node wherever no witness
+path exists which is as short as the path through the contracted node. Every link
+(original or shortcut) carries the cumulative values of all fields so secondary
+fields (ex: 'time') are accumulated along the unpacked path of each shortcut at
+build time.
+
+Queries only relax links towards more important nodes. A many-to-many table is
+filled with the bucket method: one backward upward search per target fills buckets
+at the nodes it settles and one forward upward search per source scans the buckets
+of the nodes it settles.
+
+The hierarchy is built once per atlas and persisted (see hierarchy_filename) so
+that adjacency computation does not repeat full Dijkstra searches on every run.
+
+Cutoffs are applied to the values of the shortest path by the primary field. This
+differs from .dijkstra.dijkstra only where a secondary cutoff is exceeded on the
+primary shortest path but not on some longer path.
+'''
+
+import os
+import numpy as np
+
+from heapq import heappop, heappush, heapify
+from sys import float_info
+
+from .progress_bar import ProgressBar
+
+class ContractionHierarchy():
+    '''
+    Contraction hierarchy over the nodes of an atlas
+
+    nodes - list of atlas node ids in index order
+    rank - int64 array, contraction order of each node
+    fields - list of fields, the first is the primary field
+    up_* - CSR of links v -> w with rank[w] > rank[v], keyed by v
+    down_* - CSR of links u -> v with rank[u] > rank[v], keyed by v
+
+    *_weights is a float64 array of shape (n_fields, n_links) and *_middle holds
+    the contracted node of each shortcut (-1 for original links).
+    '''
+
+    def __init__(self, nodes, rank, fields, up, down):
+
+        self.nodes = list(nodes)
+        self.node_to_idx = {node: idx for idx, node in enumerate(self.nodes)}
+        self.rank = np.asarray(rank, dtype = np.int64)
+        self.fields = list(fields)
+
+        self.up_indptr, self.up_indices, self.up_weights, self.up_middle = up
+        self.down_indptr, self.down_indices, self.down_weights, self.down_middle = down
+
+        self._lists = None
+
+    def number_of_shortcuts(self):
+
+        return int((self.up_middle >= 0).sum() + (self.down_middle >= 0).sum())
+
+    def lists(self):
+        '''
+        Python list views of the upward and downward CSR arrays
+        '''
+
+        if self._lists is None:
+
+            self._lists = (
+                (
+                    self.up_indptr.tolist(),
+                    self.up_indices.tolist(),
+                    self.up_weights.T.tolist(),
+                    ),
+                (
+                    self.down_indptr.tolist(),
+                    self.down_indices.tolist(),
+                    self.down_weights.T.tolist(),
+                    ),
+                )
+
+        return self._lists
+
+    def unpack(self, source, target):
+        '''
+        Returns the atlas nodes passed on the link source -> target of the hierarchy
+        '''
+
+        u = self.node_to_idx[source]
+        w = self.node_to_idx[target]
+
+        return [self.nodes[idx] for idx in self._unpack(u, w)]
+
+    def _link_middle(self, u, w):
+
+        if self.rank[w] > self.rank[u]:
+
+            start, end = self.up_indptr[u], self.up_indptr[u + 1]
+            idx = np.flatnonzero(self.up_indices[start:end] == w)[0]
+
+            return self.up_middle[start + idx]
+
+        else:
+
+            start, end = self.down_indptr[w], self.down_indptr[w + 1]
+            idx = np.flatnonzero(self.down_indices[start:end] == u)[0]
+
+            return self.down_middle[start + idx]
+
+    def _unpack(self, u, w):
+
+        middle = self._link_middle(u, w)
+
+        if middle < 0:
+
+            return [u, w]
+
+        return self._unpack(u, middle)[:-1] + self._unpack(middle, w)
+
+def hierarchy_filename(atlas_file):
+    '''
+    Default file for the hierarchy of an atlas - stored next to the atlas
+    '''
+
+    return os.path.splitext(atlas_file)[0] + '.ch.npz'
+
+def save_hierarchy(hierarchy, filename):
+
+    np.savez(
+        filename,
+        nodes = np.asarray(hierarchy.nodes),
+        rank = hierarchy.rank,
+        fields = np.asarray(hierarchy.fields),
+        up_indptr = hierarchy.up_indptr,
+        up_indices = hierarchy.up_indices,
+        up_weights = hierarchy.up_weights,
+        up_middle = hierarchy.up_middle,
+        down_indptr = hierarchy.down_indptr,
+        down_indices = hierarchy.down_indices,
+        down_weights = hierarchy.down_weights,
+        down_middle = hierarchy.down_middle,
+        )
+
+def load_hierarchy(filename):
+
+    with np.load(filename) as data:
+
+        return ContractionHierarchy(
+            data['nodes'].tolist(),
+            data['rank'],
+            data['fields'].tolist(),
+            (
+                data['up_indptr'],
+                data['up_indices'],
+                data['up_weights'],
+                data['up_middle'],
+                ),
+            (
+                data['down_indptr'],
+                data['down_indices'],
+                data['down_weights'],
+                data['down_middle'],
+                ),
+            )
+
+# Functions for building hierarchies
+
+def _witness_search(out_links, source, excluded, limit, settle_limit):
+    '''
+    Bounded Dijkstra on the primary field of the uncontracted graph which avoids
+    excluded. Returns tentative distances which are upper bounds on the shortest
+    witness path.
+    '''
+
+    dist = {source: 0.}
+    heap = [(0., source)]
+    settled = 0
+
+    while heap:
+
+        d, v = heappop(heap)
+
+        if d > dist[v]:
+
+            continue # stale entry
+
+        if (d > limit) or (settled >= settle_limit):
+
+            break
+
+        settled += 1
+
+        for u, (value, _) in out_links[v].items():
+
+            if u == excluded:
+
+                continue
+
+            du = d + value[0]
+
+            if du < dist.get(u, float_info.max):
+
+                dist[u] = du
+                heappush(heap, (du, u))
+
+    return dist
+
+def _shortcuts(out_links, in_links, v, settle_limit):
+    '''
+    Shortcuts required to contract v
+    '''
+
+    shortcuts = []
+
+    for u, (value_uv, _) in in_links[v].items():
+
+        candidates = [(w, value_vw) for w, (value_vw, _) in out_links[v].items() if w != u]
+
+        if not candidates:
+
+            continue
+
+        limit = value_uv[0] + max(value_vw[0] for _, value_vw in candidates)
+
+        dist = _witness_search(out_links, u, v, limit, settle_limit)
+
+        for w, value_vw in candidates:
+
+            if dist.get(w, float_info.max) <= value_uv[0] + value_vw[0]:
+
+                continue # witness found
+
+            shortcuts.append((u, w, [a + b for a, b in zip(value_uv, value_vw)]))
+
+    return shortcuts
+
+def _priority(out_links, in_links, deleted, v, shortcuts):
+    '''
+    Edge difference plus number of contracted neighbors
+    '''
+
+    return len(shortcuts) - len(in_links[v]) - len(out_links[v]) + deleted[v]
+
+def _to_csr(links, n, n_fields):
+
+    indptr = np.zeros(n + 1, dtype = np.int64)
+    np.cumsum([len(row) for row in links], out = indptr[1:])
+
+    indices = np.array(
+        [link[0] for row in links for link in row], dtype = np.int64,
+        )
+
+    weights = np.array(
+        [link[1] for row in links for link in row], dtype = np.float64,
+        ).reshape((-1, n_fields)).T.copy()
+
+    middle = np.array(
+        [link[2] for row in links for link in row], dtype = np.int64,
+        )
+
+    return indptr, indices, weights, middle
+
+def build_hierarchy(compiled, fields, **kwargs):
+    '''
+    Builds a ContractionHierarchy from a .csr.CompiledGraph. fields[0] is the
+    primary field, all fields are accumulated on shortcuts.
+
+    settle_limit bounds the number of nodes settled by each witness search.
+    Smaller values build faster but add more (unneeded) shortcuts.
+    '''
+
+    kwargs.setdefault('settle_limit', 500)
+    kwargs.setdefault('pb_kwargs', {'disp': True})
+
+    fields = list(fields)
+    n_fields = len(fields)
+    settle_limit = kwargs['settle_limit']
+
+    n = compiled.number_of_nodes()
+    indptr, indices, columns = compiled.lists()
+    columns = [columns[field] for field in fields]
+
+    # Remaining (uncontracted) graph - links are (values, middle) tuples
+    out_links = [{} for _ in range(n)]
+    in_links = [{} for _ in range(n)]
+
+    for v in range(n):
+
+        for idx_link in range(indptr[v], indptr[v + 1]):
+
+            w = indices[idx_link]
+
+            value = [column[idx_link] for column in columns]
+
+            # Self-loops and untraversable links are never on shortest paths
+            if (w == v) or (value[0] != value[0]):
+
+                continue
+
+            existing = out_links[v].get(w)
+
+            if (existing is None) or (value[0] < existing[0][0]):
+
+                out_links[v][w] = (value, -1)
+                in_links[w][v] = (value, -1)
+
+    deleted = [0] * n
+
+    heap = [
+        (_priority(
+            out_links, in_links, deleted, v,
+            _shortcuts(out_links, in_links, v, settle_limit)), v
+        ) for v in range(n)]
+
+    heapify(heap)
+
+    rank = np.zeros(n, dtype = np.int64)
+    up = [None] * n
+    down = [None] * n
+
+    for order in ProgressBar(range(n), **kwargs['pb_kwargs']):
+
+        # Lazy updates - priorities are recomputed when popped
+        while True:
+
+            _, v = heappop(heap)
+
+            shortcuts = _shortcuts(out_links, in_links, v, settle_limit)
+            priority = _priority(out_links, in_links, deleted, v, shortcuts)
+
+            if heap and (priority > heap[0][0]):
+
+                heappush(heap, (priority, v))
+
+            else:
+
+                break
+
+        rank[v] = order
+
+        # All remaining neighbors are more important than v
+        up[v] = [(w, value, middle) for w, (value, middle) in out_links[v].items()]
+        down[v] = [(u, value, middle) for u, (value, middle) in in_links[v].items()]
+
+        for u in in_links[v]:
+
+            del out_links[u][v]
+            deleted[u] += 1
+
+        for w in out_links[v]:
+
+            del in_links[w][v]
+            deleted[w] += 1
+
+        out_links[v] = {}
+        in_links[v] = {}
+
+        for u, w, value in shortcuts:
+
+            existing = out_links[u].get(w)
+
+            if (existing is None) or (value[0] < existing[0][0]):
+
+                out_links[u][w] = (value, v)
+                in_links[w][u] = (value, v)
+
+    return ContractionHierarchy(
+        compiled.nodes,
+        rank,
+        fields,
+        _to_csr(up, n, n_fields),
+        _to_csr(down, n, n_fields),
+        )
+
+# Functions for querying hierarchies
+
+def _upward_search(indptr, indices, values, source, limit, n_fields):
+    '''
+    Dijkstra restricted to links towards more important nodes
+    '''
+
+    dist = {}
+    seen = {source: 0.}
+
+    heap = [(0., source, [0.] * n_fields)]
+
+    while heap:
+
+        d, v, value = heappop(heap)
+
+        if v in dist:
+
+            continue
+
+        dist[v] = value
+
+        for idx_link in range(indptr[v], indptr[v + 1]):
+
+            u = indices[idx_link]
+            link_value = values[idx_link]
+
+            du = d + link_value[0]
+
+            if (du > limit) or (u in dist) or (du >= seen.get(u, float_info.max)):
+
+                continue
+
+            seen[u] = du
+            heappush(heap, (du, u, [a + b for a, b in zip(value, link_value)]))
+
+    return dist
+
+def iterate_many_to_many(hierarchy, sources, targets, weights, **kwargs):
+    '''
+    Generator yielding the results of each source in source order.
+    See many_to_many for details on inputs.
+    '''
+
+    kwargs.setdefault('pb_kwargs', {'disp': True})
+    kwargs.setdefault('depots', [])
+
+    fields = list(weights.keys())
+
+    if fields[0] != hierarchy.fields[0]:
+
+        raise ValueError(
+            f"Primary weight {fields[0]} does not match hierarchy {hierarchy.fields[0]}"
+            )
+
+    missing = [field for field in fields if field not in hierarchy.fields]
+
+    if missing:
+
+        raise KeyError(f"Fields {missing} are not in the hierarchy")
+
+    field_indices = [hierarchy.fields.index(field) for field in fields]
+
+    limits = [limit if limit > 0 else float_info.max for limit in weights.values()]
+
+    depots = set(kwargs['depots'])
+
+    (up_indptr, up_indices, up_values), (down_indptr, down_indices, down_values) = (
+        hierarchy.lists()
+        )
+
+    node_to_idx = hierarchy.node_to_idx
+    nodes = hierarchy.nodes
+    n_fields = len(hierarchy.fields)
+
+    target_indices = [node_to_idx[target] for target in dict.fromkeys(targets)]
+
+    # Backward searches are bounded by the largest forward bound
+    if depots.intersection(sources):
+
+        backward_limit = float_info.max
+
+    else:
+
+        backward_limit = limits[0]
+
+    buckets = {}
+
+    for t in target_indices:
+
+        dist = _upward_search(
+            down_indptr, down_indices, down_values, t, backward_limit, n_fields,
+            )
+
+        for v, value in dist.items():
+
+            buckets.setdefault(v, []).append((t, value))
+
+    for source in ProgressBar(list(sources), **kwargs['pb_kwargs']):
+
+        s = node_to_idx[source]
+
+        if source in depots:
+
+            source_limits = [float_info.max] * len(limits)
+
+        else:
+
+            source_limits = limits
+
+        dist = _upward_search(
+            up_indptr, up_indices, up_values, s, source_limits[0], n_fields,
+            )
+
+        best = {}
+        results = []
+
+        for v, forward in dist.items():
+
+            for t, backward in buckets.get(v, ()):
+
+                d = forward[0] + backward[0]
+
+                current = best.get(t)
+
+                if (current is None) or (d < current[0]):
+
+                    best[t] = [a + b for a, b in zip(forward, backward)]
+
+        for t in target_indices:
+
+            if t not in best:
+
+                continue
+
+            value = [best[t][idx] for idx in field_indices]
+
+            feasible = all(
+                value[idx] <= source_limits[idx] for idx in range(len(fields))
+                )
+
+            if feasible:
+
+                results.append({
+                    'source': source,
+                    'target': nodes[t],
+                    **{field: float(value[idx]) for idx, field in enumerate(fields)},
+                    })
+
+        yield results
+
+def many_to_many(hierarchy, sources, targets, weights, **kwargs):
+    '''
+    Computes routes between all sources and targets (atlas nodes) using the
+    bucket method. weights is {field: cutoff} as for .dijkstra.dijkstra and its
+    first field must be the primary field of the hierarchy. Searches from depots
+    are unbounded.
+
+    Returns a list of {'source', 'target', **fields} dictionaries in the format
+    of .adjacency.multiple_source_dijkstra.
+    '''
+
+    results = []
+
+    for result in iterate_many_to_many(hierarchy, sources, targets, weights, **kwargs):
+
+        results.extend(result)
+
+    return results
@@ -0,0 +1,135 @@
+'''
+Module for compiled (frozen) graphs
+
+A compiled graph stores the adjacency of a NetworkX graph in Compressed Sparse Row
+(CSR) form. Node ids are mapped to contiguous integer indices and the links leaving
+node index i are stored in indices[indptr[i]:indptr[i + 1]]. Each routing field
+(ex: 'length', 'time') is stored as one float64 column aligned with indices.
+
+Compiling an atlas is done once, after which searches operate on flat arrays
+rather than on NetworkX dictionaries.
+
+Link values follow the conventions of .dijkstra.dijkstra: missing fields default
+to 1 and fields set to None are stored as NaN (link not traversable).
+'''
+
+import numpy as np
+
+class CompiledGraph():
+    '''
+    CSR representation of a graph for a fixed set of fields
+
+    nodes - list of node ids in index order
+    node_to_idx - {node id: index}
+    indptr - int64 array of length n_nodes + 1
+    indices - int64 array of length n_links
+    weights - {field: float64 array of length n_links}
+    '''
+
+    def __init__(self, nodes, indptr, indices, weights, directed = False):
+
+        self.nodes = list(nodes)
+        self.node_to_idx = {node: idx for idx, node in enumerate(self.nodes)}
+        self.indptr = np.asarray(indptr, dtype = np.int64)
+        self.indices = np.asarray(indices, dtype = np.int64)
+        self.weights = {
+            field: np.asarray(value, dtype = np.float64) \
+            for field, value in weights.items()
+            }
+        self.directed = directed
+
+        self._lists = None
+
+    @property
+    def fields(self):
+
+        return list(self.weights.keys())
+
+    def number_of_nodes(self):
+
+        return len(self.nodes)
+
+    def number_of_links(self):
+
+        return len(self.indices)
+
+    def lists(self):
+        '''
+        Python list views of the CSR arrays for use in tight Python loops.
+        Element access on lists is considerably faster than on NumPy arrays.
+        Built on first call and cached.
+        '''
+
+        if self._lists is None:
+
+            self._lists = (
+                self.indptr.tolist(),
+                self.indices.tolist(),
+                {field: value.tolist() for field, value in self.weights.items()},
+                )
+
+        return self._lists
+
+    def reverse(self):
+        '''
+        Returns the compiled graph with all links reversed
+        '''
+
+        if not self.directed:
+
+            return self
+
+        n = self.number_of_nodes()
+
+        sources = np.repeat(np.arange(n), np.diff(self.indptr))
+        order = np.lexsort((sources, self.indices))
+
+        indptr = np.zeros(n + 1, dtype = np.int64)
+        np.cumsum(np.bincount(self.indices, minlength = n), out = indptr[1:])
+
+        return CompiledGraph(
+            self.nodes,
+            indptr,
+            sources[order],
+            {field: value[order] for field, value in self.weights.items()},
+            directed = True,
+            )
+
+def compile_graph(graph, fields):
+    '''
+    Freezes graph into a CompiledGraph containing a column for each of fields.
+    Link order within each row follows the order of graph._adj.
+    '''
+
+    fields = list(fields)
+
+    nodes = list(graph.nodes)
+    node_to_idx = {node: idx for idx, node in enumerate(nodes)}
+
+    n_links = sum(len(links) for links in graph._adj.values())
+
+    indptr = np.zeros(len(nodes) + 1, dtype = np.int64)
+    indices = np.zeros(n_links, dtype = np.int64)
+    weights = {field: np.ones(n_links, dtype = np.float64) for field in fields}
+
+    idx = 0
+
+    for source_idx, source in enumerate(nodes):
+
+        for target, link in graph._adj[source].items():
+
+            indices[idx] = node_to_idx[target]
+
+            for field in fields:
+
+                value = link.get(field, 1)
+
+                weights[field][idx] = np.nan if value is None else value
+
+            idx += 1
+
+        indptr[source_idx + 1] = idx
+
+    return CompiledGraph(
+        nodes, indptr, indices, weights, directed = graph.is_directed(),
+        )
@@ -38,7 +38,8 @@ def dijkstra(graph, sources, targets = [], weights = {}, return_paths = False):
 
     targets : iterable of nodes - optionally empty
         Ending nodes for path. Search is halted when all targets are reached. If empty
-        all nodes will be reached if possible.
+        all nodes will be reached if possible. Targets which cannot be reached within
+        the cutoffs do not prevent termination as the search is bounded by the cutoffs.
 
     return_paths : Boolean
         Boolean whether or not to compute paths dictionary. If False None
@@ -75,13 +76,10 @@ def dijkstra(graph, sources, targets = [], weights = {}, return_paths = False):
     dist = {}  # dictionary of final distances
     seen = {}
 
-    if len(targets) == 0:
-
-        remaining_targets=["null"]
-
-    else:
-
-        remaining_targets=targets[:]
+    # Targets are held as a hash set with a counter of targets not yet settled.
+    # If there are no targets the counter never reaches 0.
+    targets = set(targets)
+    remaining_targets = len(targets)
 
     # fringe is heapq with 3-tuples (distance,c,node)
     # use the count c to avoid comparing nodes (may not be able to)
@@ -106,14 +104,13 @@ def dijkstra(graph, sources, targets = [], weights = {}, return_paths = False):
 
         dist[v] = d
 
-        if v in remaining_targets:
-
-            remaining_targets.remove(v)
+        if v in targets:
 
+            remaining_targets -= 1
 
-        if len(remaining_targets) == 0:
+            if remaining_targets == 0:
 
-            break
+                break
 
         for u, e in graph_succ[v].items():
 
@@ -152,4 +149,162 @@ def dijkstra(graph, sources, targets = [], weights = {}, return_paths = False):
 
                     paths[u] = {'source': paths[v]['source'], 'value': value}
 
-    return dist, paths
\ No newline at end of file
+    return dist, paths
+
+def compiled_dijkstra(compiled, sources, targets = [], weights = {}, return_paths = False):
+    """Uses Dijkstra's algorithm to find shortest weighted paths on a CompiledGraph
+
+    Array-backed equivalent of dijkstra. Node state (settled values and best seen
+    primary value) is held in preallocated index-addressed lists rather than in
+    dictionaries keyed by node id and link values are read from the CSR columns
+    of the compiled graph.
+
+    Parameters
+    ----------
+    compiled : .csr.CompiledGraph
+        Compiled graph containing a column for every field in weights.
+
+    sources, targets, weights, return_paths :
+        See dijkstra. weights is not modified.
+
+    Returns
+    -------
+    distance : dictionary
+        A mapping from node to shortest distance to that node from one
+        of the source nodes.
+
+    paths : dictionary
+        See dijkstra.
+    """
+
+    fields = list(weights.keys())
+    n_weights = len(fields)
+
+    missing = [field for field in fields if field not in compiled.weights]
+
+    if missing:
+
+        raise KeyError(f"Fields {missing} were not compiled")
+
+    limits = [limit if limit > 0 else float_info.max for limit in weights.values()]
+
+    indptr, indices, columns = compiled.lists()
+    columns = [columns[field] for field in fields]
+
+    nodes = compiled.nodes
+    node_to_idx = compiled.node_to_idx
+    n = len(nodes)
+
+    null_value = {w: 0. for w in weights}
+
+    if return_paths:
+        paths = {source: {'source': source, 'value': null_value} for source in sources}
+        path_sources = {}
+    else:
+        paths = None
+
+    primary = columns[0]
+    limit_0 = limits[0]
+
+    dist = [None] * n  # final distances by node index
+    seen = [None] * n  # best primary distance pushed to the fringe by node index
+    settled = []
+
+    target_indices = {node_to_idx[t] for t in targets}
+    remaining_targets = len(target_indices)
+
+    c = count()
+    fringe = []
+
+    for source in sources:
+
+        source_idx = node_to_idx[source]
+
+        seen[source_idx] = 0
+        heappush(fringe, ([0,] * n_weights, next(c), source_idx))
+
+        if return_paths:
+            path_sources[source_idx] = source
+
+    while fringe:
+
+        (d, _, v) = heappop(fringe)
+
+        if dist[v] is not None:
+
+            continue  # already searched this node.
+
+        dist[v] = d
+        settled.append(v)
+
+        if v in target_indices:
+
+            remaining_targets -= 1
+
+            if remaining_targets == 0:
+
+                break
+
+        d_0 = d[0]
+
+        for idx_link in range(indptr[v], indptr[v + 1]):
+
+            u = indices[idx_link]
+
+            vu_dist_0 = d_0 + primary[idx_link]
+
+            # NaN primary values fail every comparison - link is not traversable
+            if not vu_dist_0 <= limit_0:
+
+                continue
+
+            u_dist = dist[u]
+
+            if u_dist is None:
+
+                # Only improving links need the full value vector
+                u_seen = seen[u]
+
+                if u_seen is not None and not vu_dist_0 < u_seen:
+
+                    continue
+
+            elif not vu_dist_0 < u_dist[0]:
+
+                continue
+
+            vu_dist = [d[idx] + columns[idx][idx_link] for idx in range(n_weights)]
+
+            cutoff_exceeded = False
+
+            for idx in range(1, n_weights):
+
+                if vu_dist[idx] > limits[idx]:
+
+                    cutoff_exceeded = True
+
+                    break
+
+            if cutoff_exceeded:
+
+                continue
+
+            if u_dist is not None:
+
+                raise ValueError("Contradictory paths found:", "negative weights?")
+
+            seen[u] = vu_dist_0
+
+            heappush(fringe, (vu_dist, next(c), u))
+
+            if paths is not None:
+
+                path_sources[u] = path_sources[v]
+
+                value = {w: vu_dist[idx] for idx, w in enumerate(weights)}
+
+                paths[nodes[u]] = {'source': path_sources[v], 'value': value}
+
+    dist = {nodes[v]: dist[v] for v in settled}
+
+    return dist, paths
@@ -25,6 +25,9 @@ NLG dictionaries can be created from DataFrames without links
 
 NLG dictionaries are saved as .json files
 
+Graphs may also be saved in a binary format (see .binary) which can be memory-mapped
+and opened lazily. Functions ending in _file select the format by file extension.
+
 !!!!! In this module graph refers to a networkx graph, nlg to a NLG graph !!!!!
 
 NLG terminology maps to NetworkX terminology as follows:
@@ -34,6 +37,7 @@ Link -> edge, adj
 Nodes of a graph may also be referred to as vertices
 '''
 
+import os
 import json
 import momepy
 import numpy as np
@@ -43,6 +47,8 @@ import networkx as nx
 
 from scipy.spatial import KDTree
 
+from .binary import BINARY_EXTENSION, BinaryGraph, graph_to_binary, graph_from_binary
+
 # Functions for NLG JSON handling 
 
 class NpEncoder(json.JSONEncoder):
@@ -121,6 +127,79 @@ def graph_from_json(filename, **kwargs):
 
 	return graph_from_nlg(nlg, **kwargs)
 
+# Functions for file handling by extension
+
+def is_binary(filename):
+
+	return os.path.splitext(filename)[1] == BINARY_EXTENSION
+
+def graph_to_file(graph, filename, **kwargs):
+	'''
+	Writes graph to JSON or binary depending on extension, overwrites previous
+	'''
+
+	if is_binary(filename):
+
+		graph_to_binary(graph, filename)
+
+	else:
+
+		graph_to_json(graph, filename, **kwargs)
+
+def graph_from_file(filename, **kwargs):
+	'''
+	Loads graph from JSON or binary depending on extension
+	'''
+
+	if is_binary(filename):
+
+		return graph_from_binary(filename)
+
+	else:
+
+		return graph_from_json(filename, **kwargs)
+
+def open_graph(filename, **kwargs):
+	'''
+	Opens graph without building NetworkX dictionaries where possible. Returns a
+	BinaryGraph for binary files and a NetworkX graph for JSON files.
+	'''
+
+	if is_binary(filename):
+
+		return BinaryGraph(filename)
+
+	else:
+
+		return graph_from_json(filename, **kwargs)
+
+def nlg_to_file(nlg, filename):
+	'''
+	Writes nlg to JSON or binary depending on extension, overwrites previous
+	'''
+
+	if is_binary(filename):
+
+		graph_to_binary(graph_from_nlg(nlg), filename)
+
+	else:
+
+		nlg_to_json(nlg, filename)
+
+def json_to_binary(json_file, binary_file):
+	'''
+	Converts NLG JSON to binary
+	'''
+
+	graph_to_binary(graph_from_json(json_file), binary_file)
+
+def binary_to_json(binary_file, json_file):
+	'''
+	Converts binary to NLG JSON
+	'''
+
+	graph_to_json(graph_from_binary(binary_file), json_file)
+
 # Functions for converting between NLG and NetworkX graphs
 
 def graph_from_nlg(nlg, **kwargs):
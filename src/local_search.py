@@ -0,0 +1,468 @@
+'''
+Module for deterministic route improvement by local search
+
+Routes are improved by first-improvement local search with the operators:
+
+two_opt - reversal of a segment within a route
+or_opt - moving a segment of 1 to max_segment nodes within a route
+relocate - moving a node to another route
+swap - exchanging nodes between two routes
+cross - exchanging segments of 0 to max_segment and 1 to max_segment nodes
+between two routes
+
+Moves are evaluated in constant time by .simulated_annealing.RouteState and are
+generated from granular neighborhoods (see .simulated_annealing.granular_neighbors):
+each move places a node next to one of its nearest neighbors. Don't-look bits
+keep nodes whose neighborhoods gave no improving move from being scanned again
+until a move changes the routes around them.
+'''
+
+import numpy as np
+
+from collections import deque
+
+from .simulated_annealing import RouteState, leg_feasibility, granular_neighbors
+from .savings_stochastic import expectation, _link_samples
+
+def _intra_moves(state, i, j, operators, max_segment):
+	'''
+	Yields (weights, violations, route function) of moves placing the node at
+	position i of state next to the node at position j
+	'''
+
+	n_stops = len(state.route) - 2
+
+	if 'two_opt' in operators:
+
+		if i < j - 1:
+
+			yield (
+				*state.evaluate_two_opt(i + 1, j),
+				lambda: state.two_opted(i + 1, j),
+				)
+
+		elif j < i - 1:
+
+			yield (
+				*state.evaluate_two_opt(j + 1, i),
+				lambda: state.two_opted(j + 1, i),
+				)
+
+	if 'or_opt' in operators:
+
+		for k in range(1, max_segment + 1):
+
+			# Segment starting with the node moved in front of the neighbor
+			if (i + k - 1 <= n_stops) and not (i <= j <= i + k):
+
+				yield (
+					*state.evaluate_move_segment(i, k, j),
+					lambda k = k: state.moved_segment(i, k, j),
+					)
+
+			# Segment ending with the node moved in front of the neighbor
+			start = i - k + 1
+
+			if (k > 1) and (start >= 1) and not (start <= j <= i + 1):
+
+				yield (
+					*state.evaluate_move_segment(start, k, j),
+					lambda start = start, k = k: state.moved_segment(start, k, j),
+					)
+
+def _inter_moves(state_a, i, state_b, j, operators, max_segment):
+	'''
+	Yields (weights, violations, route function) pairs for routes a and b of
+	moves placing the node at position i of state_a in front of the node at
+	position j of state_b
+	'''
+
+	node = state_a.route[i]
+
+	if 'relocate' in operators:
+
+		yield (
+			(*state_a.evaluate_remove(i), lambda: state_a.removed(i)),
+			(*state_b.evaluate_insert(node, j), lambda: state_b.inserted(node, j)),
+			)
+
+	if ('swap' in operators) and (j > 1):
+
+		other = state_b.route[j - 1]
+
+		yield (
+			(
+				*state_a.evaluate_replace(i, other),
+				lambda: state_a.replaced(i, other),
+				),
+			(
+				*state_b.evaluate_replace(j - 1, node),
+				lambda: state_b.replaced(j - 1, node),
+				),
+			)
+
+	if 'cross' in operators:
+
+		n_stops_a = len(state_a.route) - 2
+		n_stops_b = len(state_b.route) - 2
+
+		for k_a in range(0, max_segment + 1):
+
+			if i + k_a > n_stops_a:
+
+				break
+
+			for k_b in range(1, max_segment + 1):
+
+				if j + k_b - 1 > n_stops_b:
+
+					break
+
+				yield (
+					(
+						*state_a.evaluate_exchange(i + 1, k_a, state_b, j, j + k_b),
+						lambda k_a = k_a, k_b = k_b: state_a.exchanged(
+							i + 1, k_a, state_b, j, j + k_b),
+						),
+					(
+						*state_b.evaluate_exchange(j, k_b, state_a, i + 1, i + 1 + k_a),
+						lambda k_a = k_a, k_b = k_b: state_b.exchanged(
+							j, k_b, state_a, i + 1, i + 1 + k_a),
+						),
+					)
+
+def local_search(adjacency, routes, leg_bounds, route_bounds, stop_weights, **kwargs):
+	'''
+	Improves routes by first-improvement local search with don't-look bits.
+
+	Inputs are as for .simulated_annealing.anneal_routes. Route costs are the
+	route weights weighted by objective_weights (defaults to the first weight
+	only). Moves are only applied if all changed routes are valid and the cost
+	falls by more than tolerance.
+
+	kwargs:
+
+	operators - operators in the order they are tried
+	neighbors - size of the granular neighborhoods
+	max_segment - maximum segment length of or_opt and cross
+	leg_feasible - (n, n) array of feasible legs (see leg_feasibility)
+	max_moves - maximum number of applied moves
+
+	Routes emptied by moves are dropped.
+	'''
+
+	operators = kwargs.get(
+		'operators', ('two_opt', 'or_opt', 'relocate', 'swap', 'cross'),
+		)
+
+	max_segment = kwargs.get('max_segment', 3)
+	tolerance = kwargs.get('tolerance', 1e-9)
+	max_moves = kwargs.get('max_moves', np.inf)
+
+	adjacency = np.asarray(adjacency, dtype = np.float64)
+
+	objective_weights = kwargs.get('objective_weights', None)
+
+	if objective_weights is None:
+
+		objective_weights = np.zeros(len(adjacency))
+		objective_weights[0] = 1
+
+	objective_weights = np.asarray(objective_weights, dtype = np.float64)
+
+	leg_feasible = kwargs.get('leg_feasible', None)
+
+	if leg_feasible is None:
+
+		leg_feasible = leg_feasibility(adjacency, leg_bounds)
+
+	neighbors = granular_neighbors(adjacency, leg_feasible, kwargs.get('neighbors', 10))
+
+	states = [
+		RouteState(
+			adjacency, route, leg_bounds, route_bounds, stop_weights, leg_feasible,
+			) for route in routes
+		]
+
+	# {node: (route index, position)}
+	positions = {}
+
+	def update(a, route):
+
+		states[a].update(route)
+
+		for position, node in enumerate(route[1:-1], 1):
+
+			positions[node] = (a, position)
+
+	def around(node):
+
+		a, i = positions[node]
+		route = states[a].route
+
+		return route[max([i - 1, 1]):min([i + 2, len(route) - 1])]
+
+	for a, state in enumerate(states):
+
+		update(a, state.route)
+
+	def improve(node):
+		'''
+		Applies the first improving move of node and returns the nodes around the
+		changes or None if no improving move was found
+		'''
+
+		a, i = positions[node]
+		state_a = states[a]
+
+		for neighbor in neighbors[node]:
+
+			if neighbor not in positions:
+
+				continue
+
+			b, j = positions[neighbor]
+
+			if a == b:
+
+				cost = objective_weights @ state_a.weights
+
+				for weights, violations, route in _intra_moves(
+					state_a, i, j, operators, max_segment
+					):
+
+					improving = objective_weights @ weights < cost - tolerance
+
+					if improving and state_a.valid(weights, violations):
+
+						touched = around(node) + around(neighbor)
+
+						update(a, route())
+
+						return touched + around(node) + around(neighbor)
+
+				continue
+
+			state_b = states[b]
+
+			cost = objective_weights @ (state_a.weights + state_b.weights)
+
+			for (weights_a, violations_a, route_a), (weights_b, violations_b, route_b) \
+				in _inter_moves(state_a, i, state_b, j, operators, max_segment):
+
+				improving = (
+					objective_weights @ (weights_a + weights_b) < cost - tolerance
+					)
+
+				valid = improving and (
+					state_a.valid(weights_a, violations_a) and
+					state_b.valid(weights_b, violations_b)
+					)
+
+				if valid:
+
+					touched = around(node) + around(neighbor)
+
+					# Both routes are built before either state is updated
+					new_route_a, new_route_b = route_a(), route_b()
+
+					update(a, new_route_a)
+					update(b, new_route_b)
+
+					return touched + around(node) + around(neighbor)
+
+		return None
+
+	queue = deque(positions.keys())
+	active = set(queue)
+
+	moves = 0
+
+	while queue and (moves < max_moves):
+
+		node = queue.popleft()
+		active.discard(node)
+
+		touched = improve(node)
+
+		if touched is None:
+
+			continue
+
+		moves += 1
+
+		for other in [node] + touched:
+
+			if other not in active:
+
+				queue.append(other)
+				active.add(other)
+
+	return [state.route for state in states if len(state.route) > 2]
+
+def expected_arrays(graph, objectives, **kwargs):
+	'''
+	Returns the (n_objectives, n, n) adjacency and (n_objectives, n) stop weights
+	of graph as risk-adjusted expectations (see .savings_stochastic.expectation
+	and kwarg z) of link, depot leg, and node samples in the order of graph.nodes.
+	Legs between a node and its depot are the depot legs of .savings_stochastic
+	.add_depot_legs. Links are read from kwarg tensor if given.
+	'''
+
+	z = kwargs.get('z', 0)
+	tensor = kwargs.get('tensor', None)
+
+	nodes_list = list(graph.nodes)
+	nodes = graph._node
+	fields = list(objectives.keys())
+	index = {node: idx for idx, node in enumerate(nodes_list)}
+
+	n = len(nodes_list)
+
+	if tensor is None:
+
+		adjacency = np.full((len(fields), n, n), np.inf)
+
+		for source, links in graph._adj.items():
+
+			for target, link in links.items():
+
+				for k, field in enumerate(fields):
+
+					adjacency[k, index[source], index[target]] = expectation(
+						np.asarray(link[field], dtype = np.float64), z = z,
+						)
+
+	else:
+
+		idx = tensor.index(nodes_list)
+
+		adjacency = []
+
+		for field in fields:
+
+			values = np.asarray(tensor.field(field)[np.ix_(idx, idx)], dtype = np.float64)
+
+			if values.ndim > 2:
+
+				values = expectation(values, z = z, axis = -1)
+
+			adjacency.append(values)
+
+		adjacency = np.stack(adjacency)
+
+	stop_weights = np.zeros((len(fields), n))
+
+	for node, data in nodes.items():
+
+		if data['depot'] == node:
+
+			continue
+
+		for k, field in enumerate(fields):
+
+			depot_leg = expectation(
+				np.asarray(data['depot_leg'][field], dtype = np.float64), z = z,
+				)
+
+			adjacency[k, index[data['depot']], index[node]] = depot_leg
+			adjacency[k, index[node], index[data['depot']]] = depot_leg
+
+			stop_weights[k, index[node]] = expectation(
+				np.asarray(data[field], dtype = np.float64), z = z,
+				)
+
+	return adjacency, stop_weights
+
+def route_values(graph, route, objectives, **kwargs):
+	'''
+	Returns the route values of route: the sum of the depot legs, the links
+	between consecutive stops, and the values of the stops
+	'''
+
+	nodes = graph._node
+	fields = list(objectives.keys())
+
+	stops = route[1:-1]
+
+	values = {
+		field: (
+			nodes[stops[0]]['depot_leg'][field] +
+			nodes[stops[-1]]['depot_leg'][field] +
+			sum([nodes[stop][field] for stop in stops])
+			) for field in fields
+		}
+
+	if len(stops) > 1:
+
+		link_values = _link_samples(
+			graph, kwargs.get('tensor', None), stops, fields,
+			np.arange(len(stops) - 1), np.arange(1, len(stops)),
+			).sum(axis = 1)
+
+		for k, field in enumerate(fields):
+
+			values[field] = values[field] + link_values[k]
+
+	return values
+
+def improve_routes(graph, routes, objectives, **kwargs):
+	'''
+	Improves routes on graph (as returned by .savings_stochastic.savings) by
+	local_search over the expected_arrays of graph. Objective weights, leg bounds,
+	and route bounds are those of objectives. Legs to and from depots are not
+	bounded as in the savings algorithms. Routes are only exchanged between routes
+	of the same depot. Sums of risk-adjusted expectations are not below the
+	risk-adjusted expectations of sums for z >= 0 so route bounds are checked
+	conservatively. Returns routes and route values.
+
+	kwargs are passed to expected_arrays, route_values, and local_search.
+	'''
+
+	nodes_list = list(graph.nodes)
+	nodes = graph._node
+	index = {node: idx for idx, node in enumerate(nodes_list)}
+
+	adjacency, stop_weights = expected_arrays(graph, objectives, **kwargs)
+
+	leg_bounds = [limits['leg'] for limits in objectives.values()]
+	route_bounds = [limits['route'] for limits in objectives.values()]
+	objective_weights = [limits['weight'] for limits in objectives.values()]
+
+	leg_feasible = leg_feasibility(adjacency, leg_bounds)
+
+	for node, data in nodes.items():
+
+		if data['depot'] == node:
+
+			leg_feasible[index[node], :] = True
+			leg_feasible[:, index[node]] = True
+
+	depot_routes = {}
+
+	for route in routes:
+
+		depot_routes.setdefault(route[0], []).append([index[node] for node in route])
+
+	improved_routes = []
+
+	for indexed_routes in depot_routes.values():
+
+		improved = local_search(
+			adjacency, indexed_routes, leg_bounds, route_bounds, stop_weights,
+			**{
+				**kwargs,
+				'objective_weights': objective_weights,
+				'leg_feasible': leg_feasible,
+				},
+			)
+
+		improved_routes.extend(
+			[[nodes_list[idx] for idx in route] for route in improved]
+			)
+
+	improved_values = [
+		route_values(graph, route, objectives, **kwargs) for route in improved_routes
+		]
+
+	return improved_routes, improved_values
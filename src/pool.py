@@ -0,0 +1,42 @@
+'''
+Module for process pools
+
+Pools use the fork start method where it is available so that worker state is
+inherited without pickling, otherwise it is shipped once to each worker. Worker
+state is passed to initialize_worker at start-up and read from worker_state by
+the functions mapped over the pool.
+'''
+
+import os
+import multiprocessing
+
+# State inherited by (fork) or shipped once to (spawn) worker processes
+worker_state = {}
+
+def initialize_worker(state):
+	'''
+	Stores {name: value} in worker_state
+	'''
+
+	worker_state.update(state)
+
+def worker_count(workers):
+	'''
+	Returns workers or, if workers < 1, the number of available cores
+	'''
+
+	if workers < 1:
+
+		return os.cpu_count()
+
+	return workers
+
+def process_pool(workers, initializer = initialize_worker, initargs = ()):
+	'''
+	Returns a multiprocessing.Pool of worker_count(workers) processes
+	'''
+
+	methods = multiprocessing.get_all_start_methods()
+	context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+
+	return context.Pool(worker_count(workers), initializer, initargs)
@@ -1,9 +1,29 @@
+import os
+import json
 import time
+import zlib
 import numpy as np
 
-from scipy.special import factorial
+from scipy.special import ndtri
+
+from .tensor import AdjacencyTensor
+from .binary import write_arrays, read_arrays, _default
 
 class MultiNormalSample():
+    '''
+    Samples from a clipped mixture of normal distributions
+
+    loc, scale, weight - component means, standard deviations, and weights
+    clip - [lower, upper] bounds of samples
+    seed - seed of the Generator
+
+    If pool_size is given samples are sliced (cyclically) from a pre-generated
+    pool of pool_size samples instead of being drawn on each call. If pool_file
+    is also given the pool is stored in the binary container format of .binary
+    and is memory-mapped. A pool file is reused if it was generated with the same
+    distribution, seed, and size and is regenerated otherwise. Pools of unseeded
+    samplers are always regenerated.
+    '''
 
     def __init__(self, **kwargs):
 
@@ -11,46 +31,157 @@ class MultiNormalSample():
         self.scale = kwargs.get('scale', [1])
         self.weight = kwargs.get('weight', [1])
         self.clip = kwargs.get('clip', [-np.inf, np.inf])
-        self.rng = np.random.default_rng(kwargs.get('seed', None))
+        self.seed = kwargs.get('seed', None)
+        self.rng = np.random.default_rng(self.seed)
 
         self.n = len(self.loc)
         self.bins = np.cumsum(self.weight)
 
-    def random(self, size = (1, )):
-        # t0 = time.time()
+        self.pool = None
+        self.position = 0
+
+        if kwargs.get('pool_size', None) is not None:
+
+            self.pool = self.sample_pool(kwargs['pool_size'], kwargs.get('pool_file', None))
+
+    def draw(self, size = (1, )):
+        '''
+        Draws samples. Component indices are drawn first and each component only
+        draws as many normal samples as it was selected for.
+        '''
 
         rn = self.rng.random(size)
-        # print(time.time() - t0)
 
         distribution_idx = np.digitize(rn, self.bins)
-        # print(time.time() - t0)
 
         vals = np.zeros(size)
 
         for idx in range(self.n):
-            add = distribution_idx == idx
 
-            vals += self.rng.normal(self.loc[idx], self.scale[idx], size) * add
-        # print(time.time() - t0)
+            selected = distribution_idx == idx
+
+            vals[selected] = self.rng.normal(
+                self.loc[idx], self.scale[idx], np.count_nonzero(selected),
+                )
 
         return np.clip(vals, *self.clip)
 
-def queuing_time(l, m, c):
+    def sample_pool(self, pool_size, pool_file = None):
+        '''
+        Returns a pool of pool_size samples, memory-mapped from pool_file if given
+        '''
+
+        if pool_file is None:
+
+            return self.draw((pool_size, ))
+
+        metadata = json.loads(json.dumps({
+            'loc': self.loc,
+            'scale': self.scale,
+            'weight': self.weight,
+            'clip': self.clip,
+            'seed': self.seed,
+            'pool_size': pool_size,
+            }, default = _default))
+
+        # Without a seed a stored pool is not a draw of this sampler
+        if (self.seed is not None) and os.path.isfile(pool_file):
+
+            arrays, file_metadata = read_arrays(pool_file)
+
+            if file_metadata == metadata:
+
+                return arrays['pool']
+
+        write_arrays(pool_file, {'pool': self.draw((pool_size, ))}, metadata)
+
+        return read_arrays(pool_file)[0]['pool']
+
+    def random(self, size = (1, )):
+
+        if self.pool is None:
+
+            return self.draw(size)
+
+        n = int(np.prod(size))
+
+        if self.position + n <= len(self.pool):
+
+            samples = np.array(self.pool[self.position:self.position + n])
+
+        else:
+
+            samples = self.pool[np.arange(self.position, self.position + n) % len(self.pool)]
+
+        self.position = (self.position + n) % len(self.pool)
+
+        return samples.reshape(size)
+
+def erlang_b(a, c):
+    '''
+    Erlang B blocking probability for offered load a and c servers by the
+    recurrence B_k = a * B_(k - 1) / (k + a * B_(k - 1)), B_0 = 1 which does
+    not overflow for large c. a and c are broadcast and c is rounded down to
+    integers. The recurrence is run once up to the largest c and B is recorded
+    for each distinct c when reached.
+    '''
+
+    a, c = np.broadcast_arrays(
+        np.asarray(a, dtype = np.float64), np.asarray(c).astype(np.int64),
+        )
+
+    b = np.ones(a.shape)
+    result = np.ones(a.shape)
+
+    levels = {}
+
+    for value in np.unique(c).tolist():
 
-    rho = l / (c * m)
+        levels[value] = c == value
 
-    k = np.arange(0, c, 1)
+    for k in range(1, int(c.max(initial = 0)) + 1):
 
-    p_0 = 1 / (
-        sum([(c * rho) ** k / factorial(k) for k in k]) +
-        (c * rho) ** c / (factorial(c) * (1 - rho))
-    )
+        b = a * b / (k + a * b)
 
-    l_q = (p_0 * (l / m) ** c * rho) / (factorial(c) * (1 - rho))
+        if k in levels:
 
-    w_q = l_q / l
+            result[levels[k]] = b[levels[k]]
 
-    return w_q
+    return result
+
+def queuing_time_array(l, m, c):
+    '''
+    Vectorized queuing time for arrays of arrival frequency l, service frequency
+    m, and number of servers c (broadcast). Values are those of the closed form
+    p_0 * (l / m) ** c * rho / (c! * (1 - rho)) / l computed as C / (c * m)
+    where C = c * B / (c - a * (1 - B)) is the Erlang C probability of waiting
+    and B = erlang_b(a, c) with a = l / m.
+    '''
+
+    l, m, c = np.broadcast_arrays(
+        np.asarray(l, dtype = np.float64),
+        np.asarray(m, dtype = np.float64),
+        np.asarray(c).astype(np.int64),
+        )
+
+    a = l / m
+
+    b = erlang_b(a, c)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+
+        probability = c * b / (c - a * (1 - b))
+
+        return probability / (c * m)
+
+def queuing_time(l, m, c):
+    '''
+    Queuing time for arrival frequency l, service frequency m, and c servers
+    evaluated by queuing_time_array. Values for the same c share one pass of the
+    erlang_b recurrence. Scalar inputs return a scalar.
+    '''
+
+    return queuing_time_array(l, m, c)[()]
 
 def arrival_frequency(node, rng, size):
 
@@ -109,7 +240,245 @@ class Charger_Time():
 
         node['time'] = node['queue_time'] + node['test_time']
 
+# Bulk sampling
+
+# Streams of common random numbers
+LINK_SPEED_STREAM = 0
+ARRIVAL_STREAM = 1
+SERVICE_STREAM = 2
+TEST_STREAM = 3
+
+def _splitmix64(x):
+
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+
+    return x ^ (x >> np.uint64(31))
+
+def node_keys(nodes):
+    '''
+    uint64 keys for node ids which do not depend on node order or process. Integer
+    ids are used directly, other ids are hashed with CRC32 of their string.
+    '''
+
+    keys = [
+        int(node) & 0xFFFFFFFFFFFFFFFF if isinstance(node, (int, np.integer)) \
+        else zlib.crc32(str(node).encode('utf-8')) for node in nodes
+        ]
+
+    return np.array(keys, dtype = np.uint64)
+
+def common_random_numbers(keys, size, seed, stream):
+    '''
+    Uniform samples on [0, 1) of shape (n, size) for keys of shape (n, ) or
+    (n, k). Samples are a hash of (seed, stream, key, sample index) so the same
+    key receives the same samples regardless of which other keys are sampled.
+    '''
+
+    keys = np.asarray(keys, dtype = np.uint64).reshape((len(keys), -1))
+
+    state = _splitmix64(np.array([seed or 0], dtype = np.uint64))
+    state = _splitmix64(state ^ np.array([stream], dtype = np.uint64))
+    state = np.repeat(state, len(keys))
+
+    for column in keys.T:
+
+        state = _splitmix64(state ^ column)
+
+    state = _splitmix64(state[:, None] ^ np.arange(size, dtype = np.uint64)[None, :])
+
+    return (state >> np.uint64(11)) * (2. ** -53)
+
+class UniformSampler():
+    '''
+    Draws (n, size) blocks of uniform samples from a seeded Generator or, if crn,
+    as common random numbers keyed by node ids (see common_random_numbers)
+    '''
+
+    def __init__(self, seed = None, crn = False):
+
+        self.seed = seed
+        self.crn = crn
+        self.rng = np.random.default_rng(seed)
+
+    def random(self, keys, size, stream):
+
+        if self.crn:
+
+            return common_random_numbers(keys, size, self.seed, stream)
+
+        return self.rng.random((len(keys), size))
+
+def _triangular(u, left, mode, right):
+    '''
+    Inverse CDF of the triangular distribution
+    '''
+
+    split = (mode - left) / (right - left)
+
+    return np.where(
+        u < split,
+        left + np.sqrt(u * (right - left) * (mode - left)),
+        right - np.sqrt((1 - u) * (right - left) * (right - mode)),
+        )
+
+def sample_link_parameters(graph, parameters):
+    '''
+    Bulk equivalent of assign_link_parameters. Samples for all links are drawn
+    into contiguous (n_links, n_samples) blocks and links hold row views of the
+    blocks. If parameters['common_random_numbers'] the speed multiplier of a link
+    depends only on rng_seed and its end nodes so scenarios share draws.
+
+    As in assign_link_parameters links are visited in the order of graph._adj so
+    the link of an undirected graph, which is shared by both of its directions,
+    is divided by one multiplier per direction.
+    '''
+
+    shape = parameters['n_samples']
+
+    sampler = UniformSampler(
+        parameters['rng_seed'], parameters.get('common_random_numbers', False),
+        )
+
+    visits = [
+        (source, target, link) for source, adjacency in graph._adj.items() \
+        for target, link in adjacency.items()
+        ]
+
+    if sampler.crn:
+
+        nodes = list(graph.nodes)
+        node_to_idx = {node: idx for idx, node in enumerate(nodes)}
+
+        keys = node_keys(nodes)[np.array(
+            [[node_to_idx[visit[0]], node_to_idx[visit[1]]] for visit in visits],
+            dtype = np.int64,
+            ).reshape((-1, 2))]
+
+    else:
+
+        keys = visits
+
+    k_0 = parameters['link_speed_multiplier'][0]
+    k_1 = parameters['link_speed_multiplier'][1] - k_0
+    mult = sampler.random(keys, shape, LINK_SPEED_STREAM) * k_1 + k_0
+
+    # Unique link of each visit and how many times it was visited before
+    link_idx = {}
+    links = []
+    n_visits = []
+    visit_link = np.zeros(len(visits), dtype = np.int64)
+    visit_order = np.zeros(len(visits), dtype = np.int64)
+
+    for idx, (_, _, link) in enumerate(visits):
+
+        if id(link) not in link_idx:
+
+            link_idx[id(link)] = len(links)
+            links.append(link)
+            n_visits.append(0)
+
+        visit_link[idx] = link_idx[id(link)]
+        visit_order[idx] = n_visits[visit_link[idx]]
+        n_visits[visit_link[idx]] += 1
+
+    time = np.array([link['time'] for link in links], dtype = np.float64)
+    length = np.array([link['length'] for link in links], dtype = np.float64)
+
+    time = np.repeat(time[:, None], shape, axis = 1)
+
+    # Divisions are applied in visit order
+    for order in range(visit_order.max(initial = -1) + 1):
+
+        selected = visit_order == order
+        time[visit_link[selected]] /= mult[selected]
+
+    length = np.repeat(length[:, None], shape, axis = 1)
+    price = length * parameters['efficiency'] / 3.6e6 * parameters['energy_price']
+
+    for idx, link in enumerate(links):
+
+        link['time'] = time[idx]
+        link['length'] = length[idx]
+        link['price'] = price[idx]
+
+    return graph
+
+def sample_node_parameters(graph, parameters):
+    '''
+    Bulk equivalent of assign_node_parameters. Arrival, service, and test samples
+    for all nodes are drawn into contiguous (n_nodes, n_samples) blocks by inverse
+    transform of uniform blocks and queuing times are computed in one call. If
+    parameters['common_random_numbers'] samples of a node depend only on rng_seed
+    and its id so scenarios share draws.
+    '''
+
+    size = parameters['n_samples']
+
+    sampler = UniformSampler(
+        parameters['rng_seed'], parameters.get('common_random_numbers', False),
+        )
+
+    nodes = list(graph.nodes)
+    data = [graph._node[node] for node in nodes]
+    keys = node_keys(nodes)
+
+    rural = np.array([bool(node['rural']) for node in data])
+    n_ac = np.array([node['n_ac'] for node in data], dtype = np.float64)
+    n_dc = np.array([node['n_dc'] for node in data], dtype = np.float64)
+
+    # Arrival frequency
+    u = sampler.random(keys, size, ARRIVAL_STREAM)
+
+    l = np.where(
+        rural[:, None], 1 / (u * 10800 + 1800), 1 / (u * 3600 + 600),
+        )
+
+    # Service frequency - as in service_frequency AC and DC ports share rates
+    n_ac_service = np.fmax(1, n_ac)
+    n_dc_service = np.fmax(0, n_dc)
+
+    c = np.maximum(n_ac_service + n_dc_service, 1)
+
+    u = sampler.random(keys, size, SERVICE_STREAM)
+
+    rate = 1 / (np.clip(37.8 + 14.8 * ndtri(u), 1, 100) / 80 * 3600)
+    m = (n_ac_service + n_dc_service)[:, None] * rate / c[:, None]
+
+    queue_time = queuing_time(l, m, c[:, None])
+
+    # Test time
+    u = sampler.random(keys, size, TEST_STREAM)
+
+    n_test = np.fmax(0, n_ac) + np.fmax(0, n_dc)
+
+    test_time = n_test[:, None] * _triangular(u, 240, 480, 720)
+
+    time = queue_time + test_time
+    length = np.zeros((len(nodes), size))
+    price = np.zeros((len(nodes), size))
+
+    for idx, node in enumerate(data):
+
+        node['queue_time'] = queue_time[idx]
+        node['test_time'] = test_time[idx]
+        node['time'] = time[idx]
+        node['length'] = length[idx]
+        node['price'] = price[idx]
+
+    return graph
+
 def assign_link_parameters(graph, parameters):
+    '''
+    Assigns stochastic link time, length, and price samples. Unless
+    parameters['bulk_sampling'] is False samples are drawn by
+    sample_link_parameters.
+    '''
+
+    if parameters.get('bulk_sampling', True):
+
+        return sample_link_parameters(graph, parameters)
 
     # mns = MultiNormalSample(
     #     **parameters['link_traffic'],
@@ -134,7 +503,58 @@ def assign_link_parameters(graph, parameters):
 
     return graph
 
+def assign_tensor_parameters(tensor, parameters):
+    '''
+    Stochastic equivalent of assign_link_parameters for an AdjacencyTensor with
+    'time' and 'length' fields. Returns a tensor of shape
+    (3, n, n, n_samples) with fields 'time', 'length', and 'price'. If
+    parameters['common_random_numbers'] multipliers are drawn as for
+    sample_link_parameters.
+    '''
+
+    shape = parameters['n_samples']
+    rng = np.random.default_rng(parameters['rng_seed'])
+
+    time = tensor.field('time')
+    length = tensor.field('length')
+
+    k_0 = parameters['link_speed_multiplier'][0]
+    k_1 = parameters['link_speed_multiplier'][1] - k_0
+
+    if parameters.get('common_random_numbers', False):
+
+        keys = node_keys(tensor.nodes)
+
+        keys = np.vstack((
+            np.repeat(keys, len(keys)), np.tile(keys, len(keys)),
+            )).T
+
+        mult = common_random_numbers(
+            keys, shape, parameters['rng_seed'], LINK_SPEED_STREAM,
+            ).astype(np.float32).reshape(time.shape + (shape, )) * k_1 + k_0
+
+    else:
+
+        mult = rng.random(time.shape + (shape, ), dtype = np.float32) * k_1 + k_0
+
+    values = np.empty((3, ) + time.shape + (shape, ), dtype = np.float32)
+
+    values[0] = time[..., None] / mult
+    values[1] = length[..., None]
+    values[2] = values[1] * (parameters['efficiency'] / 3.6e6 * parameters['energy_price'])
+
+    return AdjacencyTensor(tensor.nodes, ['time', 'length', 'price'], values)
+
 def assign_node_parameters(graph, parameters):
+    '''
+    Assigns stochastic node time, length, and price samples. Unless
+    parameters['bulk_sampling'] is False samples are drawn by
+    sample_node_parameters.
+    '''
+
+    if parameters.get('bulk_sampling', True):
+
+        return sample_node_parameters(graph, parameters)
 
     size = parameters['n_samples']
     seed = parameters['rng_seed']
@@ -0,0 +1,71 @@
+'''
+Module for route bookkeeping in savings algorithms
+
+Routes are lists of the form [depot, node, ..., node, depot]. Savings algorithms
+repeatedly look up the route whose first non-depot node is a given node and the
+route whose last non-depot node is a given node. RouteStore keeps both lookups as
+hash indices which are updated on each merge so that lookups do not scan routes.
+'''
+
+class RouteStore():
+	'''
+	Routes and route values keyed by route id with start and end node indices
+
+	routes - {route id: route}
+	values - {route id: route values}
+	starts - {route[1]: route id}
+	ends - {route[-2]: route id}
+	'''
+
+	def __init__(self, routes, route_values):
+
+		self.routes = {}
+		self.values = {}
+		self.starts = {}
+		self.ends = {}
+
+		for route_id, (route, values) in enumerate(zip(routes, route_values)):
+
+			self.routes[route_id] = route
+			self.values[route_id] = values
+
+			self.starts[route[1]] = route_id
+			self.ends[route[-2]] = route_id
+
+	def __len__(self):
+
+		return len(self.routes)
+
+	def find(self, node_0, node_1):
+		'''
+		Returns the id of the route starting with node_0 and the id of the route
+		ending with node_1. Ids are None where no such route exists.
+		'''
+
+		return self.starts.get(node_0, None), self.ends.get(node_1, None)
+
+	def merge(self, first, second, route, values):
+		'''
+		Replaces route first with route and removes route second
+		'''
+
+		for route_id in (first, second):
+
+			del self.starts[self.routes[route_id][1]]
+			del self.ends[self.routes[route_id][-2]]
+
+		self.routes[first] = route
+		self.values[first] = values
+
+		del self.routes[second]
+		del self.values[second]
+
+		self.starts[route[1]] = first
+		self.ends[route[-2]] = first
+
+	def lists(self):
+		'''
+		Returns routes and route values as lists in route id order
+		'''
+
+		return list(self.routes.values()), list(self.values.values())
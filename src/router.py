@@ -11,11 +11,11 @@ import networkx as nx
 from copy import deepcopy
 from operator import itemgetter
 from itertools import product as iter_prod
-from scipy.special import factorial
 
 from .utilities import ProgressBar
 from .graph import subgraph
 from .dijkstra import dijkstra
+from .rng import queuing_time
 from .clarke_wright  import *
 from .simulated_annealing import *
 
@@ -225,25 +225,12 @@ def assignments(nodes, **kwargs):
     return node_to_idx, idx_to_node
 
 def expected_queuing_time(l = 1 / 600, m = 1 / (45 * 60), c = 1):
+    '''
+    Expected queuing time for arrival frequency l, service frequency m, and c
+    servers. Arrays are evaluated in one call (see .rng.queuing_time).
+    '''
 
-    rho = l / (c * m)
-
-    k = np.arange(0, c, 1)
-
-    # print(sum([(c * rho) ** k / factorial(k) for k in k]))
-
-    # print((c * rho) ** k, factorial(k).sum())
-
-    p_0 = 1 / (
-        sum([(c * rho) ** k / factorial(k) for k in k]) +
-        (c * rho) ** c / (factorial(c) * (1 - rho))
-    )
-
-    l_q = (p_0 * (l / m) ** c * rho) / (factorial(c) * (1 - rho))
-
-    w_q = l_q / l
-
-    return w_q
+    return queuing_time(l, m, c)
 
 def produce_bounds(subgraphs, vehicles, weights, **kwargs):
 
@@ -256,30 +243,20 @@ def produce_bounds(subgraphs, vehicles, weights, **kwargs):
 
     for key, subgraph in subgraphs.items():
 
-        qt = np.zeros(subgraph.number_of_nodes())
-        idx = 0
-
-        for node_id, node in subgraph._node.items():
-
-            n_ac = np.nanmax([0, node['n_ac']])
-            n_dc = np.nanmax([0, node['n_dc']])
-
-            c = max([1, n_ac + n_dc])
-
-            # print(n_ac, n_dc, c)
-
-            if node['rural']:
+        nodes = list(subgraph._node.values())
 
-                l = 1 / (np.random.rand() * 10800 + 1800)
+        n_ac = np.fmax(0, np.array([node['n_ac'] for node in nodes], dtype = float))
+        n_dc = np.fmax(0, np.array([node['n_dc'] for node in nodes], dtype = float))
 
-            else:
+        c = np.maximum(1, n_ac + n_dc)
 
-                l = 1 / (np.random.rand() * 3600 + 600)
+        rural = np.array([bool(node['rural']) for node in nodes])
+        rn = np.random.rand(len(nodes))
 
-            m = 1 / 2400
+        l = np.where(rural, 1 / (rn * 10800 + 1800), 1 / (rn * 3600 + 600))
+        m = 1 / 2400
 
-            qt[idx] = expected_queuing_time(l, m, c)[0] + tt * c
-            idx += 1
+        qt = expected_queuing_time(l, m, c) + tt * c
 
         delays[key] = qt
 
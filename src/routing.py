@@ -17,6 +17,9 @@ from heapq import heappop, heappush
 from itertools import count
 from sys import float_info, maxsize
 
+from .progress_bar import ProgressBar
+from .pool import worker_state, worker_count, process_pool
+
 default_states = {
     'network_distance': {
         'field': 'network_distance',
@@ -26,7 +29,7 @@ default_states = {
 }
 
 default_objectives = {
-    'network_distance': lambda x: np.mean(s['network_distance']),
+    'network_distance': lambda x: np.mean(x['network_distance'], axis = -1),
 }
 
 class Charger_Old():
@@ -380,4 +383,635 @@ def dijkstra(graph, origins, **kwargs):
 
                     paths[target] = paths[source]
 
-    return path_costs, path_values, paths
\ No newline at end of file
+    return path_costs, path_values, paths
+
+class RoutingGraph():
+    '''
+    Graph compiled for fast_dijkstra
+
+    Links are stored in CSR layout (indptr, indices) and node and link values of
+    the states are stored as sample arrays of shape (n_states, n_cases) per node
+    and per link. Values of fields which are missing are 1 as in dijkstra.
+
+    nodes - list of node ids in index order
+    node_to_idx - {node id: index}
+    states - list of state keys in state index order
+    indptr, indices - CSR adjacency
+    node_values - (n_nodes, n_states, n_cases) array
+    link_values - (n_links, n_states, n_cases) array
+    chargers - {node index: Charger}
+    '''
+
+    def __init__(
+        self, nodes, states, indptr, indices, node_values, link_values, chargers,
+        ):
+
+        self.nodes = list(nodes)
+        self.node_to_idx = {node: idx for idx, node in enumerate(self.nodes)}
+        self.states = list(states)
+        self.state_to_idx = {key: idx for idx, key in enumerate(self.states)}
+
+        self.indptr = indptr
+        self.indices = indices
+        self.node_values = node_values
+        self.link_values = link_values
+        self.chargers = chargers
+
+    @property
+    def n_cases(self):
+
+        return self.node_values.shape[2]
+
+    def number_of_nodes(self):
+
+        return len(self.nodes)
+
+    def number_of_links(self):
+
+        return len(self.indices)
+
+def compile_routing_graph(graph, states, n_cases = None):
+    '''
+    Builds a RoutingGraph for graph and states. n_cases defaults to the length of
+    the initial values of the states.
+    '''
+
+    if n_cases is None:
+
+        n_cases = max(len(np.atleast_1d(info['initial'])) for info in states.values())
+
+    nodes = list(graph.nodes)
+    node_to_idx = {node: idx for idx, node in enumerate(nodes)}
+    fields = [info['field'] for info in states.values()]
+
+    n = len(nodes)
+
+    indptr = np.zeros(n + 1, dtype = np.int64)
+    np.cumsum([len(graph._adj[node]) for node in nodes], out = indptr[1:])
+
+    indices = np.empty(indptr[-1], dtype = np.int64)
+    link_values = np.empty((indptr[-1], len(fields), n_cases))
+    node_values = np.empty((n, len(fields), n_cases))
+    chargers = {}
+
+    for idx, node in enumerate(nodes):
+
+        data = graph._node[node]
+
+        for k, field in enumerate(fields):
+
+            node_values[idx, k] = data.get(field, 1)
+
+        if 'charger' in data:
+
+            chargers[idx] = data['charger']
+
+        for position, (target, link) in enumerate(graph._adj[node].items()):
+
+            indices[indptr[idx] + position] = node_to_idx[target]
+
+            for k, field in enumerate(fields):
+
+                link_values[indptr[idx] + position, k] = link.get(field, 1)
+
+    return RoutingGraph(
+        nodes, states.keys(), indptr, indices, node_values, link_values, chargers,
+        )
+
+def fast_dijkstra(graph, origins, **kwargs):
+    '''
+    Array implementation of dijkstra (SCRAM-D) for additive states.
+
+    graph may be a NetworkX graph or a RoutingGraph (see compile_routing_graph).
+    Inputs and outputs are as for dijkstra with the below differences:
+
+    states - state values are integrated by addition, 'update' is not used.
+
+    objectives and constraints - functions are called once per settled node on
+    the candidate values of all of its links. Values are passed as
+    {state: (n_links, n_cases) array} and functions must reduce over the last
+    axis and return one value per link, e.g.
+    lambda x: np.mean(x['time'], axis = -1).
+
+    Per-node values are held in a preallocated (n_nodes, n_states, n_cases) array
+    and the heap holds only (cost, count, node index). Chargers are applied in
+    place to views of the candidate values.
+
+    paths - if return_paths paths are lists of nodes from the origin.
+    '''
+
+    destinations = kwargs.get('destinations', [])
+    states = kwargs.get('states', default_states)
+    constraints = kwargs.get('constraints', {})
+    objectives = kwargs.get('objectives', default_objectives)
+    return_paths = kwargs.get('return_paths', False)
+
+    if not isinstance(graph, RoutingGraph):
+
+        graph = compile_routing_graph(graph, states)
+
+    node_to_idx = graph.node_to_idx
+    nodes = graph.nodes
+    indptr = graph.indptr.tolist()
+    indices = graph.indices
+    link_values = graph.link_values
+    node_values = graph.node_values
+    chargers = graph.chargers
+
+    n = graph.number_of_nodes()
+    state_index = [graph.state_to_idx[key] for key in states.keys()]
+
+    initial = np.empty((len(state_index), graph.n_cases))
+
+    for k, info in zip(state_index, states.values()):
+
+        initial[k] = info['initial']
+
+    values = np.empty_like(node_values) # per-node values of best candidates
+    best = np.full(n, np.inf) # best candidate cost per node
+    settled = np.zeros(n, dtype = bool)
+    predecessor = np.full(n, -1, dtype = np.int64)
+
+    destinations = set(node_to_idx[node] for node in destinations)
+    destinations_to_visit = len(destinations) if destinations else maxsize
+    destinations_visited = 0
+
+    path_costs = {}
+    path_values = {}
+
+    c = count()
+    heap = []
+
+    for origin in origins:
+
+        idx = node_to_idx[origin]
+
+        values[idx] = initial
+        best[idx] = 0
+
+        heappush(heap, (0, next(c), idx))
+
+    while heap:
+
+        cost, _, source = heappop(heap)
+
+        if settled[source] or (cost > best[source]):
+
+            continue # already searched this node or stale entry
+
+        settled[source] = True
+
+        path_costs[nodes[source]] = cost
+        path_values[nodes[source]] = {
+            key: values[source, k] for key, k in zip(states.keys(), state_index)
+            }
+
+        if source in destinations:
+
+            destinations_visited += 1
+
+        if destinations_visited >= destinations_to_visit:
+
+            break
+
+        start, end = indptr[source], indptr[source + 1]
+
+        targets = indices[start:end]
+        keep = ~settled[targets]
+
+        if not keep.any():
+
+            continue
+
+        targets = targets[keep]
+
+        # Candidate values of all links (n_links, n_states, n_cases)
+        candidates = values[source] + link_values[start:end][keep] + node_values[targets]
+
+        candidate_values = {
+            key: candidates[:, k] for key, k in zip(states.keys(), state_index)
+            }
+
+        costs = np.zeros(len(targets))
+
+        for key, info in objectives.items():
+
+            costs += info(candidate_values)
+
+        feasible = np.ones(len(targets), dtype = bool)
+
+        for key, info in constraints.items():
+
+            feasible &= info(candidate_values)
+
+        improved = np.flatnonzero(feasible & (costs < best[targets]))
+
+        for position in improved.tolist():
+
+            target = int(targets[position])
+
+            # Charging if available - applied in place to candidate views
+            if target in chargers:
+
+                chargers[target].update(
+                    {key: value[position] for key, value in candidate_values.items()}
+                    )
+
+            best[target] = costs[position]
+            values[target] = candidates[position]
+            predecessor[target] = source
+
+            heappush(heap, (costs[position], next(c), target))
+
+    if return_paths:
+
+        paths = {}
+
+        for node in path_costs.keys():
+
+            path = [node_to_idx[node]]
+
+            while predecessor[path[-1]] >= 0:
+
+                path.append(predecessor[path[-1]])
+
+            paths[node] = [nodes[idx] for idx in path[::-1]]
+
+    else:
+
+        paths = None
+
+    return path_costs, path_values, paths
+
+def _dominated(vectors, vector):
+    '''
+    Checks if vector is weakly dominated by any row of vectors
+    '''
+
+    if not len(vectors):
+
+        return False
+
+    return bool(np.any(np.all(np.asarray(vectors) <= vector, axis = 1)))
+
+def pareto_dijkstra(graph, origins, **kwargs):
+    '''
+    Label-setting multi-criteria variant of fast_dijkstra.
+
+    Instead of one label per node a bounded Pareto set of labels is kept for
+    each node. Labels are compared on their objective vectors (one value per
+    objective, e.g. risk-adjusted time and price) and a label is discarded if
+    any settled label of its node is at least as good in every objective.
+    Labels are settled in order of the sum of their objectives so settled labels
+    are never dominated by labels settled later. At most max_labels labels are
+    settled per node.
+
+    Inputs are as for fast_dijkstra with the below addition:
+
+    max_labels - maximum number of labels per node, default 8.
+
+    Returns
+    -------
+
+    path_costs : dictionary
+        {node: [{objective: value}]} objective values of the Pareto labels.
+
+    path_values : dictionary
+        {node: [{state: values}]} state values of the Pareto labels.
+
+    paths : dictionary
+        {node: [list of nodes]} paths of the Pareto labels. If
+        return_paths == False then None will be returned.
+    '''
+
+    destinations = kwargs.get('destinations', [])
+    states = kwargs.get('states', default_states)
+    constraints = kwargs.get('constraints', {})
+    objectives = kwargs.get('objectives', default_objectives)
+    return_paths = kwargs.get('return_paths', False)
+    max_labels = kwargs.get('max_labels', 8)
+
+    if not isinstance(graph, RoutingGraph):
+
+        graph = compile_routing_graph(graph, states)
+
+    node_to_idx = graph.node_to_idx
+    nodes = graph.nodes
+    indptr = graph.indptr.tolist()
+    indices = graph.indices
+    link_values = graph.link_values
+    node_values = graph.node_values
+    chargers = graph.chargers
+
+    n = graph.number_of_nodes()
+    state_index = [graph.state_to_idx[key] for key in states.keys()]
+
+    initial = np.empty((len(state_index), graph.n_cases))
+
+    for k, info in zip(state_index, states.values()):
+
+        initial[k] = info['initial']
+
+    # Labels are held in flat lists indexed by label id
+    label_values = []
+    label_vectors = []
+    label_nodes = []
+    label_parents = []
+
+    settled = [[] for _ in range(n)] # settled label ids per node
+    settled_vectors = [[] for _ in range(n)]
+    full = np.zeros(n, dtype = bool)
+
+    destinations = set(node_to_idx[node] for node in destinations)
+    destinations_to_fill = len(destinations) if destinations else maxsize
+    destinations_filled = 0
+
+    c = count()
+    heap = []
+
+    for origin in origins:
+
+        label_values.append(initial.copy())
+        label_vectors.append(np.zeros(len(objectives)))
+        label_nodes.append(node_to_idx[origin])
+        label_parents.append(-1)
+
+        heappush(heap, (0, next(c), len(label_values) - 1))
+
+    while heap:
+
+        _, _, label = heappop(heap)
+
+        source = label_nodes[label]
+        vector = label_vectors[label]
+
+        if full[source] or _dominated(settled_vectors[source], vector):
+
+            continue
+
+        settled[source].append(label)
+        settled_vectors[source].append(vector)
+
+        if len(settled[source]) >= max_labels:
+
+            full[source] = True
+
+            if source in destinations:
+
+                destinations_filled += 1
+
+        if destinations_filled >= destinations_to_fill:
+
+            break
+
+        start, end = indptr[source], indptr[source + 1]
+
+        targets = indices[start:end]
+        keep = ~full[targets]
+
+        if not keep.any():
+
+            continue
+
+        targets = targets[keep]
+
+        candidates = (
+            label_values[label] + link_values[start:end][keep] + node_values[targets]
+            )
+
+        candidate_values = {
+            key: candidates[:, k] for key, k in zip(states.keys(), state_index)
+            }
+
+        vectors = np.zeros((len(targets), len(objectives)))
+
+        for k, (key, info) in enumerate(objectives.items()):
+
+            vectors[:, k] = info(candidate_values)
+
+        feasible = np.ones(len(targets), dtype = bool)
+
+        for key, info in constraints.items():
+
+            feasible &= info(candidate_values)
+
+        for position in np.flatnonzero(feasible).tolist():
+
+            target = int(targets[position])
+
+            if _dominated(settled_vectors[target], vectors[position]):
+
+                continue
+
+            # Charging if available - applied in place to candidate views
+            if target in chargers:
+
+                chargers[target].update(
+                    {key: value[position] for key, value in candidate_values.items()}
+                    )
+
+            label_values.append(candidates[position])
+            label_vectors.append(vectors[position])
+            label_nodes.append(target)
+            label_parents.append(label)
+
+            heappush(heap, (vectors[position].sum(), next(c), len(label_values) - 1))
+
+    path_costs = {}
+    path_values = {}
+    paths = {} if return_paths else None
+
+    for idx in range(n):
+
+        if not settled[idx]:
+
+            continue
+
+        node = nodes[idx]
+
+        path_costs[node] = [
+            dict(zip(objectives.keys(), label_vectors[label].tolist())) \
+            for label in settled[idx]
+            ]
+
+        path_values[node] = [
+            {key: label_values[label][k] for key, k in zip(states.keys(), state_index)} \
+            for label in settled[idx]
+            ]
+
+        if return_paths:
+
+            paths[node] = []
+
+            for label in settled[idx]:
+
+                path = [label]
+
+                while label_parents[path[-1]] >= 0:
+
+                    path.append(label_parents[path[-1]])
+
+                paths[node].append([nodes[label_nodes[l]] for l in path[::-1]])
+
+    return path_costs, path_values, paths
+
+def _worker_route(task):
+
+    origin, destinations, return_paths = task
+
+    return worker_state['router'].route(
+        origin, destinations = destinations, return_paths = return_paths,
+        )
+
+class StochasticRouter():
+    '''
+    Multi-origin SCRAM-D routing with fast_dijkstra
+
+    The graph is compiled into a RoutingGraph once (node and link samples and
+    chargers) along with states, objectives, and constraints (see dijkstra) and
+    then reused for every search. Batches of searches may be run on a process
+    pool of workers processes. The router is passed to each worker once at
+    start-up (inherited without pickling where the fork start method is
+    available) and searches are sent in chunks of chunksize. workers < 1 uses
+    all available cores.
+    '''
+
+    def __init__(self, graph, **kwargs):
+
+        self.states = kwargs.get('states', default_states)
+        self.objectives = kwargs.get('objectives', default_objectives)
+        self.constraints = kwargs.get('constraints', {})
+        self.workers = kwargs.get('workers', 1)
+        self.chunksize = kwargs.get('chunksize', 4)
+
+        if isinstance(graph, RoutingGraph):
+
+            self.graph = graph
+
+        else:
+
+            self.graph = compile_routing_graph(graph, self.states)
+
+    def route(self, origin, destinations = [], return_paths = False):
+        '''
+        Returns (path_costs, path_values, paths) of a search from origin
+        '''
+
+        return fast_dijkstra(
+            self.graph,
+            [origin],
+            destinations = destinations,
+            states = self.states,
+            objectives = self.objectives,
+            constraints = self.constraints,
+            return_paths = return_paths,
+            )
+
+    def _iterate(self, tasks, pb_kwargs):
+
+        workers = worker_count(self.workers)
+
+        if (workers == 1) or (len(tasks) <= 1):
+
+            for task in ProgressBar(tasks, **pb_kwargs):
+
+                yield self.route(*task)
+
+            return
+
+        with process_pool(workers, initargs = ({'router': self}, )) as pool:
+
+            iterator = pool.imap(_worker_route, tasks, chunksize = self.chunksize)
+
+            for _ in ProgressBar(range(len(tasks)), **pb_kwargs):
+
+                yield next(iterator)
+
+    def route_batch(self, origins, destinations = [], **kwargs):
+        '''
+        Routes from each of origins. Returns {origin: (path_costs, path_values,
+        paths)}.
+        '''
+
+        return_paths = kwargs.get('return_paths', False)
+        pb_kwargs = kwargs.get('pb_kwargs', {'disp': False})
+
+        origins = list(origins)
+        tasks = [(origin, destinations, return_paths) for origin in origins]
+
+        return dict(zip(origins, self._iterate(tasks, pb_kwargs)))
+
+    def route_pairs(self, pairs, **kwargs):
+        '''
+        Routes origin/destination pairs. Pairs are grouped by origin so that each
+        origin is searched once until all of its destinations are reached.
+        Returns {(origin, destination): (cost, values, path)} for reachable
+        pairs. path is None unless return_paths.
+        '''
+
+        return_paths = kwargs.get('return_paths', False)
+        pb_kwargs = kwargs.get('pb_kwargs', {'disp': False})
+
+        grouped = {}
+
+        for origin, destination in pairs:
+
+            grouped.setdefault(origin, []).append(destination)
+
+        tasks = [
+            (origin, destinations, return_paths) \
+            for origin, destinations in grouped.items()
+            ]
+
+        results = {}
+
+        for (origin, destinations, _), (costs, values, paths) in zip(
+            tasks, self._iterate(tasks, pb_kwargs)):
+
+            for destination in destinations:
+
+                if destination in costs:
+
+                    results[(origin, destination)] = (
+                        costs[destination],
+                        values[destination],
+                        None if paths is None else paths[destination],
+                        )
+
+        return results
+
+    def table(self, origins, destinations, **kwargs):
+        '''
+        Computes the origin to destination table. Returns costs as an
+        (n_origins, n_destinations) array and values as an
+        (n_states, n_origins, n_destinations, n_cases) array. Unreachable
+        destinations have inf cost and values.
+        '''
+
+        pb_kwargs = kwargs.get('pb_kwargs', {'disp': False})
+
+        origins = list(origins)
+        destinations = list(destinations)
+
+        costs = np.full((len(origins), len(destinations)), np.inf)
+        values = np.full(
+            (len(self.states), len(origins), len(destinations), self.graph.n_cases),
+            np.inf,
+            )
+
+        tasks = [(origin, destinations, False) for origin in origins]
+
+        for row, (path_costs, path_values, _) in enumerate(
+            self._iterate(tasks, pb_kwargs)):
+
+            for column, destination in enumerate(destinations):
+
+                if destination in path_costs:
+
+                    costs[row, column] = path_costs[destination]
+
+                    for k, key in enumerate(self.states.keys()):
+
+                        values[k, row, column] = path_values[destination][key]
+
+        return costs, values
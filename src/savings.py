@@ -1,12 +1,15 @@
 import time
 import numpy as np
 
-from operator import itemgetter
-from heapq import heappop, heappush
+from heapq import heappop, heappush, heapify, merge
 from itertools import count
+from multiprocessing.pool import ThreadPool
 
 from .progress_bar import ProgressBar
+from .route_store import RouteStore
 from .dijkstra import dijkstra
+from .tensor import tensor_from_graph
+from .graph import subgraph
 
 def add_depot_legs(graph, depots, objectives):
 
@@ -24,40 +27,6 @@ def add_depot_legs(graph, depots, objectives):
 
     return graph
 
-def find_routes(routes, node_0, node_1):
-
-	first_route_index = []
-	second_route_index = []
-
-	# print(len(routes))
-
-	itemget = itemgetter(1)
-
-	result = filter(
-		lambda idx: itemget(routes[idx]) == (node_0),
-		list(range(len(routes)))
-		)
-
-	for res in result:
-		# print(res)
-
-		first_route_index = res
-
-	itemget = itemgetter(-2)
-
-	result = filter(
-		lambda idx: itemget(routes[idx]) == (node_1),
-		list(range(len(routes)))
-		)
-
-	for res in result:
-
-		# print(res)
-
-		second_route_index = res
-
-	return first_route_index, second_route_index
-
 def requisites(graph, objectives, **kwargs):
 	'''
 	Computing the savings matrix from an adjacency matrix.
@@ -70,9 +39,17 @@ def requisites(graph, objectives, **kwargs):
 
 	depot -> destination 1 -> destination 2 -> depot
 
+	If a .tensor.AdjacencyTensor is passed as tensor links are read from it
+	instead of from graph._adj.
 	'''
 
-	adjacency = graph._adj
+	if kwargs.get('tensor', None) is None:
+
+		adjacency = graph._adj
+
+	else:
+
+		adjacency = kwargs['tensor'].adjacency(graph.nodes)
 	nodes = graph._node
 
 	primary = list(objectives.keys())[0]
@@ -150,14 +127,349 @@ def requisites(graph, objectives, **kwargs):
 
 	return savings, initial_routes, initial_route_values
 
+def pair_mask(linked, is_source):
+	'''
+	Selects the (source, target) pairs considered by requisites. Each unordered
+	pair is considered once: as (i, j) for the earlier node i if i is not a depot
+	and i -> j exists, otherwise as (j, i) if j is not a depot and j -> i exists.
+	'''
+
+	candidates = linked & is_source[:, None]
+	np.fill_diagonal(candidates, False)
+
+	upper = np.triu(candidates, 1)
+	lower = np.tril(candidates, -1) & ~upper.T
+
+	return upper | lower
+
+def row_blocks(counts, block_size):
+	'''
+	Splits rows into contiguous (start, stop) blocks of about block_size candidate
+	pairs each given the number of candidate pairs of each row. Each block holds
+	at least one row.
+	'''
+
+	bounds = [0]
+	total = 0
+
+	for row, row_count in enumerate(np.asarray(counts).tolist()):
+
+		if (total > 0) and (total + row_count > block_size):
+
+			bounds.append(row)
+			total = 0
+
+		total += row_count
+
+	bounds.append(len(counts))
+
+	return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+def merge_blocks(evaluate, blocks, threads = 1):
+	'''
+	Evaluates savings of row blocks and merges them into a single sorted list
+	(which is a valid heap for clarke_wright).
+
+	evaluate(start, stop) returns the savings of rows start to stop sorted as heap
+	entries whose second element is the row-major index of the pair so that the
+	k-way merge of blocks orders ties as a stable sort over all pairs would. If
+	threads > 1 blocks are evaluated on a thread pool - NumPy releases the GIL for
+	the array operations of evaluate. Peak intermediate memory is bounded by the
+	block size times the number of threads.
+	'''
+
+	if (threads > 1) and (len(blocks) > 1):
+
+		with ThreadPool(threads) as pool:
+
+			results = pool.starmap(evaluate, blocks)
+
+	else:
+
+		results = [evaluate(start, stop) for start, stop in blocks]
+
+	return list(merge(*results))
+
+def _savings_arrays(graph, objectives, **kwargs):
+	'''
+	Returns the arrays shared by the vectorized savings builders: nodes in order,
+	objective fields, (n_objectives, n, n) adjacency, (n_objectives, n) depot legs,
+	the (n, n) mask of candidate pairs before the savings sign is checked, and the
+	initial out-and-back routes and their values.
+	'''
+
+	nodes_list = list(graph.nodes)
+	nodes = graph._node
+	fields = list(objectives.keys())
+
+	if kwargs.get('tensor', None) is None:
+
+		adjacency = tensor_from_graph(
+			graph, fields, nodes = nodes_list, dtype = np.float64).values
+
+	else:
+
+		tensor = kwargs['tensor']
+		idx = tensor.index(nodes_list)
+
+		adjacency = np.stack(
+			[tensor.field(field)[idx][:, idx] for field in fields]
+			).astype(np.float64)
+
+	depots = [nodes[node]['depot'] for node in nodes_list]
+	depot_codes = {depot: code for code, depot in enumerate(dict.fromkeys(depots))}
+	depot_index = np.array([depot_codes[depot] for depot in depots])
+
+	is_source = np.array(
+		[node != depot for node, depot in zip(nodes_list, depots)], dtype = bool,
+		)
+
+	initial_routes = []
+	initial_route_values = []
+
+	for node, depot in zip(nodes_list, depots):
+
+		if node != depot:
+
+			initial_routes.append([depot, node, depot])
+			initial_route_values.append({
+				key: value * 2 + nodes[node]['value'][key] \
+				for key, value in nodes[node]['depot_leg'].items()
+			})
+
+	mask = pair_mask(np.isfinite(adjacency[0]), is_source)
+	mask &= depot_index[:, None] == depot_index[None, :]
+
+	depot_legs = np.array(
+		[[nodes[node]['depot_leg'][field] for node in nodes_list] for field in fields],
+		dtype = np.float64,
+		).reshape((len(fields), -1))
+
+	for k, limits in enumerate(objectives.values()):
+
+		mask &= adjacency[k] >= limits['leg'][0]
+		mask &= adjacency[k] <= limits['leg'][1]
+
+	return (
+		nodes_list, fields, adjacency, depot_legs, mask,
+		initial_routes, initial_route_values,
+		)
+
+def requisites_vectorized(graph, objectives, **kwargs):
+	'''
+	Vectorized equivalent of requisites.
+
+	The savings of every pair are computed as arrays over the adjacency matrices
+	and leg bounds and depot assignment are applied as masks. Rows are processed in
+	blocks of about block_size pairs, optionally on threads threads (see
+	.savings.merge_blocks), and each block is ordered with a single argsort. The
+	returned list is sorted and so is a valid heap for clarke_wright.
+
+	If a .tensor.AdjacencyTensor is passed as tensor adjacency is read from it,
+	otherwise adjacency matrices are built from graph._adj.
+	'''
+
+	nodes_list, fields, adjacency, depot_legs, mask, initial_routes, \
+		initial_route_values = _savings_arrays(graph, objectives, **kwargs)
+
+	n = len(nodes_list)
+	weights = [limits['weight'] for limits in objectives.values()]
+
+	def evaluate(start, stop):
+
+		pair_savings = adjacency[:, start:stop] - (
+			depot_legs[:, start:stop, None] + depot_legs[:, None, :]
+			)
+
+		block_mask = mask[start:stop]
+
+		savings_weighted_sum = np.zeros(pair_savings.shape[1:])
+
+		# Missing links and unbounded objectives are inf so only the candidate pairs
+		# of objectives with non-zero weights are summed (0 * inf is nan)
+		for k, weight in enumerate(weights):
+
+			if weight != 0:
+
+				savings_weighted_sum += weight * np.where(block_mask, pair_savings[k], 0)
+
+		block_mask = block_mask & (savings_weighted_sum < 0)
+
+		flat = np.flatnonzero(block_mask)
+		flat = flat[np.argsort(savings_weighted_sum.flat[flat], kind = 'stable')]
+
+		sources, targets = np.unravel_index(flat, block_mask.shape)
+		sources = (sources + start).tolist()
+		targets = targets.tolist()
+
+		values = savings_weighted_sum.flat[flat].tolist()
+		deltas = pair_savings.reshape((len(fields), -1))[:, flat].T.tolist()
+
+		return [
+			(
+				values[idx],
+				sources[idx] * n + targets[idx],
+				dict(zip(fields, deltas[idx])),
+				nodes_list[sources[idx]],
+				nodes_list[targets[idx]],
+				) for idx in range(len(flat))
+			]
+
+	# Blocks evaluate full rows so their size is counted in pairs of the matrix
+	blocks = row_blocks(np.full(n, n), kwargs.get('block_size', 2 ** 16))
+
+	savings = merge_blocks(evaluate, blocks, kwargs.get('threads', 1))
+
+	return savings, initial_routes, initial_route_values
+
+class NeighborSavings():
+	'''
+	Savings generated lazily from the k nearest neighbors of each node
+
+	Candidate pairs of a node are ranked by the primary (first) objective of the
+	adjacency. Initially only the savings of the k nearest candidates of each node
+	are generated. When a merge leaves a node at the end of a route the next k
+	candidates of the node are generated (see expand). Interior nodes can not be
+	merged again so their remaining candidates are never generated and the savings
+	heap holds O(n * k) entries rather than O(n ** 2).
+	'''
+
+	def __init__(self, graph, objectives, k = 30, **kwargs):
+
+		(
+			self.nodes_list, self.fields, self.adjacency, self.depot_legs, self.mask,
+			self.initial_routes, self.initial_route_values,
+			) = _savings_arrays(graph, objectives, **kwargs)
+
+		self.weights = np.array([limits['weight'] for limits in objectives.values()])
+		self.weighted = self.weights != 0
+		self.k = k
+
+		self.index = {node: idx for idx, node in enumerate(self.nodes_list)}
+		self.position = np.zeros(len(self.nodes_list), dtype = int)
+		self.generated = set()
+		self.counter = count()
+
+		# Upper bound on the number of savings which can be generated
+		self.capacity = int(self.mask.sum())
+
+	def _candidates(self, idx):
+		'''
+		Returns the next k candidate savings of the node at idx
+		'''
+
+		outgoing = self.mask[idx]
+		incoming = self.mask[:, idx]
+
+		others = np.flatnonzero(outgoing | incoming)
+
+		start = self.position[idx]
+		stop = min(start + self.k, len(others))
+
+		if start >= stop:
+
+			return []
+
+		self.position[idx] = stop
+
+		# Pairs keep the orientation of pair_mask
+		sources = np.where(outgoing[others], idx, others)
+		targets = np.where(outgoing[others], others, idx)
+
+		primary = self.adjacency[0, sources, targets]
+
+		# Only the nearest stop candidates need to be ordered
+		if stop < len(others):
+
+			nearest = np.argpartition(primary, stop - 1)[:stop]
+
+		else:
+
+			nearest = np.arange(len(others))
+
+		nearest = nearest[np.argsort(primary[nearest], kind = 'stable')][start:stop]
+
+		sources = sources[nearest]
+		targets = targets[nearest]
+
+		deltas = (
+			self.adjacency[:, sources, targets] -
+			self.depot_legs[:, sources] - self.depot_legs[:, targets]
+			)
+
+		# Objectives with zero weight may be inf for candidate pairs (0 * inf is nan)
+		weighted = self.weights[self.weighted] @ deltas[self.weighted]
+
+		savings = []
+
+		for pair, value, delta in zip(
+			zip(sources.tolist(), targets.tolist()), weighted.tolist(), deltas.T.tolist()
+			):
+
+			if (value >= 0) or (pair in self.generated):
+
+				continue
+
+			self.generated.add(pair)
+
+			savings.append((
+				value,
+				next(self.counter),
+				dict(zip(self.fields, delta)),
+				self.nodes_list[pair[0]],
+				self.nodes_list[pair[1]],
+				))
+
+		return savings
+
+	def initial(self):
+		'''
+		Returns the heap of the savings of the k nearest candidates of all nodes
+		'''
+
+		savings = []
+
+		for idx in range(len(self.nodes_list)):
+
+			savings.extend(self._candidates(idx))
+
+		heapify(savings)
+
+		return savings
+
+	def expand(self, route):
+		'''
+		Returns the next candidate savings of the end nodes of a merged route
+		'''
+
+		savings = []
+
+		for node in dict.fromkeys((route[1], route[-2])):
+
+			savings.extend(self._candidates(self.index[node]))
+
+		return savings
+
 def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
 	
 	kwargs.setdefault('max_iterations', int(1e7))
 
-	max_iterations = min([kwargs.get('max_iterations', int(1e7)), len(savings)])
+	# Savings may be added during the merge loop by expand (see NeighborSavings)
+	expand = kwargs.get('expand', None)
+
+	if expand is None:
+
+		max_iterations = min([kwargs.get('max_iterations', int(1e7)), len(savings)])
+
+	else:
+
+		max_iterations = kwargs['max_iterations']
 
 	# savings, routes, route_values = requisites(graph, objectives)
 
+	# Start and end node indices of the routes
+	route_store = RouteStore(routes, route_values)
+
 	# Implementing savings
 	success = False
 
@@ -180,22 +492,22 @@ def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
 		# Finding routes to merge - the routes can only be merged if there are
 		# routes which start with and end with the to and from index respectively.
 
-		first_route_index = []
-		second_route_index = []
+		first_route_index, second_route_index = route_store.find(source, target)
 
-		first_route_index, second_route_index = find_routes(
-			routes,
-			source,
-			target,
+		# Routes must exist and be distinct - route ids may be 0
+		valid = (
+			(first_route_index is not None) and
+			(second_route_index is not None) and
+			(first_route_index != second_route_index)
 			)
 
 		# If a valid merge combination is found create a tentative route and evaluate
-		if first_route_index and second_route_index:
+		if valid:
 
 			# Creating tentative route
 			combined_route = (
-				routes[first_route_index][:-1] +
-				routes[second_route_index][1:]
+				route_store.routes[first_route_index][:-1] +
+				route_store.routes[second_route_index][1:]
 				)
 
 			# Finding the best of the tentative routes
@@ -205,8 +517,8 @@ def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
 			for objective, limits in objectives.items():
 
 				combined_values[objective] = (
-					route_values[first_route_index][objective] +
-					route_values[second_route_index][objective] +
+					route_store.values[first_route_index][objective] +
+					route_store.values[second_route_index][objective] +
 					delta[objective]
 					)
 
@@ -217,21 +529,110 @@ def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
 			if feasible:
 
 				# Adding the merged route
-				routes[first_route_index] = combined_route
-				route_values[first_route_index] = combined_values
+				route_store.merge(
+					first_route_index, second_route_index,
+					combined_route, combined_values,
+					)
 
-				# Removing the individual routes
-				routes.pop(second_route_index)
-				route_values.pop(second_route_index)
+				if expand is not None:
+
+					for saving in expand(combined_route):
+
+						heappush(savings, saving)
+
+	routes, route_values = route_store.lists()
 
 	return routes, route_values, success
 
-def savings(graph, objectives, **kwargs):
+def depot_partition(graph):
+	'''
+	Splits graph into {depot: subgraph} by the depot assignment of add_depot_legs.
+	Each subgraph contains the nodes assigned to the depot (including the depot).
+	'''
 
-	savings, initial_routes, initial_route_values = requisites(graph, objectives)
+	cells = {}
+
+	for node, data in graph._node.items():
+
+		cells.setdefault(data['depot'], []).append(node)
+
+	# Node dictionaries keep order and allow constant time membership checks
+	return {
+		depot: subgraph(graph, dict.fromkeys(nodes)) for depot, nodes in cells.items()
+		}
+
+def partitioned_savings(solve, graph, objectives, **kwargs):
+	'''
+	Solves savings with solve for each depot subproblem of graph and concatenates
+	the outputs. Savings are only computed between nodes sharing a depot so the
+	routes are those of solving the whole graph. Memory and time scale with the
+	largest depot subproblem.
+	'''
+
+	routes = []
+	route_values = []
+	success = True
+
+	for cell in depot_partition(graph).values():
+
+		cell_routes, cell_route_values, cell_success = solve(cell, objectives, **kwargs)
+
+		routes.extend(cell_routes)
+		route_values.extend(cell_route_values)
+		success &= cell_success
+
+	return routes, route_values, success
+
+def solve(graph, objectives, **kwargs):
+	'''
+	Solves savings for graph without partitioning. If neighbors is given savings
+	are generated lazily from the neighbors nearest candidates of each node (see
+	.savings.NeighborSavings).
+	'''
+
+	if kwargs.get('neighbors', None) is not None:
+
+		candidates = NeighborSavings(graph, objectives, kwargs['neighbors'], **kwargs)
+
+		kwargs = {
+			**kwargs,
+			'expand': candidates.expand,
+			'max_iterations': min(
+				[kwargs.get('max_iterations', int(1e7)), candidates.capacity]
+				),
+			}
+
+		return clarke_wright(
+			graph, objectives, candidates.initial(),
+			candidates.initial_routes, candidates.initial_route_values, **kwargs
+			)
+
+	if kwargs.get('vectorize', True):
+
+		requisites_function = requisites_vectorized
+
+	else:
+
+		requisites_function = requisites
+
+	savings, initial_routes, initial_route_values = requisites_function(
+		graph, objectives, **kwargs)
 
 	routes, route_values, success = clarke_wright(
 		graph, objectives, savings, initial_routes, initial_route_values, **kwargs
 		)
 
-	return routes, route_values, success
\ No newline at end of file
+	return routes, route_values, success
+
+def savings(graph, objectives, **kwargs):
+	'''
+	Solves VRP for graph by the savings algorithm. Unless partition is False the
+	graph is split into one subproblem per depot (see .savings.depot_partition)
+	which are solved independently and whose routes are concatenated.
+	'''
+
+	if kwargs.get('partition', True):
+
+		return partitioned_savings(solve, graph, objectives, **kwargs)
+
+	return solve(graph, objectives, **kwargs)
@@ -1,21 +1,34 @@
 import time
 import numpy as np
 
-from operator import itemgetter
 from heapq import heappop, heappush
 from itertools import count
 
 from .progress_bar import ProgressBar
+from .route_store import RouteStore
 from .routing import dijkstra
+from .savings import pair_mask, partitioned_savings, row_blocks, merge_blocks
 
-def expectation(x, z = 0):
+def expectation(x, z = 0, axis = None):
+    '''
+    Risk-adjusted expectation mean + z * std of samples. For stacked samples
+    axis is the sample axis.
+    '''
 
-    mu = x.mean()
-    sigma = x.std()
+    mu = x.mean(axis = axis)
+    sigma = x.std(axis = axis)
 
     return mu + z * sigma
 
-def add_depot_legs(graph, depots, objectives):
+def add_depot_legs(graph, depots, objectives, tensor = None):
+
+    if tensor is None:
+
+        adjacency = graph._adj
+
+    else:
+
+        adjacency = tensor.adjacency(graph.nodes)
 
     depot_assignment = {}
 
@@ -25,52 +38,18 @@ def add_depot_legs(graph, depots, objectives):
 
         for idx, depot in enumerate(depots):
 
-            if depot in graph._adj[node]:
+            if depot in adjacency[node]:
 
-                d[idx] = np.mean(graph._adj[depot][node]['time'])
+                d[idx] = np.mean(adjacency[depot][node]['time'])
 
         # _depot = depots[np.argmin(d)],
         # print(node, _depot, np.argmin(d), depots[np.argmin(d)])
 
         graph._node[node]['depot'] = depots[np.argmin(d)]
-        graph._node[node]['depot_leg'] = graph._adj[depots[np.argmin(d)]][node]
+        graph._node[node]['depot_leg'] = adjacency[depots[np.argmin(d)]][node]
 
     return graph
 
-def find_routes(routes, node_0, node_1):
-
-    first_route_index = []
-    second_route_index = []
-
-    # print(len(routes))
-
-    itemget = itemgetter(1)
-
-    result = filter(
-        lambda idx: itemget(routes[idx]) == (node_0),
-        list(range(len(routes)))
-        )
-
-    for res in result:
-        # print(res)
-
-        first_route_index = res
-
-    itemget = itemgetter(-2)
-
-    result = filter(
-        lambda idx: itemget(routes[idx]) == (node_1),
-        list(range(len(routes)))
-        )
-
-    for res in result:
-
-        # print(res)
-
-        second_route_index = res
-
-    return first_route_index, second_route_index
-
 def requisites(graph, objectives, **kwargs):
     '''
     Computing the savings matrix from an adjacency matrix.
@@ -83,10 +62,18 @@ def requisites(graph, objectives, **kwargs):
 
     depot -> destination 1 -> destination 2 -> depot
 
+    If a .tensor.AdjacencyTensor is passed as tensor links are read from it
+    instead of from graph._adj.
     '''
     z = kwargs.get('z', 0)
 
-    adjacency = graph._adj
+    if kwargs.get('tensor', None) is None:
+
+        adjacency = graph._adj
+
+    else:
+
+        adjacency = kwargs['tensor'].adjacency(graph.nodes)
     nodes = graph._node
 
     primary = list(objectives.keys())[0]
@@ -171,6 +158,158 @@ def requisites(graph, objectives, **kwargs):
 
     return savings, initial_routes, initial_route_values
 
+def _link_samples(graph, tensor, nodes_list, fields, sources, targets):
+    '''
+    Returns the (n_fields, n_pairs, n_samples) link samples of the pairs
+    '''
+
+    if tensor is None:
+
+        adjacency = graph._adj
+
+        return np.array([
+            [adjacency[nodes_list[s]][nodes_list[t]][field] \
+            for s, t in zip(sources, targets)] for field in fields
+            ], dtype = np.float64)
+
+    idx = tensor.index(nodes_list)
+
+    return np.stack([
+        tensor.field(field)[idx[sources], idx[targets]] for field in fields
+        ]).astype(np.float64)
+
+def requisites_vectorized(graph, objectives, **kwargs):
+    '''
+    Vectorized equivalent of requisites.
+
+    Candidate pairs are selected by masks over the nodes as in
+    .savings.requisites_vectorized. The link and depot leg samples of candidate
+    pairs are stacked into (n_objectives, n_pairs, n_samples) arrays in row blocks
+    of about block_size pairs so that expectations of savings and legs are computed
+    with one NumPy call per objective and block and memory is bounded by the block
+    size. Blocks may be evaluated on threads threads and are k-way merged (see
+    .savings.merge_blocks). The returned list is sorted and so is a valid heap for
+    clarke_wright.
+    '''
+
+    z = kwargs.get('z', 0)
+    block_size = kwargs.get('block_size', 2 ** 16)
+    tensor = kwargs.get('tensor', None)
+
+    nodes_list = list(graph.nodes)
+    nodes = graph._node
+    fields = list(objectives.keys())
+    n = len(nodes_list)
+
+    if tensor is None:
+
+        node_to_idx = {node: idx for idx, node in enumerate(nodes_list)}
+
+        linked = np.zeros((n, n), dtype = bool)
+
+        for source, links in graph._adj.items():
+
+            linked[node_to_idx[source], [node_to_idx[t] for t in links]] = True
+
+    else:
+
+        idx = tensor.index(nodes_list)
+
+        primary = tensor.values[0]
+
+        if primary.ndim > 2:
+
+            primary = primary[..., 0]
+
+        linked = np.isfinite(primary[np.ix_(idx, idx)])
+
+    depots = [nodes[node]['depot'] for node in nodes_list]
+    depot_codes = {depot: code for code, depot in enumerate(dict.fromkeys(depots))}
+    depot_index = np.array([depot_codes[depot] for depot in depots])
+
+    is_source = np.array(
+        [node != depot for node, depot in zip(nodes_list, depots)], dtype = bool,
+        )
+
+    initial_routes = []
+    initial_route_values = []
+
+    for node, depot in zip(nodes_list, depots):
+
+        if node != depot:
+
+            initial_routes.append([depot, node, depot])
+            initial_route_values.append({
+                key: value * 2 + nodes[node][key] \
+                for key, value in nodes[node]['depot_leg'].items()
+            })
+
+    mask = pair_mask(linked, is_source)
+    mask &= depot_index[:, None] == depot_index[None, :]
+
+    # (n_objectives, n, n_samples) depot leg samples
+    depot_legs = np.array([
+        [np.asarray(nodes[node]['depot_leg'][field]) for node in nodes_list] \
+        for field in fields
+        ], dtype = np.float64)
+
+    weights = np.array([limits['weight'] for limits in objectives.values()])
+    lower = np.array([limits['leg'][0] for limits in objectives.values()])
+    upper = np.array([limits['leg'][1] for limits in objectives.values()])
+
+    def evaluate(start, stop):
+
+        block_sources, block_targets = np.nonzero(mask[start:stop])
+        block_sources += start
+
+        if len(block_sources) == 0:
+
+            return []
+
+        combined_path_values = _link_samples(
+            graph, tensor, nodes_list, fields, block_sources, block_targets,
+            )
+
+        pair_savings = combined_path_values - (
+            depot_legs[:, block_sources] + depot_legs[:, block_targets]
+            )
+
+        savings_weighted_sum = (
+            weights[:, None] * expectation(pair_savings, z = z, axis = -1)
+            ).sum(axis = 0)
+
+        combined_path_expectation = expectation(combined_path_values, z = z, axis = -1)
+
+        feasible = np.all(
+            (combined_path_expectation >= lower[:, None]) &
+            (combined_path_expectation <= upper[:, None]),
+            axis = 0,
+            )
+
+        keep = np.flatnonzero(feasible & (savings_weighted_sum < 0))
+        keep = keep[np.argsort(savings_weighted_sum[keep], kind = 'stable')]
+
+        values = savings_weighted_sum[keep].tolist()
+        sources = block_sources[keep].tolist()
+        targets = block_targets[keep].tolist()
+        deltas = pair_savings[:, keep].transpose(1, 0, 2)
+
+        return [
+            (
+                values[idx],
+                sources[idx] * n + targets[idx],
+                dict(zip(fields, deltas[idx])),
+                nodes_list[sources[idx]],
+                nodes_list[targets[idx]],
+                ) for idx in range(len(keep))
+            ]
+
+    blocks = row_blocks(mask.sum(axis = 1), block_size)
+
+    savings = merge_blocks(evaluate, blocks, kwargs.get('threads', 1))
+
+    return savings, initial_routes, initial_route_values
+
 def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
 
     z = kwargs.get('z', 0)
@@ -181,6 +320,9 @@ def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
 
     # savings, routes, route_values = requisites(graph, objectives)
 
+    # Start and end node indices of the routes
+    route_store = RouteStore(routes, route_values)
+
     # Implementing savings
     success = False
 
@@ -203,22 +345,22 @@ def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
         # Finding routes to merge - the routes can only be merged if there are
         # routes which start with and end with the to and from index respectively.
 
-        first_route_index = []
-        second_route_index = []
+        first_route_index, second_route_index = route_store.find(source, target)
 
-        first_route_index, second_route_index = find_routes(
-            routes,
-            source,
-            target,
+        # Routes must exist and be distinct - route ids may be 0
+        valid = (
+            (first_route_index is not None) and
+            (second_route_index is not None) and
+            (first_route_index != second_route_index)
             )
 
         # If a valid merge combination is found create a tentative route and evaluate
-        if first_route_index and second_route_index:
+        if valid:
 
             # Creating tentative route
             combined_route = (
-                routes[first_route_index][:-1] +
-                routes[second_route_index][1:]
+                route_store.routes[first_route_index][:-1] +
+                route_store.routes[second_route_index][1:]
                 )
 
             # Finding the best of the tentative routes
@@ -228,37 +370,60 @@ def clarke_wright(graph, objectives, savings, routes, route_values, **kwargs):
             for objective, limits in objectives.items():
 
                 combined_values[objective] = (
-                    route_values[first_route_index][objective] +
-                    route_values[second_route_index][objective] +
+                    route_store.values[first_route_index][objective] +
+                    route_store.values[second_route_index][objective] +
                     delta[objective]
                     )
 
-                feasible *= (
-                    expectation(combined_values[objective], z = z) >= limits['route'][0]
-                    )
+                combined_expectation = expectation(combined_values[objective], z = z)
 
-                feasible *= (
-                    expectation(combined_values[objective], z = z) <= limits['route'][1]
-                    )
+                feasible *= combined_expectation >= limits['route'][0]
+                feasible *= combined_expectation <= limits['route'][1]
 
             # If the merged route is an improvement and feasible it is integrated
             if feasible:
 
                 # Adding the merged route
-                routes[first_route_index] = combined_route
-                route_values[first_route_index] = combined_values
+                route_store.merge(
+                    first_route_index, second_route_index,
+                    combined_route, combined_values,
+                    )
 
-                routes.pop(second_route_index)
-                route_values.pop(second_route_index)
+    routes, route_values = route_store.lists()
 
     return routes, route_values, success
 
-def savings(graph, objectives, **kwargs):
+def solve(graph, objectives, **kwargs):
+    '''
+    Solves savings for graph without partitioning
+    '''
 
-    savings, initial_routes, initial_route_values = requisites(graph, objectives, **kwargs)
+    if kwargs.get('vectorize', True):
+
+        requisites_function = requisites_vectorized
+
+    else:
+
+        requisites_function = requisites
+
+    savings, initial_routes, initial_route_values = requisites_function(
+        graph, objectives, **kwargs)
 
     routes, route_values, success = clarke_wright(
         graph, objectives, savings, initial_routes, initial_route_values, **kwargs
         )
 
-    return routes, route_values, success
\ No newline at end of file
+    return routes, route_values, success
+
+def savings(graph, objectives, **kwargs):
+    '''
+    Solves VRP for graph by the savings algorithm. Unless partition is False the
+    graph is split into one subproblem per depot (see .savings.depot_partition)
+    which are solved independently and whose routes are concatenated.
+    '''
+
+    if kwargs.get('partition', True):
+
+        return partitioned_savings(solve, graph, objectives, **kwargs)
+
+    return solve(graph, objectives, **kwargs)
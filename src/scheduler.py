@@ -0,0 +1,140 @@
+'''
+Module for scheduling VRP work units
+
+Savings only merges nodes which share a depot so, for each vehicle, the VRP
+decomposes into independent (vehicle, depot) work units. Within a work unit the
+cases of the vehicle are solved in order as nodes visited in one case are removed
+before the next. Work units may be solved on a process pool. The graph, tensor,
+and parameters are passed to each worker once at start-up (inherited without
+pickling where the fork start method is available).
+'''
+
+import numpy as np
+
+from .pool import worker_state, worker_count, process_pool
+from .graph import subgraph
+from .router import route_information
+from .savings_stochastic import savings
+from .local_search import improve_routes
+
+def work_units(parameters):
+    '''
+    Returns the (vehicle, depot) work units in vehicle and depot order
+    '''
+
+    return [
+        (vehicle_name, depot) \
+        for vehicle_name in parameters['vehicles'].keys() \
+        for depot in parameters['depot_nodes']
+        ]
+
+def solve_work_unit(graph, parameters, vehicle_name, depot, **kwargs):
+    '''
+    Solves the cases of a vehicle in order for the nodes assigned to depot.
+    If local_search is given (as a dict of kwargs for
+    .local_search.improve_routes) routes are improved by local search after
+    savings. Returns the list of routes of all cases.
+    '''
+
+    vehicle = parameters['vehicles'][vehicle_name]
+
+    nodes = [
+        k for k, v in graph._node.items() \
+        if (vehicle_name in v['vehicle']) and (v['depot'] == depot) and (k != depot)
+        ]
+
+    sg = subgraph(graph, dict.fromkeys(nodes + [depot]))
+
+    final_routes = []
+
+    for case in vehicle['cases']:
+
+        if sg.number_of_nodes() <= 1:
+
+            break
+
+        if kwargs.get('verbose', True):
+
+            print(f'\n{vehicle_name}, {depot}, {case["name"]}\n')
+
+        objectives = case['objectives']
+
+        routes, route_values, success = savings(sg, objectives, **kwargs)
+
+        # Optional local search post-pass - kwarg local_search holds its kwargs
+        if kwargs.get('local_search', None) is not None:
+
+            routes, route_values = improve_routes(
+                sg, routes, objectives,
+                **{
+                    'tensor': kwargs.get('tensor', None),
+                    'z': kwargs.get('z', 0),
+                    **kwargs['local_search'],
+                    },
+                )
+
+        routes = route_information(sg, routes, parameters['route_fields'])
+
+        full_routes = []
+
+        for idx, route in enumerate(routes):
+
+            if len(route['nodes']) > 3:
+
+                route['vehicle'] = vehicle_name
+
+                for objective in objectives.keys():
+
+                    route[objective] = route_values[idx][objective]
+                    route[f'{objective}_expected'] = np.mean(route_values[idx][objective])
+
+                full_routes.append(route)
+
+        final_routes.extend(full_routes)
+
+        nodes_visited = set(node for route in full_routes for node in route['nodes'])
+
+        sg = subgraph(sg, dict.fromkeys(
+            node for node in sg.nodes if (node == depot) or (node not in nodes_visited)
+            ))
+
+    return final_routes
+
+def _worker_solve_work_unit(unit):
+
+    return solve_work_unit(
+        worker_state['graph'],
+        worker_state['parameters'],
+        *unit,
+        **worker_state['kwargs'],
+        )
+
+def solve_work_units(graph, parameters, workers = 1, **kwargs):
+    '''
+    Solves all (vehicle, depot) work units and returns their routes in work unit
+    order. If workers > 1 work units are solved on a process pool, workers < 1
+    uses all available cores. kwargs are passed to .savings_stochastic.savings.
+    '''
+
+    units = work_units(parameters)
+    workers = worker_count(workers)
+
+    final_routes = []
+
+    if (workers == 1) or (len(units) <= 1):
+
+        for unit in units:
+
+            final_routes.extend(solve_work_unit(graph, parameters, *unit, **kwargs))
+
+        return final_routes
+
+    state = {'graph': graph, 'parameters': parameters, 'kwargs': kwargs}
+
+    with process_pool(workers, initargs = (state, )) as pool:
+
+        for routes in pool.imap(_worker_solve_work_unit, units, chunksize = 1):
+
+            final_routes.extend(routes)
+
+    return final_routes
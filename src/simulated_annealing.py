@@ -1,7 +1,10 @@
 import numpy as np
 
+from math import exp
 from copy import deepcopy
 
+from .pool import worker_state, initialize_worker, worker_count, process_pool
+
 def acceptance_probability(e, e_prime, temperature):
 
 	return min([1, np.exp(-(e_prime - e) / temperature)])
@@ -88,11 +91,1198 @@ def evaluate_routes(adjacency, routes, route_bounds, leg_bounds, stop_weights):
 
 	return weights, validity
 
+class RouteState():
+	'''
+	Route with leg values and prefix sums for constant time move evaluation
+
+	Route weights are computed as in evaluate_route: the sum of the legs plus one
+	stop weight per leg. Stop weights may also be given per node as an
+	(n_adjacency, n) array in which case each leg adds the stop weight of its
+	target. Moves are evaluated from the legs they remove and add
+	(four to six legs) and, for reversals, from the prefix sums of the forward and
+	reverse legs. Leg bounds are checked by keeping the count of legs out of bounds.
+	Evaluation returns weights and the number of legs out of bounds after the move
+	and the route is only rebuilt (see update) when a move is accepted.
+
+	route - [depot, node, ..., node, depot] as adjacency indices
+	legs, reverse_legs - (n_adjacency, n_legs) values of the legs in route order
+	and in reverse direction
+	prefix, reverse_prefix - (n_adjacency, n_legs + 1) cumulative sums of legs and
+	reverse_legs
+	stop_prefix - (n_adjacency, n_legs + 1) cumulative stop weights of leg targets
+	invalid, reverse_invalid - (n_legs,) legs out of bounds and their cumulative
+	counts as invalid_prefix and reverse_invalid_prefix
+	weights - (n_adjacency,) route weights
+	violations - number of legs out of bounds
+	leg_feasible - optional (n, n) array of legs within bounds (see
+	leg_feasibility) used to reject moves adding infeasible legs before evaluation.
+	If given it replaces the comparison of legs with leg_bounds.
+	'''
+
+	def __init__(
+		self, adjacency, route, leg_bounds, route_bounds, stop_weights,
+		leg_feasible = None,
+		):
+
+		self.adjacency = np.asarray(adjacency, dtype = np.float64)
+		self.leg_bounds = np.asarray(leg_bounds, dtype = np.float64)
+		self.route_bounds = np.asarray(route_bounds, dtype = np.float64)
+		self.stop_weights = np.asarray(stop_weights, dtype = np.float64)
+		self.leg_feasible = leg_feasible
+
+		# Uniform stop weights are viewed as per node stop weights but changes are
+		# computed from the number of legs
+		self.uniform_stops = self.stop_weights.ndim == 1
+
+		if self.uniform_stops:
+
+			self.stop_weight = self.stop_weights
+
+			self.stop_weights = np.broadcast_to(
+				self.stop_weights[:, None], self.adjacency.shape[:2],
+				)
+
+		self.update(route)
+
+	def _out_of_bounds(self, legs):
+
+		return np.any(
+			(legs < self.leg_bounds[:, [0]]) | (legs > self.leg_bounds[:, [1]]), axis = 0,
+			)
+
+	def _invalid(self, sources, targets, legs):
+
+		if self.leg_feasible is None:
+
+			return self._out_of_bounds(legs)
+
+		return ~self.leg_feasible[sources, targets]
+
+	def _cumulative(self, values):
+
+		return np.concatenate(
+			(np.zeros(values.shape[:-1] + (1,)), np.cumsum(values, axis = -1)), axis = -1,
+			)
+
+	def update(self, route):
+		'''
+		Sets route and rebuilds leg values and prefix sums
+		'''
+
+		self.route = list(route)
+
+		sources = self.route[:-1]
+		targets = self.route[1:]
+
+		self.legs = self.adjacency[:, sources, targets]
+		self.reverse_legs = self.adjacency[:, targets, sources]
+
+		self.prefix = self._cumulative(self.legs)
+		self.reverse_prefix = self._cumulative(self.reverse_legs)
+
+		self.stop_prefix = self._cumulative(self.stop_weights[:, targets])
+
+		self.invalid = self._invalid(sources, targets, self.legs)
+		self.reverse_invalid = self._invalid(targets, sources, self.reverse_legs)
+
+		self.invalid_prefix = self._cumulative(self.invalid)
+		self.reverse_invalid_prefix = self._cumulative(self.reverse_invalid)
+
+		self.weights = self.prefix[:, -1] + self.stop_prefix[:, -1]
+		self.violations = int(self.invalid_prefix[-1])
+
+	def valid(self, weights, violations):
+		'''
+		True if no legs are out of bounds and weights are within route bounds
+		'''
+
+		return (violations == 0) and bool(np.all(
+			(weights >= self.route_bounds[:, 0]) & (weights <= self.route_bounds[:, 1])
+			))
+
+	def _change(self, removed, added, reverse = None):
+		'''
+		Returns weights and number of legs out of bounds after removing the legs at
+		indices removed and adding the legs between the (source, target) pairs of
+		added. If reverse = (i, j) the legs between route positions i and j are
+		also reversed.
+		'''
+
+		sources, targets = zip(*added)
+
+		# Pre-filter - moves adding a leg out of bounds are invalid
+		if self.leg_feasible is not None:
+
+			if not self.leg_feasible[sources, targets].all():
+
+				return self.weights, len(added)
+
+		added_legs = self.adjacency[:, sources, targets]
+
+		if self.uniform_stops:
+
+			stops = self.stop_weight * (len(added) - len(removed))
+
+		else:
+
+			removed_targets = [self.route[idx + 1] for idx in removed]
+
+			stops = (
+				self.stop_weights[:, targets].sum(axis = 1) -
+				self.stop_weights[:, removed_targets].sum(axis = 1)
+				)
+
+		weights = (
+			self.weights + stops +
+			added_legs.sum(axis = 1) - self.legs[:, removed].sum(axis = 1)
+			)
+
+		violations = (
+			self.violations +
+			int(self._invalid(sources, targets, added_legs).sum()) -
+			int(self.invalid[removed].sum())
+			)
+
+		if reverse is not None:
+
+			i, j = reverse
+
+			weights += (
+				self.reverse_prefix[:, j] - self.reverse_prefix[:, i] -
+				self.prefix[:, j] + self.prefix[:, i]
+				)
+
+			# Reversed legs end at nodes i to j - 1 rather than i + 1 to j
+			if not self.uniform_stops:
+
+				weights += (
+					self.stop_weights[:, self.route[i]] -
+					self.stop_weights[:, self.route[j]]
+					)
+
+			violations += int(
+				self.reverse_invalid_prefix[j] - self.reverse_invalid_prefix[i] -
+				self.invalid_prefix[j] + self.invalid_prefix[i]
+				)
+
+		return weights, violations
+
+	def evaluate_swap(self, i, j):
+		'''
+		Exchanges the nodes at positions i < j
+		'''
+
+		r = self.route
+
+		if j == i + 1:
+
+			return self._change(
+				[i - 1, i, j],
+				[(r[i - 1], r[j]), (r[j], r[i]), (r[i], r[j + 1])],
+				)
+
+		return self._change(
+			[i - 1, i, j - 1, j],
+			[(r[i - 1], r[j]), (r[j], r[i + 1]), (r[j - 1], r[i]), (r[i], r[j + 1])],
+			)
+
+	def swapped(self, i, j):
+
+		route = self.route.copy()
+		route[i], route[j] = route[j], route[i]
+
+		return route
+
+	def evaluate_relocate(self, i, j):
+		'''
+		Moves the node at position i in front of the node at position j where j is
+		not i or i + 1
+		'''
+
+		r = self.route
+
+		return self._change(
+			[i - 1, i, j - 1],
+			[(r[i - 1], r[i + 1]), (r[j - 1], r[i]), (r[i], r[j])],
+			)
+
+	def relocated(self, i, j):
+
+		route = self.route.copy()
+		node = route.pop(i)
+		route.insert(j if j < i else j - 1, node)
+
+		return route
+
+	def evaluate_move_segment(self, i, k, j):
+		'''
+		Moves the k nodes at positions i to i + k - 1 in front of the node at
+		position j where j is not within i to i + k
+		'''
+
+		r = self.route
+
+		return self._change(
+			[i - 1, i + k - 1, j - 1],
+			[(r[i - 1], r[i + k]), (r[j - 1], r[i]), (r[i + k - 1], r[j])],
+			)
+
+	def moved_segment(self, i, k, j):
+
+		segment = self.route[i:i + k]
+		route = self.route[:i] + self.route[i + k:]
+		j = j if j < i else j - k
+
+		return route[:j] + segment + route[j:]
+
+	def evaluate_two_opt(self, i, j):
+		'''
+		Reverses the nodes between positions i < j (inclusive)
+		'''
+
+		r = self.route
+
+		return self._change(
+			[i - 1, j],
+			[(r[i - 1], r[j]), (r[i], r[j + 1])],
+			reverse = (i, j),
+			)
+
+	def two_opted(self, i, j):
+
+		return self.route[:i] + self.route[i:j + 1][::-1] + self.route[j + 1:]
+
+	def evaluate_remove(self, i):
+		'''
+		Removes the node at position i
+		'''
+
+		r = self.route
+
+		return self._change([i - 1, i], [(r[i - 1], r[i + 1])])
+
+	def removed(self, i):
+
+		return self.route[:i] + self.route[i + 1:]
+
+	def evaluate_insert(self, node, j):
+		'''
+		Inserts node in front of the node at position j
+		'''
+
+		r = self.route
+
+		return self._change([j - 1], [(r[j - 1], node), (node, r[j])])
+
+	def inserted(self, node, j):
+
+		return self.route[:j] + [node] + self.route[j:]
+
+	def evaluate_replace(self, i, node):
+		'''
+		Replaces the node at position i with node
+		'''
+
+		r = self.route
+
+		return self._change([i - 1, i], [(r[i - 1], node), (node, r[i + 1])])
+
+	def replaced(self, i, node):
+
+		route = self.route.copy()
+		route[i] = node
+
+		return route
+
+	def segment_values(self, i, j):
+		'''
+		Returns the weights and number of legs out of bounds of the legs between
+		positions i <= j
+		'''
+
+		return (
+			self.prefix[:, j] - self.prefix[:, i] +
+			self.stop_prefix[:, j] - self.stop_prefix[:, i],
+			int(self.invalid_prefix[j] - self.invalid_prefix[i]),
+			)
+
+	def evaluate_exchange(self, i, k, other, start, stop):
+		'''
+		Replaces the k nodes at positions i to i + k - 1 (k may be 0) with the
+		nodes at positions start to stop - 1 of RouteState other (start may equal
+		stop)
+		'''
+
+		r = self.route
+
+		if start == stop:
+
+			return self._change(list(range(i - 1, i + k)), [(r[i - 1], r[i + k])])
+
+		first, last = other.route[start], other.route[stop - 1]
+
+		weights, violations = self._change(
+			list(range(i - 1, i + k)), [(r[i - 1], first), (last, r[i + k])],
+			)
+
+		segment_weights, segment_violations = other.segment_values(start, stop - 1)
+
+		return weights + segment_weights, violations + segment_violations
+
+	def exchanged(self, i, k, other, start, stop):
+
+		return self.route[:i] + other.route[start:stop] + self.route[i + k:]
+
+def _accept(delta, temperature, draw):
+
+	return (delta <= 0) or ((temperature > 0) and (draw < exp(-delta / temperature)))
+
+def _temperatures(**kwargs):
+
+	steps = kwargs.get('steps', 100)
+
+	return (
+		kwargs.get('initial_temperature', 1) * (1 - np.arange(steps) / steps)
+		).tolist()
+
+def leg_feasibility(adjacency, leg_bounds):
+	'''
+	Returns the (n, n) array of legs within leg_bounds for all adjacency matrices
+	'''
+
+	adjacency = np.asarray(adjacency, dtype = np.float64)
+	leg_bounds = np.asarray(leg_bounds, dtype = np.float64)
+
+	return np.all(
+		(adjacency >= leg_bounds[:, 0, None, None]) &
+		(adjacency <= leg_bounds[:, 1, None, None]),
+		axis = 0,
+		)
+
+def granular_neighbors(adjacency, leg_feasible, k = 20):
+	'''
+	Returns the granular neighborhood as a list holding, for each node, the (up
+	to) k nodes nearest by the first adjacency matrix which can be reached by a
+	feasible leg
+	'''
+
+	primary = np.where(leg_feasible, np.asarray(adjacency[0], dtype = np.float64), np.inf)
+	np.fill_diagonal(primary, np.inf)
+
+	k = min([k, primary.shape[1] - 1])
+
+	if k < 1:
+
+		return [[] for _ in range(primary.shape[0])]
+
+	nearest = np.argpartition(primary, k - 1, axis = 1)[:, :k]
+	nearest = np.take_along_axis(
+		nearest, np.argsort(np.take_along_axis(primary, nearest, axis = 1), axis = 1), axis = 1,
+		)
+
+	return [
+		[node for node in row if np.isfinite(primary[idx, node])] \
+		for idx, row in enumerate(nearest.tolist())
+		]
+
+def _granular(adjacency, leg_bounds, **kwargs):
+	'''
+	Returns the leg feasibility and granular neighborhood of kwargs neighbors
+	nearest neighbors or (None, None) if neighbors is not given
+	'''
+
+	if kwargs.get('neighbors', None) is None:
+
+		return None, None
+
+	leg_feasible = leg_feasibility(adjacency, leg_bounds)
+
+	return leg_feasible, granular_neighbors(adjacency, leg_feasible, kwargs['neighbors'])
+
+def _anneal_state(state, temperatures, moves, rng):
+	'''
+	Applies the moves of anneal_route_delta to a RouteState in place for each
+	temperature in temperatures
+	'''
+
+	move_draws = rng.integers(len(moves), size = len(temperatures)).tolist()
+	draws = rng.random((len(temperatures), 3)).tolist()
+
+	for temperature, move_draw, (u_0, u_1, u_2) in zip(
+		temperatures, move_draws, draws
+		):
+
+		move = moves[move_draw]
+		n_stops = len(state.route) - 2
+
+		i = 1 + int(u_0 * n_stops)
+
+		if move == 'relocate':
+
+			j = 1 + int(u_1 * (n_stops + 1))
+
+			if (j == i) or (j == i + 1):
+
+				continue
+
+			weights, violations = state.evaluate_relocate(i, j)
+
+		else:
+
+			j = 1 + int(u_1 * n_stops)
+
+			if j == i:
+
+				continue
+
+			i, j = min(i, j), max(i, j)
+
+			if move == 'swap':
+
+				weights, violations = state.evaluate_swap(i, j)
+
+			else:
+
+				weights, violations = state.evaluate_two_opt(i, j)
+
+		if state.valid(weights, violations) and _accept(
+			weights[0] - state.weights[0], temperature, u_2
+			):
+
+			if move == 'relocate':
+
+				state.update(state.relocated(i, j))
+
+			elif move == 'swap':
+
+				state.update(state.swapped(i, j))
+
+			else:
+
+				state.update(state.two_opted(i, j))
+
+def anneal_route_delta(adjacency, route, leg_bounds, route_bounds, stop_weights, **kwargs):
+	'''
+	Anneals the order of a single route with swap, relocate, and two_opt moves
+	(kwargs moves) evaluated in constant time (see RouteState). Temperature falls
+	linearly from initial_temperature to 0 over steps. Random numbers are drawn
+	from the numpy Generator rng or one seeded with seed. If neighbors is given
+	moves are drawn from the granular neighborhood of that many nearest neighbors
+	(see _anneal_states_granular) and moves adding infeasible legs are rejected
+	before evaluation. Returns the final route if its first weight is not above
+	that of route and route otherwise.
+	'''
+
+	moves = kwargs.get('moves', ('swap', 'relocate', 'two_opt'))
+
+	# At lease 2 destinations need to be present for annealing
+	if len(route) < 4:
+
+		return route
+
+	rng = kwargs.get('rng', None)
+
+	if rng is None:
+
+		rng = np.random.default_rng(kwargs.get('seed', None))
+
+	leg_feasible, neighbors = _granular(adjacency, leg_bounds, **kwargs)
+
+	state = RouteState(
+		adjacency, route, leg_bounds, route_bounds, stop_weights, leg_feasible,
+		)
+
+	initial_weight = state.weights[0]
+
+	if neighbors is None:
+
+		_anneal_state(state, _temperatures(**kwargs), moves, rng)
+
+	else:
+
+		_anneal_states_granular([state], _temperatures(**kwargs), moves, rng, neighbors)
+
+	if state.weights[0] <= initial_weight:
+
+		return state.route
+
+	else:
+
+		return route
+
+def _anneal_states(states, temperatures, moves, rng):
+	'''
+	Applies the moves of anneal_routes_delta to a list of RouteState in place for
+	each temperature in temperatures
+	'''
+
+	move_draws = rng.integers(len(moves), size = len(temperatures)).tolist()
+	draws = rng.random((len(temperatures), 5)).tolist()
+
+	for temperature, move_draw, (u_0, u_1, u_2, u_3, u_4) in zip(
+		temperatures, move_draws, draws
+		):
+
+		move = moves[move_draw]
+		n_routes = len(states)
+
+		a = int(u_0 * n_routes)
+		state_a = states[a]
+		n_stops_a = len(state_a.route) - 2
+
+		if n_stops_a < 1:
+
+			continue
+
+		i = 1 + int(u_2 * n_stops_a)
+
+		if move == 'two_opt':
+
+			j = 1 + int(u_3 * n_stops_a)
+
+			if j == i:
+
+				continue
+
+			i, j = min(i, j), max(i, j)
+
+			weights, violations = state_a.evaluate_two_opt(i, j)
+
+			if state_a.valid(weights, violations) and _accept(
+				weights[0] - state_a.weights[0], temperature, u_4
+				):
+
+				state_a.update(state_a.two_opted(i, j))
+
+			continue
+
+		if n_routes < 2:
+
+			continue
+
+		b = int(u_1 * (n_routes - 1))
+		b += b >= a
+
+		state_b = states[b]
+		n_stops_b = len(state_b.route) - 2
+
+		if move == 'relocate':
+
+			j = 1 + int(u_3 * (n_stops_b + 1))
+
+			weights_a, violations_a = state_a.evaluate_remove(i)
+			weights_b, violations_b = state_b.evaluate_insert(state_a.route[i], j)
+
+		else:
+
+			if n_stops_b < 1:
+
+				continue
+
+			j = 1 + int(u_3 * n_stops_b)
+
+			weights_a, violations_a = state_a.evaluate_replace(i, state_b.route[j])
+			weights_b, violations_b = state_b.evaluate_replace(j, state_a.route[i])
+
+		delta = (
+			weights_a[0] + weights_b[0] - state_a.weights[0] - state_b.weights[0]
+			)
+
+		valid = (
+			state_a.valid(weights_a, violations_a) and
+			state_b.valid(weights_b, violations_b)
+			)
+
+		if valid and _accept(delta, temperature, u_4):
+
+			if move == 'relocate':
+
+				node = state_a.route[i]
+
+				state_a.update(state_a.removed(i))
+				state_b.update(state_b.inserted(node, j))
+
+			else:
+
+				node_a, node_b = state_a.route[i], state_b.route[j]
+
+				state_a.update(state_a.replaced(i, node_b))
+				state_b.update(state_b.replaced(j, node_a))
+
+def _anneal_states_granular(states, temperatures, moves, rng, neighbors):
+	'''
+	Applies granular moves to a list of RouteState in place for each temperature
+	in temperatures. Each move draws a node and one of its neighbors (see
+	granular_neighbors) and tries to make the node precede the neighbor:
+
+	relocate - the node is moved in front of the neighbor
+	swap - the node is exchanged with the predecessor of the neighbor
+	two_opt - the segment after the node up to the neighbor is reversed (only
+	within a route and if the neighbor follows the node)
+	'''
+
+	# {node: (route index, position)}
+	positions = {}
+
+	def update(a, route):
+
+		states[a].update(route)
+
+		for position, node in enumerate(route[1:-1], 1):
+
+			positions[node] = (a, position)
+
+	for a, state in enumerate(states):
+
+		update(a, state.route)
+
+	move_draws = rng.integers(len(moves), size = len(temperatures)).tolist()
+	draws = rng.random((len(temperatures), 4)).tolist()
+
+	for temperature, move_draw, (u_0, u_1, u_2, u_3) in zip(
+		temperatures, move_draws, draws
+		):
+
+		move = moves[move_draw]
+
+		a = int(u_0 * len(states))
+		state_a = states[a]
+		n_stops_a = len(state_a.route) - 2
+
+		if n_stops_a < 1:
+
+			continue
+
+		i = 1 + int(u_1 * n_stops_a)
+		node = state_a.route[i]
+
+		if not neighbors[node]:
+
+			continue
+
+		neighbor = neighbors[node][int(u_2 * len(neighbors[node]))]
+
+		if neighbor not in positions:
+
+			continue
+
+		b, j = positions[neighbor]
+		state_b = states[b]
+
+		if move == 'swap':
+
+			j -= 1
+
+			if (j < 1) or ((a == b) and (j == i)):
+
+				continue
+
+		if (move == 'two_opt') and ((a != b) or (j <= i + 1)):
+
+			continue
+
+		if (move == 'relocate') and (a == b) and (j in (i, i + 1)):
+
+			continue
+
+		# Evaluating the move on one or two routes
+		if a == b:
+
+			if move == 'relocate':
+
+				weights, violations = state_a.evaluate_relocate(i, j)
+
+			elif move == 'swap':
+
+				weights, violations = state_a.evaluate_swap(min(i, j), max(i, j))
+
+			else:
+
+				weights, violations = state_a.evaluate_two_opt(i + 1, j)
+
+			valid = state_a.valid(weights, violations)
+			delta = weights[0] - state_a.weights[0]
+
+		else:
+
+			if move == 'relocate':
+
+				weights_a, violations_a = state_a.evaluate_remove(i)
+				weights_b, violations_b = state_b.evaluate_insert(node, j)
+
+			else:
+
+				weights_a, violations_a = state_a.evaluate_replace(i, state_b.route[j])
+				weights_b, violations_b = state_b.evaluate_replace(j, node)
+
+			valid = (
+				state_a.valid(weights_a, violations_a) and
+				state_b.valid(weights_b, violations_b)
+				)
+
+			delta = (
+				weights_a[0] + weights_b[0] - state_a.weights[0] - state_b.weights[0]
+				)
+
+		if not (valid and _accept(delta, temperature, u_3)):
+
+			continue
+
+		if a == b:
+
+			if move == 'relocate':
+
+				update(a, state_a.relocated(i, j))
+
+			elif move == 'swap':
+
+				update(a, state_a.swapped(min(i, j), max(i, j)))
+
+			else:
+
+				update(a, state_a.two_opted(i + 1, j))
+
+		elif move == 'relocate':
+
+			update(a, state_a.removed(i))
+			update(b, state_b.inserted(node, j))
+
+		else:
+
+			node_b = state_b.route[j]
+
+			update(a, state_a.replaced(i, node_b))
+			update(b, state_b.replaced(j, node))
+
+def anneal_routes_delta(adjacency, routes, leg_bounds, route_bounds, stop_weights, **kwargs):
+	'''
+	Anneals the assignment of nodes to routes with relocate (a node moved from
+	one route to another), swap (nodes exchanged between two routes), and two_opt
+	(a reversal within a route) moves (kwargs moves) evaluated in constant time
+	(see RouteState). Routes emptied by relocation are dropped. Temperature,
+	random numbers, and granular neighborhoods are as in anneal_route_delta.
+	Returns the final routes if the sum of their first weights is not above that
+	of routes and routes otherwise.
+	'''
+
+	moves = kwargs.get('moves', ('relocate', 'swap', 'two_opt'))
+
+	rng = kwargs.get('rng', None)
+
+	if rng is None:
+
+		rng = np.random.default_rng(kwargs.get('seed', None))
+
+	# Converted once so that states share the adjacency array
+	adjacency = np.asarray(adjacency, dtype = np.float64)
+
+	leg_feasible, neighbors = _granular(adjacency, leg_bounds, **kwargs)
+
+	states = [
+		RouteState(
+			adjacency, route, leg_bounds, route_bounds, stop_weights, leg_feasible,
+			) for route in routes
+		]
+
+	initial_weight = sum([state.weights[0] for state in states])
+
+	if neighbors is None:
+
+		_anneal_states(states, _temperatures(**kwargs), moves, rng)
+
+	else:
+
+		_anneal_states_granular(states, _temperatures(**kwargs), moves, rng, neighbors)
+
+	if sum([state.weights[0] for state in states]) <= initial_weight:
+
+		return [state.route for state in states if len(state.route) > 2]
+
+	else:
+
+		return routes
+
+class RouteBatch():
+	'''
+	Padded arrays over a list of RouteState for evaluating many moves at once
+
+	nodes - (n_routes, capacity) route nodes
+	lengths - (n_routes,) route lengths
+	legs - (n_adjacency, n_routes, capacity - 1) leg values
+	invalid - (n_routes, capacity - 1) legs out of bounds
+	weights - (n_adjacency, n_routes) route weights
+	violations - (n_routes,) numbers of legs out of bounds
+	'''
+
+	def __init__(self, states):
+
+		self.states = states
+		self.adjacency = states[0].adjacency
+
+		n_adjacency = len(self.adjacency)
+		n_routes = len(states)
+		capacity = 2 * max([len(state.route) for state in states])
+
+		self.nodes = np.zeros((n_routes, capacity), dtype = int)
+		self.lengths = np.zeros(n_routes, dtype = int)
+		self.legs = np.zeros((n_adjacency, n_routes, capacity - 1))
+		self.invalid = np.zeros((n_routes, capacity - 1), dtype = bool)
+		self.weights = np.zeros((n_adjacency, n_routes))
+		self.violations = np.zeros(n_routes, dtype = int)
+
+		for row in range(n_routes):
+
+			self.store(row)
+
+	def _grow(self, capacity):
+
+		pad = capacity - self.nodes.shape[1]
+
+		self.nodes = np.pad(self.nodes, ((0, 0), (0, pad)))
+		self.legs = np.pad(self.legs, ((0, 0), (0, 0), (0, pad)))
+		self.invalid = np.pad(self.invalid, ((0, 0), (0, pad)))
+
+	def store(self, row):
+		'''
+		Copies the RouteState of row into the arrays
+		'''
+
+		state = self.states[row]
+		length = len(state.route)
+
+		if length > self.nodes.shape[1]:
+
+			self._grow(2 * length)
+
+		self.nodes[row, :length] = state.route
+		self.lengths[row] = length
+		self.legs[:, row, :length - 1] = state.legs
+		self.invalid[row, :length - 1] = state.invalid
+		self.weights[:, row] = state.weights
+		self.violations[row] = state.violations
+
+	def _out_of_bounds(self, legs):
+
+		bounds = self.states[0].leg_bounds
+
+		return np.any(
+			(legs < bounds[:, [0]]) | (legs > bounds[:, [1]]), axis = 0,
+			)
+
+	def _within_route_bounds(self, weights):
+
+		bounds = self.states[0].route_bounds
+
+		return np.all(
+			(weights >= bounds[:, [0]]) & (weights <= bounds[:, [1]]), axis = 0,
+			)
+
+	def evaluate_relocations(self, a, i, b, j):
+		'''
+		Evaluates moving the nodes at positions i of routes a in front of the nodes
+		at positions j of routes b for arrays of moves. Returns the changes in the
+		sum of first weights and the validity of the moves.
+		'''
+
+		stop_weights = self.states[0].stop_weights
+
+		nodes = self.nodes[a, i]
+		previous_a = self.nodes[a, i - 1]
+		next_a = self.nodes[a, i + 1]
+		previous_b = self.nodes[b, j - 1]
+		next_b = self.nodes[b, j]
+
+		leg_a = self.adjacency[:, previous_a, next_a]
+		leg_b_0 = self.adjacency[:, previous_b, nodes]
+		leg_b_1 = self.adjacency[:, nodes, next_b]
+
+		weights_a = (
+			self.weights[:, a] + leg_a -
+			self.legs[:, a, i - 1] - self.legs[:, a, i] - stop_weights[:, nodes]
+			)
+
+		weights_b = (
+			self.weights[:, b] + leg_b_0 + leg_b_1 -
+			self.legs[:, b, j - 1] + stop_weights[:, nodes]
+			)
+
+		violations_a = (
+			self.violations[a] + self._out_of_bounds(leg_a) -
+			self.invalid[a, i - 1] - self.invalid[a, i]
+			)
+
+		violations_b = (
+			self.violations[b] +
+			self._out_of_bounds(leg_b_0) + self._out_of_bounds(leg_b_1) -
+			self.invalid[b, j - 1]
+			)
+
+		valid = (
+			(violations_a == 0) & (violations_b == 0) &
+			self._within_route_bounds(weights_a) & self._within_route_bounds(weights_b)
+			)
+
+		delta = (
+			weights_a[0] + weights_b[0] - self.weights[0, a] - self.weights[0, b]
+			)
+
+		return delta, valid
+
+def anneal_routes_batched(adjacency, routes, leg_bounds, route_bounds, stop_weights, **kwargs):
+	'''
+	Anneals the assignment of nodes to routes with batches of relocate moves.
+
+	At each of steps temperature steps batch_size relocations (a node moved from
+	one route to another) are proposed and evaluated in one vectorized pass (see
+	RouteBatch). Accepted moves are applied in order of improvement while they do
+	not touch a route already changed in the batch. Routes emptied by relocation
+	are dropped. Temperature and random numbers are as in anneal_route_delta.
+	Returns the final routes if the sum of their first weights is not above that
+	of routes and routes otherwise.
+	'''
+
+	batch_size = kwargs.get('batch_size', 1024)
+
+	rng = kwargs.get('rng', None)
+
+	if rng is None:
+
+		rng = np.random.default_rng(kwargs.get('seed', None))
+
+	# Converted once so that states share the adjacency array
+	adjacency = np.asarray(adjacency, dtype = np.float64)
+
+	states = [
+		RouteState(adjacency, route, leg_bounds, route_bounds, stop_weights) \
+		for route in routes
+		]
+
+	initial_weight = sum([state.weights[0] for state in states])
+
+	n_routes = len(states)
+
+	if n_routes < 2:
+
+		return routes
+
+	batch = RouteBatch(states)
+
+	for temperature in _temperatures(**kwargs):
+
+		a = rng.integers(n_routes, size = batch_size)
+		b = rng.integers(n_routes - 1, size = batch_size)
+		b += b >= a
+
+		stops_a = batch.lengths[a] - 2
+
+		proposed = stops_a > 0
+
+		a, b, stops_a = a[proposed], b[proposed], stops_a[proposed]
+
+		i = 1 + (rng.random(len(a)) * stops_a).astype(int)
+		j = 1 + (rng.random(len(a)) * (batch.lengths[b] - 1)).astype(int)
+
+		delta, valid = batch.evaluate_relocations(a, i, b, j)
+
+		if temperature > 0:
+
+			probability = np.exp(np.minimum(-delta / temperature, 0))
+
+		else:
+
+			probability = (delta <= 0).astype(float)
+
+		accepted = np.flatnonzero(valid & (rng.random(len(a)) < probability))
+		accepted = accepted[np.argsort(delta[accepted], kind = 'stable')]
+
+		changed = np.zeros(n_routes, dtype = bool)
+
+		for move in accepted.tolist():
+
+			route_a, route_b = a[move], b[move]
+
+			if changed[route_a] or changed[route_b]:
+
+				continue
+
+			changed[route_a] = changed[route_b] = True
+
+			node = states[route_a].route[i[move]]
+
+			states[route_a].update(states[route_a].removed(i[move]))
+			states[route_b].update(states[route_b].inserted(node, j[move]))
+
+			batch.store(route_a)
+			batch.store(route_b)
+
+	if sum([state.weights[0] for state in states]) <= initial_weight:
+
+		return [state.route for state in states if len(state.route) > 2]
+
+	else:
+
+		return routes
+
+def _run_replica(replica):
+	'''
+	Anneals routes at a constant temperature for steps steps. Returns the routes,
+	the sum of their first weights, their feasibility, and the advanced Generator.
+	'''
+
+	routes, temperature, steps, moves, rng = replica
+
+	states = [
+		RouteState(
+			worker_state['adjacency'], route,
+			worker_state['leg_bounds'],
+			worker_state['route_bounds'],
+			worker_state['stop_weights'],
+			worker_state['leg_feasible'],
+			) for route in routes
+		]
+
+	if worker_state['neighbors'] is None:
+
+		_anneal_states(states, [temperature] * steps, moves, rng)
+
+	else:
+
+		_anneal_states_granular(
+			states, [temperature] * steps, moves, rng, worker_state['neighbors'],
+			)
+
+	weight = sum([state.weights[0] for state in states])
+
+	feasible = all(
+		[state.valid(state.weights, state.violations) for state in states]
+		)
+
+	routes = [state.route for state in states if len(state.route) > 2]
+
+	return routes, weight, feasible, rng
+
+def anneal_routes_tempering(adjacency, routes, leg_bounds, route_bounds, stop_weights, **kwargs):
+	'''
+	Anneals the assignment of nodes to routes by parallel tempering.
+
+	replicas chains run the moves of anneal_routes_delta at constant temperatures
+	spaced geometrically from min_temperature to initial_temperature. Each of
+	rounds rounds runs steps steps per replica, after which the states of replicas
+	at adjacent temperatures are exchanged with the Metropolis criterion. If
+	workers > 1 replicas run on a process pool, workers < 1 uses all available
+	cores. Each replica draws from its own numpy Generator spawned from seed so
+	results do not depend on workers. Granular neighborhoods are as in
+	anneal_route_delta. Returns the best feasible routes seen at the
+	end of a round or routes if no better feasible routes were found.
+	'''
+
+	replicas = kwargs.get('replicas', 4)
+	rounds = kwargs.get('rounds', 10)
+	steps = kwargs.get('steps', 100)
+	moves = kwargs.get('moves', ('relocate', 'swap', 'two_opt'))
+	workers = kwargs.get('workers', 1)
+
+	max_temperature = kwargs.get('initial_temperature', 1)
+	min_temperature = kwargs.get('min_temperature', max_temperature / 100)
+
+	temperatures = np.geomspace(min_temperature, max_temperature, replicas).tolist()
+
+	seeds = np.random.SeedSequence(kwargs.get('seed', None)).spawn(replicas + 1)
+	generators = [np.random.default_rng(seed) for seed in seeds[:-1]]
+	rng = np.random.default_rng(seeds[-1])
+
+	adjacency = np.asarray(adjacency, dtype = np.float64)
+
+	leg_feasible, neighbors = _granular(adjacency, leg_bounds, **kwargs)
+
+	state = {
+		'adjacency': adjacency,
+		'leg_bounds': leg_bounds,
+		'route_bounds': route_bounds,
+		'stop_weights': stop_weights,
+		'leg_feasible': leg_feasible,
+		'neighbors': neighbors,
+		}
+
+	# Replicas run in this process when there is no pool
+	initialize_worker(state)
+
+	best = _run_replica((routes, 0, 0, moves, rng))
+
+	best_routes = routes
+	best_weight = best[1] if best[2] else np.inf
+
+	# Replica states in temperature order
+	states = [deepcopy(routes) for _ in range(replicas)]
+	weights = [best[1]] * replicas
+
+	workers = worker_count(workers)
+
+	pool = None
+
+	if (workers > 1) and (replicas > 1):
+
+		pool = process_pool(min([workers, replicas]), initargs = (state, ))
+
+	try:
+
+		for _ in range(rounds):
+
+			jobs = [
+				(states[idx], temperatures[idx], steps, moves, generators[idx]) \
+				for idx in range(replicas)
+				]
+
+			if pool is None:
+
+				results = [_run_replica(job) for job in jobs]
+
+			else:
+
+				results = pool.map(_run_replica, jobs, chunksize = 1)
+
+			for idx, (replica_routes, weight, feasible, generator) in enumerate(results):
+
+				states[idx] = replica_routes
+				weights[idx] = weight
+				generators[idx] = generator
+
+				if feasible and (weight < best_weight):
+
+					best_routes = replica_routes
+					best_weight = weight
+
+			# Exchanging states between adjacent temperatures
+			for idx in range(replicas - 1):
+
+				exponent = (weights[idx] - weights[idx + 1]) * (
+					1 / temperatures[idx] - 1 / temperatures[idx + 1]
+					)
+
+				if (exponent >= 0) or (rng.random() < exp(exponent)):
+
+					states[idx], states[idx + 1] = states[idx + 1], states[idx]
+					weights[idx], weights[idx + 1] = weights[idx + 1], weights[idx]
+
+	finally:
+
+		if pool is not None:
+
+			pool.close()
+			pool.join()
+
+	return best_routes
+
 def anneal_route(adjacency, route, leg_bounds, route_bounds, stop_weights, **kwargs):
 
 	kwargs.setdefault('steps', 100)
 	kwargs.setdefault('initial_temperature', 1)
 
+	if kwargs.get('delta', True):
+
+		return anneal_route_delta(
+			adjacency, route, leg_bounds, route_bounds, stop_weights, **kwargs)
+
 	# At lease 2 destinations need to be present for annealing
 	if len(route) < 4:
 
@@ -171,6 +1361,21 @@ def anneal_routes(adjacency, routes, leg_bounds, route_bounds, stop_weights, **k
 	kwargs.setdefault('steps', 100)
 	kwargs.setdefault('initial_temperature', 1)
 
+	if kwargs.get('replicas', None) is not None:
+
+		return anneal_routes_tempering(
+			adjacency, routes, leg_bounds, route_bounds, stop_weights, **kwargs)
+
+	if kwargs.get('batch_size', None) is not None:
+
+		return anneal_routes_batched(
+			adjacency, routes, leg_bounds, route_bounds, stop_weights, **kwargs)
+
+	if kwargs.get('delta', True):
+
+		return anneal_routes_delta(
+			adjacency, routes, leg_bounds, route_bounds, stop_weights, **kwargs)
+
 	# Initializing temperature
 	temperature = kwargs['initial_temperature']
 
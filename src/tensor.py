@@ -0,0 +1,283 @@
+'''
+Module for dense adjacency tensors
+
+An adjacency tensor stores the station-to-station adjacency of a graph as a
+node-index map and a float32 array of shape (n_fields, n, n) or, for stochastic
+links, (n_fields, n, n, n_samples). values[k, i, j] is the value of fields[k] on
+the link nodes[i] -> nodes[j]. Missing links are stored as inf.
+
+Compared to NetworkX edge dictionaries the tensor uses 4 bytes per value and no
+per-link Python objects. Tensors can be written by add_adjacency.py and are stored
+in the binary container format of .binary.
+
+For code written against graph._adj, AdjacencyTensor.adjacency provides a lazy
+mapping view {source: {target: {field: value}}} which builds link dictionaries
+only as they are accessed.
+'''
+
+import numpy as np
+
+from collections.abc import Mapping
+
+from .binary import write_arrays, read_arrays
+
+class AdjacencyTensor():
+    '''
+    Dense adjacency for a fixed set of nodes and fields
+
+    nodes - list of node ids in index order
+    node_to_idx - {node id: index}
+    fields - list of fields
+    values - float32 array of shape (n_fields, n, n[, n_samples])
+    '''
+
+    def __init__(self, nodes, fields, values):
+
+        self.nodes = list(nodes)
+        self.node_to_idx = {node: idx for idx, node in enumerate(self.nodes)}
+        self.fields = list(fields)
+        self.values = values
+
+    @property
+    def stochastic(self):
+
+        return self.values.ndim == 4
+
+    def number_of_nodes(self):
+
+        return len(self.nodes)
+
+    def index(self, nodes):
+        '''
+        Returns the indices of nodes
+        '''
+
+        return np.array([self.node_to_idx[node] for node in nodes], dtype = np.int64)
+
+    def field(self, field):
+        '''
+        Returns the (n, n[, n_samples]) array of a field
+        '''
+
+        return self.values[self.fields.index(field)]
+
+    def subset(self, nodes):
+        '''
+        Returns the tensor restricted to nodes (in the order given)
+        '''
+
+        idx = self.index(nodes)
+
+        return AdjacencyTensor(nodes, self.fields, self.values[:, idx][:, :, idx])
+
+    def link(self, source, target):
+        '''
+        Returns {field: value} for source -> target
+        '''
+
+        i = self.node_to_idx[source]
+        j = self.node_to_idx[target]
+
+        return {field: self.values[k, i, j] for k, field in enumerate(self.fields)}
+
+    def has_link(self, source, target):
+
+        i = self.node_to_idx[source]
+        j = self.node_to_idx[target]
+
+        return bool(np.all(np.isfinite(self.values[0, i, j])))
+
+    def adjacency(self, nodes = None):
+        '''
+        Lazy {source: {target: {field: value}}} view restricted to nodes
+        '''
+
+        return TensorAdjacency(self, self.nodes if nodes is None else list(nodes))
+
+class TensorAdjacency(Mapping):
+    '''
+    Read-only mapping view of an AdjacencyTensor in the layout of graph._adj
+    '''
+
+    def __init__(self, tensor, nodes):
+
+        self.tensor = tensor
+        self.nodes = nodes
+        self.indices = tensor.index(nodes)
+        self.node_set = set(nodes)
+
+    def __getitem__(self, source):
+
+        if source not in self.node_set:
+
+            raise KeyError(source)
+
+        return TensorLinks(self, self.tensor.node_to_idx[source])
+
+    def __iter__(self):
+
+        return iter(self.nodes)
+
+    def __len__(self):
+
+        return len(self.nodes)
+
+class TensorLinks(Mapping):
+    '''
+    Read-only mapping view of the links leaving one node of an AdjacencyTensor.
+    Lookups read single entries and the row is only scanned for iteration.
+    '''
+
+    def __init__(self, adjacency, row):
+
+        self.adjacency = adjacency
+        self.row = row
+        self._linked = None
+
+    @property
+    def linked(self):
+
+        if self._linked is None:
+
+            primary = self.adjacency.tensor.values[0, self.row, self.adjacency.indices]
+
+            if primary.ndim > 1:
+
+                primary = primary[:, 0]
+
+            self._linked = np.isfinite(primary)
+
+        return self._linked
+
+    def _column(self, target):
+        '''
+        Returns the tensor column of target or None if there is no link to target
+        '''
+
+        tensor = self.adjacency.tensor
+
+        if target not in self.adjacency.node_set:
+
+            return None
+
+        column = tensor.node_to_idx[target]
+
+        if not np.all(np.isfinite(tensor.values[0, self.row, column])):
+
+            return None
+
+        return column
+
+    def __contains__(self, target):
+
+        return self._column(target) is not None
+
+    def __getitem__(self, target):
+
+        column = self._column(target)
+
+        if column is None:
+
+            raise KeyError(target)
+
+        tensor = self.adjacency.tensor
+
+        return {
+            field: tensor.values[k, self.row, column] \
+            for k, field in enumerate(tensor.fields)
+            }
+
+    def __iter__(self):
+
+        nodes = self.adjacency.nodes
+
+        return (nodes[idx] for idx in np.flatnonzero(self.linked))
+
+    def __len__(self):
+
+        return int(self.linked.sum())
+
+def tensor_from_graph(graph, fields, nodes = None, dtype = np.float32):
+    '''
+    Builds an AdjacencyTensor from graph links. Links holding sample arrays produce
+    a stochastic tensor.
+    '''
+
+    nodes = list(graph.nodes) if nodes is None else list(nodes)
+    node_to_idx = {node: idx for idx, node in enumerate(nodes)}
+
+    n = len(nodes)
+
+    n_samples = None
+
+    for links in graph._adj.values():
+
+        for link in links.values():
+
+            value = np.asarray(link.get(fields[0], 1))
+
+            if value.ndim > 0:
+
+                n_samples = value.shape[0]
+
+            break
+
+        break
+
+    shape = (len(fields), n, n) if n_samples is None else (len(fields), n, n, n_samples)
+    values = np.full(shape, np.inf, dtype = dtype)
+
+    for source in nodes:
+
+        i = node_to_idx[source]
+
+        for target, link in graph._adj[source].items():
+
+            j = node_to_idx.get(target)
+
+            if j is None:
+
+                continue
+
+            for k, field in enumerate(fields):
+
+                values[k, i, j] = link.get(field, 1)
+
+    return AdjacencyTensor(nodes, fields, values)
+
+def tensor_to_file(tensor, filename):
+    '''
+    Writes AdjacencyTensor to binary file
+    '''
+
+    integer_ids = all(isinstance(node, (int, np.integer)) for node in tensor.nodes)
+
+    arrays = {'values': np.asarray(tensor.values)}
+
+    if integer_ids:
+
+        arrays['node_ids'] = np.array(tensor.nodes, dtype = np.int64)
+
+    metadata = {
+        'fields': tensor.fields,
+        'node_ids': None if integer_ids else tensor.nodes,
+        }
+
+    write_arrays(filename, arrays, metadata)
+
+def tensor_from_file(filename, mmap = True):
+    '''
+    Loads AdjacencyTensor from binary file. If mmap values are memory-mapped.
+    '''
+
+    arrays, metadata = read_arrays(filename, mmap = mmap)
+
+    if metadata['node_ids'] is None:
+
+        nodes = arrays['node_ids'].tolist()
+
+    else:
+
+        nodes = metadata['node_ids']
+
+    return AdjacencyTensor(nodes, metadata['fields'], arrays['values'])